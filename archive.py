@@ -0,0 +1,131 @@
+import csv
+import logging
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+BASE_FOLDER = Path(__file__).parent
+# Files of the live products -> the same for the archived ones
+ARCHIVE_FILES = {
+    "isin_info.csv": "isin_info_archive.csv",
+    "underlyings.csv": "underlyings_archive.csv",
+}
+ISIN_INFO_ARCHIVE_PATH = BASE_FOLDER / ARCHIVE_FILES["isin_info.csv"]
+# Products expired this many days ago, and not traded since, are archived
+ARCHIVE_AFTER_DAYS = 90
+
+logger = logging.getLogger(__name__)
+
+
+def archived_isins(path: Path = ISIN_INFO_ARCHIVE_PATH) -> set[str]:
+    if not path.exists():
+        return set()
+    return set(pd.read_csv(path, encoding="utf-8-sig", usecols=["ISIN"])["ISIN"])
+
+
+def read_rows(path: Path) -> tuple[list[str], list[list[str]]]:
+    """Header and rows of an isin_info-like file, empty if there is none."""
+    # Through the csv module, as `write_csv_to_isin_info` writes the file: rows
+    # that stay where they are are written back unchanged
+    if not path.exists():
+        return [], []
+    with path.open(newline="", encoding="utf-8-sig") as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        return header, list(reader)
+
+
+def write_rows(path: Path, header: list[str], rows: list[list[str]]) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("w", newline="", encoding="utf-8-sig") as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+    tmp_path.replace(path)
+
+
+def _traded_since(intermediate_folder: Path, since: date) -> set[str]:
+    paths = [
+        path
+        for path in intermediate_folder.glob("*.csv")
+        if date.fromisoformat(path.stem) >= since
+    ]
+    if not paths:
+        return set()
+    return set(
+        pd.concat(
+            pd.read_csv(path, encoding="utf-8-sig", usecols=["MifidInstrumentID"])
+            for path in paths
+        )["MifidInstrumentID"],
+    )
+
+
+def update(
+    isin_info_path: Path,
+    archive_path: Path,
+    intermediate_folder: Path,
+    after_days: int = ARCHIVE_AFTER_DAYS,
+) -> int:
+    """Move products expired more than `after_days` ago and not traded since from
+    `isin_info_path` to `archive_path`, and archived products traded again back.
+
+    Days count back from the last day in `intermediate_folder`, so the partition
+    doesn't move while no new data comes in. Returns how many products moved.
+    """
+    days = sorted(
+        date.fromisoformat(path.stem) for path in intermediate_folder.glob("*.csv")
+    )
+    if not days or not isin_info_path.exists():
+        return 0
+    cutoff = days[-1] - timedelta(days=after_days)
+    traded = _traded_since(intermediate_folder, cutoff)
+
+    header, hot = read_rows(isin_info_path)
+    archive_header, cold = read_rows(archive_path)
+    if cold and archive_header != header:
+        msg = f"{archive_path.name} and {isin_info_path.name} columns differ"
+        raise ValueError(msg)
+    isin_col = header.index("ISIN")
+    expiry_col = header.index("Expiry Date")
+    expiries = pd.to_datetime(
+        pd.Series([row[expiry_col] for row in hot], dtype=object),
+        errors="coerce",
+    )
+    hot_isins = {row[isin_col] for row in hot}
+    cold_isins = {row[isin_col] for row in cold}
+
+    # Skip the products traded lately, and those already archived: a product found
+    # in both files, after an interrupted run, stays archived
+    skipped = traded | cold_isins
+    to_archive = [
+        row
+        for row, expiry in zip(hot, expiries, strict=True)
+        if pd.notna(expiry) and expiry.date() < cutoff and row[isin_col] not in skipped
+    ]
+    to_restore = [row for row in cold if row[isin_col] in traded]
+    if not to_archive and not to_restore and not cold_isins & hot_isins:
+        return 0
+
+    restored = {row[isin_col] for row in to_restore}
+    archived = (cold_isins - restored) | {row[isin_col] for row in to_archive}
+    # The archive is written first: a crash in between leaves a product in both
+    # files, which the next run resolves, rather than in neither
+    write_rows(
+        archive_path,
+        header,
+        [row for row in cold if row[isin_col] not in restored] + to_archive,
+    )
+    write_rows(
+        isin_info_path,
+        header,
+        [row for row in hot if row[isin_col] not in archived]
+        + [row for row in to_restore if row[isin_col] not in hot_isins],
+    )
+    logger.info(
+        "Archived %d products expired before %s, restored %d traded again",
+        len(to_archive),
+        cutoff,
+        len(to_restore),
+    )
+    return len(to_archive) + len(to_restore)
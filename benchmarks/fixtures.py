@@ -0,0 +1,217 @@
+"""Fixed corpus of Euronext factsheet blocks and CD pages for the benchmarks.
+
+The committed pages in `fixtures/isins` and `fixtures/cd` follow the markup the
+scrapers look for. They're either generated here (the default) or anonymized copies
+of pages from the local `isins/` and `cd/` caches:
+
+    python -m benchmarks.fixtures            # regenerate the synthetic corpus
+    python -m benchmarks.fixtures --from-cache 40
+"""
+
+import argparse
+import random
+import re
+from datetime import date, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+FIXTURES_FOLDER = Path(__file__).parent / "fixtures"
+N_PRODUCTS = 24
+ISSUERS = [f"ISSUER {letter}" for letter in "ABCDEF"]
+UNDERLYINGS = [
+    "Enel",
+    "Eni",
+    "Intesa Sanpaolo",
+    "UniCredit",
+    "Stellantis",
+    "STMicroelectronics",
+    "Tesla",
+    "Nvidia",
+    "Euro Stoxx 50",
+    "FTSE MIB",
+    "S&P 500",
+    "Banco BPM",
+]
+PRODUCTS = [
+    ("Cash Collect", "1260", "Express Certificates"),
+    ("Phoenix", "1260", "Express Certificates"),
+    ("Bonus Cap", "1250", "Capped Bonus Certificates"),
+    ("Turbo Long", "2210", "Mini Future Certificates"),
+]
+# Months between two observation dates
+FREQUENCIES = [1, 3, 12]
+
+
+def fixture_isins(n: int = N_PRODUCTS) -> list[str]:
+    return [f"XS9{k:09d}" for k in range(1, n + 1)]
+
+
+def _rows(pairs: list[tuple[str, str]]) -> str:
+    return "\n".join(
+        f"<tr><td>{label}</td><td>{value}</td></tr>" for label, value in pairs
+    )
+
+
+def _filler(rng: random.Random, n_links: int) -> str:
+    # Navigation and footer boilerplate: the bulk of a real page that parsers skip
+    links = "\n".join(
+        f'<li><a href="/page.asp?id={rng.randrange(10**6)}" class="menu-link">'
+        f"Voce di menu {k}</a></li>"
+        for k in range(n_links)
+    )
+    return f'<nav class="navbar"><ul class="nav navbar-nav">\n{links}\n</ul></nav>'
+
+
+def euronext_page(isin: str, rng: random.Random) -> str:
+    product, eusipa_code, eusipa_name = rng.choice(PRODUCTS)
+    issue_date = date(2024, 1, 2) + timedelta(days=rng.randrange(500))
+    expiry_date = issue_date + timedelta(days=365 * rng.randint(1, 5))
+    general = [
+        ("Product", product),
+        ("Strategy", rng.choice(["Bullish", "Bearish", "Neutral"])),
+        ("EUSIPA Code", eusipa_code),
+        ("EUSIPA Name", eusipa_name),
+        ("Issuer Name", rng.choice(ISSUERS)),
+        ("Issue Date", f"{issue_date:%d/%m/%Y}"),
+        ("Expiry Date", f"{expiry_date:%d/%m/%Y}"),
+        ("ISIN", isin),
+    ]
+    if rng.random() < 0.8:
+        general.insert(4, ("Issue Price", rng.choice(["100", "1000", "1,000"])))
+    underlying = [
+        ("Name", "/".join(rng.sample(UNDERLYINGS, rng.randint(1, 3)))),
+        ("Underlying ISIN", f"IT{rng.randrange(10**10):010d}"),
+    ]
+    return f"""<div class="fs-generalinfo-block">
+<h2 class="card-title">General information</h2>
+<div class="table-responsive"><table class="table table-sm"><tbody>
+{_rows(general)}
+</tbody></table></div>
+</div>
+<div class="fs-underlying-block">
+<h2 class="card-title">Underlying</h2>
+<div class="table-responsive"><table class="table table-sm"><tbody>
+{_rows(underlying)}
+</tbody></table></div>
+</div>"""
+
+
+def cd_page(isin: str, rng: random.Random) -> str:
+    underlyings = rng.sample(UNDERLYINGS, rng.randint(1, 4))
+    scheda_rows = "\n".join(
+        f"<tr><td>{name}</td><td>{rng.uniform(5, 500):.2f}</td>"
+        f"<td>{rng.uniform(5, 500):.2f}</td></tr>"
+        for name in underlyings
+    )
+    barrier = rng.choice(["50 %", "60 %", "70 %", "-"])
+    panels = [
+        f"""<div class="panel panel-info">
+<div class="panel-heading"><h3 class="panel-title">Scheda Sottostante</h3></div>
+<div class="panel-body"><table class="table"><thead><tr>
+<th>SOTTOSTANTE</th><th>STRIKE</th><th>BARRIERA</th></tr></thead>
+<tbody>
+{scheda_rows}
+</tbody></table></div></div>""",
+        f"""<div class="panel panel-default">
+<div class="panel-heading"><h3 class="panel-title">Barriera</h3></div>
+<div class="panel-body"><table class="table"><tbody>
+<tr><td>{barrier}</td><td>Discreta</td></tr>
+</tbody></table></div></div>""",
+    ]
+    if rng.random() < 0.85:
+        months = rng.choice(FREQUENCIES)
+        first = date(2025, rng.randint(1, 3), rng.randint(1, 28))
+        coupon = f"{rng.uniform(0.3, 3):.2f}".replace(".", ",")
+        trigger = rng.choice([100, 95, 90])
+        step = rng.choice([0, 0, 1, 5])
+        rows = []
+        for k in range(rng.randint(4, 36)):
+            month = first.month - 1 + k * months
+            day = first.replace(year=first.year + month // 12, month=month % 12 + 1)
+            rows.append(
+                f"<tr><td>{day:%d/%m/%Y}</td><td>{coupon} %</td>"
+                f"<td>{max(trigger - k * step, 50)} %</td><td>-</td></tr>",
+            )
+        panels.append(
+            f"""<div class="panel panel-info">
+<div class="panel-heading"><h3 class="panel-title">Date rilevamento</h3></div>
+<div class="panel-body"><table class="table table-striped"><thead><tr>
+<th>DATA RILEVAMENTO</th><th>CEDOLA</th><th>TRIGGER AUTOCALLABLE</th>
+<th>PAGAMENTO</th></tr></thead>
+<tbody>
+{chr(10).join(rows)}
+</tbody></table></div></div>""",
+        )
+    rng.shuffle(panels)
+    return f"""<!DOCTYPE html>
+<html lang="it"><head><meta charset="utf-8">
+<title>Scheda certificato {isin}</title>
+<link rel="stylesheet" href="/css/bootstrap.min.css"></head>
+<body>
+{_filler(rng, 300)}
+<div class="container"><h1>{isin}</h1>
+{chr(10).join(panels)}
+</div>
+<footer class="footer">{_filler(rng, 60)}</footer>
+</body></html>"""
+
+
+def generate(
+    folder: Path = FIXTURES_FOLDER, n: int = N_PRODUCTS, seed: int = 0
+) -> None:
+    rng = random.Random(seed)
+    for sub in ("isins", "cd"):
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+    for isin in fixture_isins(n):
+        (folder / "isins" / f"{isin}.txt").write_text(
+            euronext_page(isin, rng),
+            encoding="utf-8",
+        )
+        (folder / "cd" / f"{isin}.txt").write_text(cd_page(isin, rng), encoding="utf-8")
+
+
+def anonymize_from_cache(
+    base_folder: Path,
+    folder: Path = FIXTURES_FOLDER,
+    n: int = N_PRODUCTS,
+) -> None:
+    """Copy `n` cached products, with ISINs and issuer names replaced and scripts dropped."""
+    issuers = (
+        pd.read_csv(base_folder / "isin_info.csv", encoding="utf-8-sig")["Emittente"]
+        .dropna()
+        .drop_duplicates()
+    )
+    issuer_names = {name: f"ISSUER {k}" for k, name in enumerate(issuers, start=1)}
+    cached = sorted(
+        path.stem
+        for path in (base_folder / "isins").glob("*.txt")
+        if (base_folder / "cd" / path.name).exists()
+    )[:n]
+    for sub in ("isins", "cd"):
+        (folder / sub).mkdir(parents=True, exist_ok=True)
+        for old in (folder / sub).glob("*.txt"):
+            old.unlink()
+    for isin, new_isin in zip(cached, fixture_isins(len(cached)), strict=True):
+        for sub in ("isins", "cd"):
+            text = (base_folder / sub / f"{isin}.txt").read_text(encoding="utf-8")
+            text = re.sub(r"<script\b.*?</script>", "", text, flags=re.DOTALL)
+            text = text.replace(isin, new_isin)
+            for name, alias in issuer_names.items():
+                text = text.replace(name, alias)
+            (folder / sub / f"{new_isin}.txt").write_text(text, encoding="utf-8")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--from-cache",
+        type=int,
+        metavar="N",
+        help="anonymize N products from the isins/ and cd/ caches instead",
+    )
+    args = parser.parse_args()
+    if args.from_cache:
+        anonymize_from_cache(Path(__file__).parents[1], n=args.from_cache)
+    else:
+        generate()
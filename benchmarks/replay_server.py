@@ -0,0 +1,268 @@
+"""Local stand-in for Euronext and certificatiederivati.it, serving recorded pages.
+
+    python -m benchmarks.replay_server --latency 0.2 --error-rate 0.02 --max-rps 5
+
+then point the update at it:
+
+    EURONEXT_BASE_URL=http://127.0.0.1:8765 CD_BASE_URL=http://127.0.0.1:8765 \\
+    DOWNLOAD_BASE_URL=http://127.0.0.1:8765 python main.py
+
+Factsheet requests are answered from `<pages>/isins/<ISIN>.txt` (the whole recorded
+text comes back on the general-info block, the underlying block is empty, so the
+concatenation is what the scraper cached), CD requests from `<pages>/cd/<ISIN>.txt`
+and the trades download with a synthetic zip over the same ISINs. `GET /_stats`
+returns the request counters as JSON.
+"""
+
+import argparse
+import io
+import json
+import logging
+import random
+import re
+import threading
+import time
+import zipfile
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks import fixtures, synthetic
+
+logger = logging.getLogger(__name__)
+
+FACTSHEET_PATH = re.compile(
+    r"^/en/ajax/getFactsheetInfoBlock/WARRT/(?P<isin>[^-/]+)-(?P<mkt>[^/]+)/(?P<block>\w+)$",
+)
+CD_PATH = "/db_bs_scheda_certificato.asp"
+DOWNLOAD_PATH = "/data-reporting-service/trades-file/download"
+CD_NOT_FOUND = "<html><body><p>Nessun certificato trovato</p></body></html>"
+
+
+@dataclass
+class Behaviour:
+    """How the server misbehaves. Rates are per-request probabilities."""
+
+    latency: float = 0.0
+    jitter: float = 0.0
+    error_rate: float = 0.0
+    rate_429: float = 0.0
+    timeout_rate: float = 0.0
+    # How long a "timed out" request hangs before the connection is dropped
+    timeout_delay: float = 65.0
+    # Requests per second above which the server answers 429, 0 for no cap
+    max_rps: float = 0.0
+    seed: int | None = None
+
+
+class _TokenBucket:
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        pages_folder: Path = fixtures.FIXTURES_FOLDER,
+        behaviour: Behaviour | None = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        trades_days: int = 5,
+        trades_rows_per_day: int = 2_000,
+    ) -> None:
+        super().__init__((host, port), _Handler)
+        self.pages_folder = pages_folder
+        self.behaviour = behaviour or Behaviour()
+        self.rng = random.Random(self.behaviour.seed)
+        self.rng_lock = threading.Lock()
+        self.bucket = (
+            _TokenBucket(self.behaviour.max_rps) if self.behaviour.max_rps else None
+        )
+        self.stats: Counter[str] = Counter()
+        self.stats_lock = threading.Lock()
+
+        isins = sorted(path.stem for path in (pages_folder / "isins").glob("*.txt"))
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr(
+                synthetic.TRADES_FILENAME,
+                synthetic.trades_csv(
+                    isins or fixtures.fixture_isins(),
+                    synthetic.business_days(date.today(), trades_days),
+                    trades_rows_per_day,
+                    random.Random(self.behaviour.seed),
+                ),
+            )
+        self.trades_zip = buffer.getvalue()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key: str) -> None:
+        with self.stats_lock:
+            self.stats[key] += 1
+
+    def draw(self) -> float:
+        with self.rng_lock:
+            return self.rng.random()
+
+    def start_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: ReplayServer
+
+    def log_message(self, format: str, *args: object) -> None:
+        logger.debug(format, *args)
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/_stats":
+            with self.server.stats_lock:
+                self._send(200, json.dumps(self.server.stats), "application/json")
+            return
+        if not self._misbehave():
+            return
+        if match := FACTSHEET_PATH.match(url.path):
+            page = self._page("isins", match["isin"])
+            if page is None:
+                self._send(404, "")
+            elif match["block"] == "fs_generalinfo_warrants_block":
+                self._send(200, page)
+            else:
+                self._send(200, "")
+        elif url.path == CD_PATH:
+            isin = parse_qs(url.query).get("isin", [""])[0]
+            self._send(200, self._page("cd", isin) or CD_NOT_FOUND)
+        else:
+            self._send(404, "")
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if not self._misbehave():
+            return
+        if urlsplit(self.path).path == DOWNLOAD_PATH:
+            self._send(200, self.server.trades_zip, "application/zip")
+        else:
+            self._send(404, "")
+
+    def _page(self, kind: str, isin: str) -> str | None:
+        path = self.server.pages_folder / kind / f"{Path(isin).name}.txt"
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    def _misbehave(self) -> bool:
+        """Apply the configured faults; False if the request was already answered."""
+        behaviour = self.server.behaviour
+        self.server.count("requests")
+        if self.server.bucket and not self.server.bucket.take():
+            self.server.count("rate_limited")
+            self._send(429, "Too Many Requests", headers={"Retry-After": "1"})
+            return False
+        draw = self.server.draw()
+        if draw < behaviour.timeout_rate:
+            self.server.count("timeouts")
+            time.sleep(behaviour.timeout_delay)
+            self.close_connection = True
+            return False
+        draw -= behaviour.timeout_rate
+        if draw < behaviour.rate_429:
+            self.server.count("429")
+            self._send(429, "Too Many Requests", headers={"Retry-After": "1"})
+            return False
+        draw -= behaviour.rate_429
+        if draw < behaviour.error_rate:
+            self.server.count("errors")
+            self._send(503, "Service Unavailable")
+            return False
+        delay = behaviour.latency + behaviour.jitter * self.server.draw()
+        if delay:
+            time.sleep(delay)
+        self.server.count("served")
+        return True
+
+    def _send(
+        self,
+        status: int,
+        body: str | bytes,
+        content_type: str = "text/html; charset=utf-8",
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--pages",
+        type=Path,
+        default=fixtures.FIXTURES_FOLDER,
+        help="folder with isins/ and cd/ subfolders (the project folder works too)",
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds")
+    parser.add_argument(
+        "--jitter", type=float, default=0.0, help="extra random seconds"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503s")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of 429s")
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-delay", type=float, default=65.0)
+    parser.add_argument("--max-rps", type=float, default=0.0, help="0 for no cap")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = ReplayServer(
+        pages_folder=args.pages,
+        behaviour=Behaviour(
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+            rate_429=args.rate_429,
+            timeout_rate=args.timeout_rate,
+            timeout_delay=args.timeout_delay,
+            max_rps=args.max_rps,
+            seed=args.seed,
+        ),
+        host=args.host,
+        port=args.port,
+    )
+    logger.info("Serving %s on %s", args.pages, server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
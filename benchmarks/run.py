@@ -0,0 +1,385 @@
+"""Offline benchmarks for the update pipeline and the dashboard queries.
+
+    python -m benchmarks.run                       # run all, append to results.jsonl
+    python -m benchmarks.run --only parse_cd summarize --repeat 5
+    python -m benchmarks.run --only scrape         # against the local replay server
+    python -m benchmarks.run --compare             # last result per commit, side by side
+
+Nothing touches the network or the project data: every benchmark works in a temporary
+copy built from synthetic trade files and the HTML corpus in `fixtures/`. `scrape`
+fetches that corpus over HTTP from `replay_server` with the politeness delays on,
+so it is slow and only runs when asked for.
+"""
+
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+import psutil
+from bs4 import BeautifulSoup
+
+import data_service
+import main
+import metrics
+import profiling
+import query_engine
+import raw_store
+from benchmarks import fixtures, replay_server, synthetic
+
+BENCHMARKS_FOLDER = Path(__file__).parent
+PROJECT_FOLDER = BENCHMARKS_FOLDER.parent
+RESULTS_PATH = BENCHMARKS_FOLDER / "results.jsonl"
+MAPPING_FILES = ["type_and_subtype.csv", "issuers.csv", "und_mapping.csv"]
+EXTRACTED_TITLES = [
+    "Product",
+    "Strategy",
+    "EUSIPA Code",
+    "EUSIPA Name",
+    "Issue Price",
+    ["Nom de l'émetteur", "Issuer Name", "Nom émetteur"],
+    "Issue Date",
+    "Expiry Date",
+    "Name",
+]
+REPLAY_BEHAVIOUR = replay_server.Behaviour(
+    latency=0.05,
+    jitter=0.05,
+    error_rate=0.02,
+    seed=0,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def make_workspace(folder: Path, n_days: int, rows_per_day: int, day_span: int) -> None:
+    """Lay out `folder` as the project folder before its first update."""
+    downloads = synthetic.make_input_folder(
+        folder / "downloads",
+        fixtures.fixture_isins(),
+        n_days=n_days,
+        rows_per_day=rows_per_day,
+        day_span=day_span,
+    )
+    for path in downloads:
+        raw_store.store(path, folder / "raw")
+    for filename in MAPPING_FILES:
+        shutil.copy(PROJECT_FOLDER / filename, folder / filename)
+    for sub in ("isins", "cd"):
+        shutil.copytree(fixtures.FIXTURES_FOLDER / sub, folder / sub)
+
+
+class RssSampler(threading.Thread):
+    """Track the highest resident set size of the process while running."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.process = psutil.Process()
+        self.baseline = self.peak = self.process.memory_info().rss
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def stop(self) -> float:
+        """Stop sampling; return the peak above the starting RSS, in MB."""
+        self.stopped.set()
+        self.join()
+        return (self.peak - self.baseline) / 1024**2
+
+
+def time_repeated(
+    function: Callable[[], Any],
+    repeat: int,
+    setup: Callable[[], Any] | None = None,
+) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_summarize(workspace: Path, repeat: int) -> list[float]:
+    output = workspace / "bench_summarize"
+
+    def reset() -> None:
+        shutil.rmtree(output, ignore_errors=True)
+        (output / "intraday").mkdir(parents=True)
+
+    return time_repeated(
+        lambda: main.summarize_csvs(
+            workspace / "raw",
+            output,
+            intraday_folder=output / "intraday",
+        ),
+        repeat,
+        setup=reset,
+    )
+
+
+def bench_parse_cd(workspace: Path, repeat: int) -> list[float]:
+    pages = [
+        p.read_text(encoding="utf-8") for p in sorted((workspace / "cd").iterdir())
+    ]
+    return time_repeated(
+        lambda: [main.parse_cd_page(text) for text in pages],
+        repeat,
+    )
+
+
+def bench_extract_from_title(workspace: Path, repeat: int) -> list[float]:
+    soups = [
+        BeautifulSoup(p.read_text(encoding="utf-8"), "lxml")
+        for p in sorted((workspace / "isins").iterdir())
+    ]
+    return time_repeated(
+        lambda: [
+            main.extract_from_title(soup, title)
+            for soup in soups
+            for title in EXTRACTED_TITLES
+        ],
+        repeat,
+    )
+
+
+def bench_update_all(workspace: Path, repeat: int) -> list[float]:
+    outputs = ["intermediate_csv", "isin_info.csv", "underlyings.csv", *MAPPING_FILES]
+
+    def reset() -> None:
+        for name in outputs:
+            path = workspace / name
+            if path.is_dir():
+                shutil.rmtree(path)
+            else:
+                path.unlink(missing_ok=True)
+        for filename in MAPPING_FILES:
+            shutil.copy(PROJECT_FOLDER / filename, workspace / filename)
+
+    # Every stage, as on the first update of a project folder
+    return time_repeated(lambda: main.update_all(force=True), repeat, setup=reset)
+
+
+def bench_update_noop(workspace: Path, repeat: int) -> list[float]:
+    """Run `update_all` again with nothing new: every stage is up to date."""
+    main.update_all()
+    return time_repeated(main.update_all, repeat)
+
+
+def bench_update_profiled(workspace: Path, repeat: int) -> list[float]:
+    """Every stage of `update_all` with profiling on, as `main.py --profile`."""
+    saved = profiling.ENABLED, profiling.BASE_FOLDER, profiling.PROFILES_FOLDER
+    profiling.ENABLED, profiling.BASE_FOLDER = True, workspace
+    profiling.PROFILES_FOLDER = workspace / "profiles"
+    try:
+        return time_repeated(lambda: main.update_all(force=True), repeat)
+    finally:
+        profiling.ENABLED, profiling.BASE_FOLDER, profiling.PROFILES_FOLDER = saved
+
+
+def bench_query(workspace: Path, repeat: int) -> list[float]:
+    """Load the tables written by `update_all`, build the engine and run a page query."""
+    if not (workspace / "isin_info.csv").exists():
+        main.update_all()
+    filters = query_engine.Filters()
+
+    def load_and_query() -> None:
+        data_service._load_tables.clear()
+        tables = data_service._load_tables(data_service.data_version())
+        engine = query_engine.QueryEngine(tables, data_service.daily_files())
+        engine.aggregate(
+            ["DayEvent", "Issuer", "SubType"],
+            ["Adjusted Turnover"],
+            filters,
+            dropna=False,
+        )
+        engine.aggregate(
+            ["Sottostanti", "Sottostante", "SubType", "ISIN", "Issuer"],
+            ["Adjusted Turnover", "Adjusted Turnover (underlying)"],
+            filters,
+            source="joined_underlyings",
+            not_null=engine.columns("joined_underlyings"),
+        )
+
+    return time_repeated(load_and_query, repeat)
+
+
+def bench_cold_start(workspace: Path, repeat: int) -> list[float]:
+    """First page of a dashboard started after the update: from its snapshot."""
+    main.update_all()
+    filters = query_engine.Filters()
+
+    def start_and_query() -> None:
+        data_service._load_tables.clear()
+        query_engine._build_engine.clear()
+        engine = query_engine.get_engine()
+        engine.aggregate(
+            ["DayEvent", "Issuer", "SubType"],
+            ["Adjusted Turnover"],
+            filters,
+            dropna=False,
+        )
+
+    return time_repeated(start_and_query, repeat)
+
+
+def bench_scrape(workspace: Path, repeat: int) -> list[float]:
+    """Scrape every fixture product from the replay server, starting from empty caches."""
+    scrape_folder = workspace / "bench_scrape"
+    isin_and_mkt = [(isin, "ETLX") for isin in fixtures.fixture_isins()]
+    server = replay_server.ReplayServer(behaviour=REPLAY_BEHAVIOUR)
+    server.start_in_thread()
+    urls = (main.EURONEXT_BASE_URL, main.CD_BASE_URL, main.DOWNLOAD_BASE_URL)
+    main.set_base_urls(server.base_url, server.base_url, server.base_url)
+    main.BASE_FOLDER, main.FORCE_OFFLINE = scrape_folder, False
+
+    def reset() -> None:
+        shutil.rmtree(scrape_folder, ignore_errors=True)
+        scrape_folder.mkdir()
+
+    try:
+        return time_repeated(
+            lambda: main.write_csv_to_isin_info(
+                isin_and_mkt,
+                scrape_folder / "isin_info.csv",
+                already_loaded={},
+            ),
+            repeat,
+            setup=reset,
+        )
+    finally:
+        main.BASE_FOLDER, main.FORCE_OFFLINE = workspace, True
+        main.set_base_urls(*urls)
+        logger.info("Replay server stats: %s", dict(server.stats))
+        server.shutdown()
+        server.server_close()
+
+
+BENCHMARKS: dict[str, Callable[[Path, int], list[float]]] = {
+    "summarize": bench_summarize,
+    "parse_cd": bench_parse_cd,
+    "extract_from_title": bench_extract_from_title,
+    "update_all": bench_update_all,
+    "update_noop": bench_update_noop,
+    "update_profiled": bench_update_profiled,
+    "query": bench_query,
+    "cold_start": bench_cold_start,
+    "scrape": bench_scrape,
+}
+DEFAULT_BENCHMARKS = [name for name in BENCHMARKS if name != "scrape"]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BENCHMARKS_FOLDER,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    names: list[str],
+    repeat: int,
+    n_days: int,
+    rows_per_day: int,
+    day_span: int,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workspace = Path(tmpdir)
+        make_workspace(workspace, n_days, rows_per_day, day_span)
+
+        # Point every module that resolves paths at import time to the workspace
+        main.BASE_FOLDER = data_service.BASE_FOLDER = workspace
+        data_service.INTERMEDIATE_FOLDER = workspace / "intermediate_csv"
+        data_service.SNAPSHOT_FOLDER = workspace / "snapshot"
+        metrics.METRICS_PATH = workspace / "metrics.jsonl"
+        main.FORCE_OFFLINE = True
+
+        results = {}
+        for name in names:
+            logger.info("Running %s...", name)
+            sampler = RssSampler()
+            sampler.start()
+            timings = BENCHMARKS[name](workspace, repeat)
+            results[name] = {
+                "min_s": round(min(timings), 4),
+                "median_s": round(statistics.median(timings), 4),
+                "runs": len(timings),
+                "peak_rss_delta_mb": round(sampler.stop(), 1),
+            }
+            logger.info("%s: %s", name, results[name])
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "params": {
+            "n_days": n_days,
+            "rows_per_day": rows_per_day,
+            "day_span": day_span,
+        },
+        "peak_rss_mb": round(metrics.peak_rss_mb(), 1),
+        "results": results,
+    }
+
+
+def compare(path: Path = RESULTS_PATH) -> None:
+    """Print the median of each benchmark for the latest record of every commit."""
+    records: dict[str, dict[str, Any]] = {}
+    for record in metrics.load_runs(path):
+        records[record["commit"] or "?"] = record
+    if not records:
+        print(f"No results in {path}")
+        return
+    names = sorted({name for r in records.values() for name in r["results"]})
+    print(f"{'commit':<10}" + "".join(f"{name:>20}" for name in names))
+    for commit, record in records.items():
+        medians = [record["results"].get(name, {}).get("median_s") for name in names]
+        print(
+            f"{commit:<10}"
+            + "".join(f"{'-' if m is None else f'{m:.4f}':>20}" for m in medians),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--days", type=int, default=10)
+    parser.add_argument("--rows-per-day", type=int, default=20_000)
+    parser.add_argument("--day-span", type=int, default=3)
+    parser.add_argument("--compare", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    if args.compare:
+        compare()
+    else:
+        record = run(
+            args.only or DEFAULT_BENCHMARKS,
+            repeat=args.repeat,
+            n_days=args.days,
+            rows_per_day=args.rows_per_day,
+            day_span=args.day_span,
+        )
+        with RESULTS_PATH.open("a", encoding="utf-8") as file:
+            file.write(json.dumps(record) + "\n")
+        logger.info("Results appended to %s", RESULTS_PATH.name)
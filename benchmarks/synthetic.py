@@ -0,0 +1,134 @@
+"""Synthetic `Trades_WarrantCertificates.csv` archives, shaped as the Euronext download."""
+
+import csv
+import io
+import random
+import zipfile
+from collections.abc import Sequence
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+TRADES_FILENAME = "Trades_WarrantCertificates.csv"
+TRADES_COLUMNS = [
+    "TransactionIdentificationCode",
+    "TradingDateTime",
+    "PublicationDateTime",
+    "DeferralEndDateTime",
+    "MifidInstrumentIdentificationType",
+    "MifidInstrumentID",
+    "MifidPrice",
+    "MifidPriceCurrency",
+    "MifidQuantity",
+    "MifidQuantityNotation",
+    "MifidNotionalAmount",
+    "MifidNotionalCurrency",
+    "VenueOfExecution",
+    "VenueOfPublication",
+    "MarketMechanism",
+    "TradingMode",
+    "TransactionCategory",
+    "NegotiationIndicator",
+    "ModificationIndicator",
+    "BenchmarkIndicator",
+]
+VENUES = ["ETLX", "SEDX", "XAMS", "XPAR"]
+SESSION_OPEN = time(9, 0)
+SESSION_SECONDS = int(8.5 * 3600)
+
+
+def business_days(last_day: date, n: int) -> list[date]:
+    days: list[date] = []
+    day = last_day
+    while len(days) < n:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+
+def trades_csv(
+    isins: Sequence[str],
+    days: Sequence[date],
+    rows_per_day: int,
+    rng: random.Random,
+) -> str:
+    """Build the CSV text: a title line, then the header and one row per trade."""
+    buffer = io.StringIO()
+    buffer.write(f"{TRADES_FILENAME},{datetime.now():%Y-%m-%dT%H:%M:%S}\n")
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(TRADES_COLUMNS)
+    trade_id = 0
+    for day in days:
+        session_start = datetime.combine(day, SESSION_OPEN)
+        for _ in range(rows_per_day):
+            trade_id += 1
+            traded_at = session_start + timedelta(
+                seconds=rng.randrange(SESSION_SECONDS),
+                microseconds=rng.randrange(1_000_000),
+            )
+            published_at = traded_at + timedelta(seconds=rng.randrange(1, 60))
+            price = round(rng.uniform(50, 1100), 2)
+            quantity = rng.randint(1, 200)
+            writer.writerow(
+                [
+                    f"T{day:%Y%m%d}{trade_id:09d}",
+                    traded_at.isoformat(),
+                    published_at.isoformat(),
+                    published_at.isoformat(),
+                    "ISIN",
+                    rng.choice(isins),
+                    price,
+                    "EUR",
+                    quantity,
+                    "UNIT",
+                    round(price * quantity, 2),
+                    "EUR",
+                    rng.choice(VENUES),
+                    rng.choices(VENUES, weights=[45, 45, 5, 5])[0],
+                    "CB",
+                    "CT",
+                    "",
+                    "",
+                    rng.choice(["", "", "", "AMND", "CANC"]),
+                    "",
+                ],
+            )
+    return buffer.getvalue()
+
+
+def write_trades_zip(
+    path: Path,
+    isins: Sequence[str],
+    days: Sequence[date],
+    rows_per_day: int,
+    seed: int = 0,
+) -> None:
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr(
+            TRADES_FILENAME,
+            trades_csv(isins, days, rows_per_day, random.Random(seed)),
+        )
+
+
+def make_input_folder(
+    folder: Path,
+    isins: Sequence[str],
+    n_days: int,
+    rows_per_day: int,
+    day_span: int = 1,
+    last_day: date = date(2025, 6, 20),
+    seed: int = 0,
+) -> list[Path]:
+    """Fill `folder` with the daily downloads, as `<day>.zip`, oldest first.
+
+    Each archive holds the trades of its day and of the `day_span - 1` days before,
+    as the real download, which overlaps from one day to the next.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    days = business_days(last_day, n_days + day_span - 1)
+    paths = []
+    for n, day in enumerate(days[day_span - 1 :]):
+        path = folder / f"{day}.zip"
+        write_trades_zip(path, isins, days[n : n + day_span], rows_per_day, seed + n)
+        paths.append(path)
+    return paths
@@ -0,0 +1,88 @@
+"""Check `main.parse_cd_page` against the full-page parse on a folder of CD pages.
+
+    python -m benchmarks.verify_cd_parser              # the project's cd/ cache
+    python -m benchmarks.verify_cd_parser --folder benchmarks/fixtures/cd
+
+Prints every page whose output differs, and the time and peak Python memory per
+page of both parsers. Exits with status 1 on any difference.
+"""
+
+import argparse
+import logging
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from bs4 import BeautifulSoup
+
+import main
+
+
+def full_page(text: str) -> dict[str, Any]:
+    return main.parse_cd(BeautifulSoup(text, "lxml"))
+
+
+def _outcome(parser: Callable[[str], dict[str, Any]], text: str) -> Any:
+    # `parse_cd` raises on some malformed tables: both parsers must raise the same
+    try:
+        return parser(text)
+    except Exception as e:
+        return f"raised {type(e).__name__}"
+
+
+def _measure(parser: Callable[[str], dict[str, Any]], text: str) -> tuple[float, int]:
+    tracemalloc.start()
+    start = time.perf_counter()
+    _outcome(parser, text)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def verify(folder: Path, measure_every: int = 10) -> int:
+    """Return the number of pages whose outputs differ."""
+    files = sorted(folder.glob("*.txt"))
+    mismatches = 0
+    stats = {name: [0.0, 0] for name in ("full", "targeted")}
+    n_measured = 0
+    for n, file in enumerate(files):
+        text = file.read_text(encoding="utf-8")
+        expected = _outcome(full_page, text)
+        actual = _outcome(main.parse_cd_page, text)
+        if actual != expected:
+            mismatches += 1
+            print(f"{file.stem}:\n  full:     {expected}\n  targeted: {actual}")
+        if n % measure_every == 0:
+            n_measured += 1
+            for name, parser in (("full", full_page), ("targeted", main.parse_cd_page)):
+                elapsed, peak = _measure(parser, text)
+                stats[name][0] += elapsed
+                stats[name][1] = max(stats[name][1], peak)
+
+    print(f"{len(files)} pages, {mismatches} differences")
+    for name, (elapsed, peak) in stats.items():
+        if n_measured:
+            print(
+                f"{name:>9}: {elapsed / n_measured * 1000:.1f} ms/page, "
+                f"peak {peak / 1024**2:.1f} MB",
+            )
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--folder", type=Path, default=main.BASE_FOLDER / "cd")
+    parser.add_argument(
+        "--measure-every",
+        type=int,
+        default=10,
+        help="time and trace memory on one page out of N",
+    )
+    args = parser.parse_args()
+    # `get_barriera` logs every page without a numeric barrier
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(1 if verify(args.folder, args.measure_every) else 0)
@@ -0,0 +1,73 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+
+def bitsets(ids: np.ndarray, rows: np.ndarray, n_rows: int, n_ids: int) -> np.ndarray:
+    """One bitset over `n_ids` ids per row: bit `ids[k]` is set in row `rows[k]`."""
+    # Straight into the bytes, as `np.packbits` lays them out: a row of bools per
+    # key would take `n_ids` bytes each, for every page render
+    sets = np.zeros((n_rows, (n_ids + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(sets, (rows, ids >> 3), (0x80 >> (ids & 7)).astype(np.uint8))
+    return sets
+
+
+def bitset(ids: np.ndarray, n_ids: int) -> np.ndarray:
+    return bitsets(ids, np.zeros(len(ids), dtype=np.int64), 1, n_ids)[0]
+
+
+def popcount(sets: np.ndarray) -> np.ndarray:
+    return np.bitwise_count(sets).sum(axis=-1, dtype=np.int64)
+
+
+class TradedIndex:
+    """The products traded each day, as one bitset per day over the isin ids.
+
+    The products traded in a date range are the union of the days in it; their
+    distinct count by issuer, underlying or subtype is a popcount of that union
+    intersected with each key's products.
+    """
+
+    def __init__(self, traded: pd.DataFrame, n_ids: int) -> None:
+        # `traded` holds each Day with its ids as a bit string, "1" at each id traded
+        traded = traded.sort_values("Day")
+        self.days = traded["Day"].to_numpy("datetime64[D]")
+        self.n_ids = n_ids
+        bits = np.frombuffer("".join(traded["Ids"]).encode(), dtype=np.uint8)
+        self.sets = np.packbits(bits.reshape(len(traded), n_ids) == ord("1"), axis=1)
+
+    def between(self, start: date | None, end: date | None) -> np.ndarray:
+        first = 0 if start is None else np.searchsorted(self.days, np.datetime64(start))
+        stop = (
+            len(self.days)
+            if end is None
+            else np.searchsorted(self.days, np.datetime64(end), side="right")
+        )
+        return np.bitwise_or.reduce(
+            self.sets[first:stop],
+            axis=0,
+            initial=0,
+        ).astype(np.uint8)
+
+    def count_by(
+        self,
+        products: pd.DataFrame,
+        key: str,
+        masks: dict[str, np.ndarray],
+    ) -> pd.DataFrame:
+        """Distinct products per `key` of `products` in each of `masks`.
+
+        `products` holds isin_id and `key`, a product once per key it belongs to;
+        every mask is a bitset over the isin ids and gives one column of counts.
+        """
+        products = products.dropna(subset=[key, "isin_id"])
+        codes, keys = pd.factorize(products[key], sort=True)
+        sets = bitsets(
+            products["isin_id"].to_numpy(dtype=np.int64),
+            codes,
+            len(keys),
+            self.n_ids,
+        )
+        counts = {name: popcount(sets & mask) for name, mask in masks.items()}
+        return pd.DataFrame({key: keys, **counts})
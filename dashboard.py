@@ -1,6 +1,6 @@
 import logging
-import os
 import socket
+from dataclasses import replace
 from datetime import datetime, timedelta
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
@@ -8,9 +8,21 @@ from pathlib import Path
 import pandas as pd
 import plotly.express as px
 import streamlit as st
+from apscheduler.job import Job
 from apscheduler.schedulers.background import BackgroundScheduler
 from tqdm import tqdm
 
+import archive
+import data_service
+import exports
+import intraday
+import metrics
+import profiling
+import query_engine
+import ranking
+import timeseries
+import update_worker
+
 st.set_page_config(page_title="ISIN Dashboard", page_icon="📊", layout="wide")
 
 BASE_FOLDER = Path(__file__).parent
@@ -48,18 +60,16 @@ logging.basicConfig(
 )
 
 
-def run_update():
-    import main
-
-    main.update_all()
-
-
-def start_scheduler():
+@st.cache_resource
+def start_updater() -> tuple[update_worker.UpdateWorker, Job]:
+    worker = update_worker.UpdateWorker()
+    worker.start()
     scheduler = BackgroundScheduler()
     job_id = "update_job"
     job = scheduler.add_job(
-        run_update,
+        worker.submit,
         "cron",
+        kwargs={"reason": "scheduled"},
         minute="1,31",
         hour="8-18",
         day_of_week="mon-fri",
@@ -68,43 +78,54 @@ def start_scheduler():
     )
     scheduler.start()
     logger.info("Scheduler started. %s", scheduler.get_jobs())
-    return scheduler, job
+    return worker, job
 
 
-# Initialize scheduler once
-if "scheduler_started" not in st.session_state and IS_AUTHORIZED_FOR_UPDATE:
-    scheduler, job = start_scheduler()
-    st.session_state.scheduler_started = True
-    st.session_state.job = job
+@st.cache_resource
+def get_invalidated_runs() -> set[str]:
+    # Runs finished before this server started are already reflected in the data
+    return {update_worker.read_status().get("run_id")}
 
 
-@st.cache_data
-def load_csv(filename: str, modified_time: float, **kwargs) -> pd.DataFrame:
-    logger.info("Loading CSV: %s", filename)
-    path = BASE_FOLDER / filename
-    if path.exists():
-        return pd.read_csv(path, encoding="utf-8-sig", **kwargs)
-    return pd.DataFrame()
+def run_update() -> None:
+    st.session_state.worker.submit(reason="manual")
 
 
-def load_data_with_modified(filename: str, **kwargs) -> pd.DataFrame:
-    return load_csv(filename, modified_time=os.path.getmtime(filename), **kwargs)
+@st.fragment(run_every=2)
+def show_update_progress() -> None:
+    status = st.session_state.worker.status()
+    if not status["alive"]:
+        st.error("Il processo di aggiornamento non è attivo, riavviare la dashboard")
+    elif status["state"] == "running":
+        total = max(status["total"], 1)
+        st.progress(
+            min(status["done"] / total, 1.0),
+            text=f"Aggiornamento in corso: {status['stage']} {status['done']:,}/{status['total']:,}",
+        )
+    elif status["pending"]:
+        st.caption("Aggiornamento in coda...")
+    elif status["state"] == "failed":
+        st.error(f"Ultimo aggiornamento fallito: {status['error']}")
+
+    run_id = status.get("run_id")
+    if status["state"] in ("succeeded", "failed") and run_id:
+        # Drop the shared data cache once per run, then refresh every session that
+        # still shows the data from before it
+        invalidated_runs = get_invalidated_runs()
+        if run_id not in invalidated_runs:
+            invalidated_runs.add(run_id)
+            data_service.invalidate()
+        if st.session_state.setdefault("last_update_run", run_id) != run_id:
+            st.session_state.last_update_run = run_id
+            st.rerun()
 
 
-# Load data
-sales_data = pd.concat(
-    [
-        load_data_with_modified(f, parse_dates=["DayEvent"])
-        for f in (BASE_FOLDER / "intermediate_csv").iterdir()
-    ],
-)
-isin_info = load_data_with_modified("isin_info.csv")
-underlyings = load_data_with_modified("underlyings.csv")
-type_and_subtype = load_data_with_modified("type_and_subtype.csv")
-issuers = load_data_with_modified("issuers.csv")
-und_mapping = load_data_with_modified("und_mapping.csv")
+# Initialize scheduler and update worker once per server process
+if IS_AUTHORIZED_FOR_UPDATE:
+    st.session_state.worker, st.session_state.job = start_updater()
 
 
+@profiling.profiled("issuers_page")
 def issuers_page() -> None:
     st.title("Issuers dashboard")
     last_update = datetime.fromtimestamp(
@@ -115,46 +136,33 @@ def issuers_page() -> None:
             f"Prossimo update alle: {st.session_state.job.next_run_time.strftime('%H:%M')}, ultimo update alle {last_update.strftime('%H:%M')}",
         )
         if st.button("Aggiorna dati adesso", type="primary"):
-            with st.spinner("Aggiornamento in corso..."):
-                run_update()
-            st.success("Dati aggiornati!")
-            st.rerun()
+            run_update()
+        show_update_progress()
     else:
         st.caption(
             f"Ultimo update alle {last_update.strftime('%H:%M')}",
         )
 
-    joined = get_joined_df()
-
-    dates_filter, filter_type, filter_subtype, filter_issuer = get_standard_filters(
-        joined,
-    )
-
-    # Filter data for the line chart
-    filtered_by_date = joined[
-        joined["DayEvent"].dt.date.between(
-            dates_filter[0],
-            dates_filter[1]
-            if len(dates_filter) == 2
-            else joined["DayEvent"].dt.date.max(),
-        )
-        & joined["Issuer"].isin(filter_issuer)
-    ]
+    engine = get_engine()
+    filters = get_standard_filters(engine)
 
+    # Top issuers over the selected days, regardless of type and subtype
     top_10_issuers = (
-        filtered_by_date.groupby("Issuer")["Adjusted Turnover"]
-        .sum()
-        .nlargest(10)
-        .index.tolist()
+        engine.aggregate(
+            ["Issuer"],
+            ["Adjusted Turnover"],
+            replace(filters, types=None, subtypes=None),
+        )
+        .nlargest(10, "Adjusted Turnover")["Issuer"]
+        .tolist()
+    )
+    top_filters = replace(filters, issuers=tuple(top_10_issuers))
+    filtered_by_subtype = engine.aggregate(
+        ["DayEvent", "Issuer", "SubType"],
+        ["Adjusted Turnover"],
+        top_filters,
+        dropna=False,
     )
-
-    filtered_by_date_issuers = filtered_by_date[
-        filtered_by_date["Issuer"].isin(top_10_issuers)
-    ]
-    filtered_by_subtype = filtered_by_date_issuers[
-        filtered_by_date_issuers["SubType"].isin(filter_subtype)
-        & filtered_by_date_issuers["Type"].isin(filter_type)
-    ]
     aggregated = (
         filtered_by_subtype.groupby(
             ["DayEvent", "Issuer"],
@@ -214,6 +222,19 @@ def issuers_page() -> None:
 
     st.plotly_chart(fig, use_container_width=True)
 
+    st.subheader("Prodotti per issuer")
+    by_issuer = engine.aggregate(["Issuer"], ["Adjusted Turnover"], filters).merge(
+        engine.distinct_products("Issuer", filters),
+        on="Issuer",
+        how="outer",
+    )
+    ranking.ranking_table(
+        by_issuer,
+        sort_by=["Adjusted Turnover"],
+        key="issuers_products",
+        millions_columns=["Adjusted Turnover"],
+    )
+
     st.subheader("Totale mercato")
     df = (
         filtered_by_subtype.groupby(["DayEvent", "SubType"])["Adjusted Turnover"]
@@ -236,193 +257,120 @@ def issuers_page() -> None:
     fig.update_traces(textposition="top center")
     st.plotly_chart(fig, use_container_width=True)
 
-    st.download_button(
-        "Download CSV",
-        data=filtered_by_subtype.to_csv(index=False),
-        file_name="issuers.csv",
-        mime="text/csv",
+    exports.export_buttons(
+        lambda: engine.rows(top_filters),
+        page="issuers",
+        file_stem="issuers",
+        filters=(top_filters,),
+        data_version=engine.version,
     )
 
 
+@profiling.profiled("products_page")
 def products_page() -> None:
-    joined = get_joined_df()
-
-    dates_filter, filter_type, filter_subtype, filter_issuer = get_standard_filters(
-        joined,
-    )
+    engine = get_engine()
+    filters = get_standard_filters(engine)
 
     st.title("Products dashboard")
 
-    filtered_total = joined.loc[
-        (
-            joined["DayEvent"].dt.date.between(
-                dates_filter[0],
-                dates_filter[1]
-                if len(dates_filter) == 2
-                else joined["DayEvent"].dt.date.max(),
-            )
-        )
-        & (joined["Type"].isin(filter_type))
-        & (joined["SubType"].isin(filter_subtype))
-        & (joined["Issuer"].isin(filter_issuer)),
-        [
-            "DayEvent",
-            "ISIN",
-            "Sottostanti",
-            "Issuer",
-            "Adjusted Turnover",
-            "Type",
-            "SubType",
-        ],
-    ]
+    ranking.ranking_table(
+        engine.aggregate(
+            ["ISIN", "Issuer", "Sottostanti", "Type", "SubType"],
+            ["Adjusted Turnover"],
+            filters,
+        ),
+        sort_by=["Adjusted Turnover"],
+        key="products_ranking",
+        millions_columns=["Adjusted Turnover"],
+    )
 
-    st.dataframe(
-        filtered_total.groupby(["ISIN", "Issuer", "Sottostanti", "Type", "SubType"])
-        .agg({"Adjusted Turnover": "sum"})
-        .sort_values(by="Adjusted Turnover", ascending=False)
-        .reset_index()
-        .assign(
-            **{
-                "Adjusted Turnover": lambda df: (
-                    df["Adjusted Turnover"] / 1_000_000
-                ).apply(lambda x: f"{x:,.2f}"),
-                "n": lambda df: range(1, len(df) + 1),
-            },
-        )
-        .set_index("n"),
-        use_container_width=True,
+    exports.export_buttons(
+        lambda: engine.rows(
+            filters,
+            [
+                "DayEvent",
+                "ISIN",
+                "Sottostanti",
+                "Issuer",
+                "Adjusted Turnover",
+                "Type",
+                "SubType",
+            ],
+        ),
+        page="products",
+        file_stem="products",
+        filters=(filters,),
+        data_version=engine.version,
     )
 
-    st.download_button(
-        "Download CSV",
-        data=filtered_total.to_csv(index=False),
-        file_name="products.csv",
-        mime="text/csv",
+
+def include_archived() -> bool:
+    return st.sidebar.toggle(
+        "Includi prodotti archiviati",
+        key="include_archived",
+        help=(
+            f"Prodotti scaduti da più di {archive.ARCHIVE_AFTER_DAYS} giorni "
+            "e senza scambi da allora"
+        ),
     )
 
 
-def get_standard_filters(
-    joined: pd.DataFrame,
-) -> tuple[list[str], list[str], list[str], list[str]]:
+def get_engine() -> query_engine.QueryEngine:
+    return query_engine.get_engine(archived=include_archived())
+
+
+def get_standard_filters(engine: query_engine.QueryEngine) -> query_engine.Filters:
     st.sidebar.header("Filters")
 
+    first_day, last_day = engine.date_range()
     dates_filter = st.sidebar.date_input(
         "Select days",
-        min_value=joined["DayEvent"].min(),
-        max_value=joined["DayEvent"].max(),
+        min_value=first_day,
+        max_value=last_day,
         value=(
             max(
-                joined["DayEvent"].min(),
-                joined["DayEvent"].max() - timedelta(days=30),
+                first_day,
+                last_day - timedelta(days=30),
             ),
-            joined["DayEvent"].max(),
+            last_day,
         ),
     )
 
+    types = engine.distinct("Type")
+    subtypes = engine.distinct("SubType")
+    issuers = engine.distinct("Issuer")
     filter_type = st.sidebar.multiselect(
         "Select Type",
-        options=joined["Type"].unique(),
-        default=joined["Type"].unique(),
+        options=types,
+        default=types,
     )
     filter_subtype = st.sidebar.multiselect(
         "Select SubType",
-        options=joined["SubType"].unique(),
+        options=subtypes,
         default=["Yield Enhancement"],
     )
-    filter_type = filter_type if filter_type else joined["Type"].unique()
-    filter_subtype = filter_subtype if filter_subtype else joined["SubType"].unique()
+    filter_type = filter_type if filter_type else types
+    filter_subtype = filter_subtype if filter_subtype else subtypes
 
     filter_issuer = st.sidebar.multiselect(
         "Select issuer",
-        options=joined["Issuer"].unique(),
+        options=issuers,
         default=[],
     )
-    filter_issuer = filter_issuer if filter_issuer else joined["Issuer"].unique()
-    return dates_filter, filter_type, filter_subtype, filter_issuer
-
-
-def get_joined_df() -> pd.DataFrame:
-    return (
-        sales_data.merge(
-            isin_info,
-            how="left",
-            left_on=["MifidInstrumentID"],
-            right_on=["ISIN"],
-        )
-        .merge(
-            issuers,
-            how="left",
-            left_on=["Emittente"],
-            right_on=["Original"],
-        )
-        .merge(
-            type_and_subtype,
-            how="left",
-            left_on=["Nome"],
-            right_on=["Category"],
-        )
-        .assign(
-            **{
-                "Adjusted Turnover": lambda df: compute_adjusted_turnover(df),
-            },
-        )
-        .drop(columns=["MifidInstrumentID", "Original", "Emittente", "Nome"])
-    )
-
-
-def compute_adjusted_turnover(df: pd.DataFrame) -> pd.Series:
-    return df["MifidNotionalAmount"].where(
-        (df["Issue Price"].isna() & df["Type"] != "Investment"),
-        df["MifidQuantity"] * df["Issue Price"],
+    filter_issuer = filter_issuer if filter_issuer else issuers
+    return query_engine.Filters(
+        start=dates_filter[0],
+        end=dates_filter[1] if len(dates_filter) == 2 else last_day.date(),
+        types=tuple(filter_type),
+        subtypes=tuple(filter_subtype),
+        issuers=tuple(filter_issuer),
     )
 
 
+@profiling.profiled("underlyings_page")
 def underlyings_page() -> None:
-    n_underlyings = underlyings.groupby("ISIN")["Sottostante"].count()
-
-    joined = (
-        get_joined_df()
-        .merge(
-            n_underlyings.rename("n_underlyings").reset_index(),
-            how="left",
-            on=["ISIN"],
-        )
-        .merge(
-            underlyings,
-            how="left",
-            on=["ISIN"],
-        )
-        .assign(
-            Sottostante=lambda df: df["Sottostante"].str.lower(),
-        )
-        .merge(
-            und_mapping,
-            how="left",
-            left_on=["Sottostante"],
-            right_on=und_mapping["Original"].str.lower(),
-            suffixes=("_x", ""),
-        )
-        .assign(
-            **{
-                "Adjusted Turnover (underlying)": lambda df: compute_adjusted_turnover(
-                    df,
-                ),
-                "Adjusted Turnover": lambda df: (
-                    df["Adjusted Turnover (underlying)"] / df["n_underlyings"]
-                ),
-            },
-        )
-        .drop(
-            columns=[
-                "Sottostante_x",
-                "Original",
-            ],
-        )
-    )
-
-    dates_filter, filter_type, filter_subtype, filter_issuer = get_standard_filters(
-        joined,
-    )
+    engine = get_engine()
+    filters = get_standard_filters(engine)
 
     n_underlyings = st.sidebar.slider(
         label="Underlyings to show",
@@ -433,42 +381,25 @@ def underlyings_page() -> None:
 
     st.title("Underlyings dashboard")
 
-    columns_to_group = [
+    measures = [
+        "MifidNotionalAmount",
+        "MifidQuantity",
+        "Adjusted Turnover",
+        "Adjusted Turnover (underlying)",
+    ]
+    attributes = [
         col
-        for col in joined.columns
-        if col
-        not in [
-            "DayEvent",
-            "MifidNotionalAmount",
-            "Adjusted Turnover",
-            "Adjusted Turnover (underlying)",
-            "MifidQuantity",
-        ]
+        for col in engine.columns("joined_underlyings")
+        if col not in ["DayEvent", *measures]
     ]
-    ref_df = (
-        joined.loc[
-            (
-                joined["DayEvent"].dt.date.between(
-                    dates_filter[0],
-                    dates_filter[1]
-                    if len(dates_filter) == 2
-                    else joined["DayEvent"].dt.date.max(),
-                )
-            )
-            & (joined["Type"].isin(filter_type))
-            & (joined["SubType"].isin(filter_subtype))
-            & joined["Issuer"].isin(filter_issuer)
-        ]
-        .groupby(columns_to_group)[
-            [
-                "MifidNotionalAmount",
-                "MifidQuantity",
-                "Adjusted Turnover",
-                "Adjusted Turnover (underlying)",
-            ]
-        ]
-        .sum()
-        .reset_index()
+    # The page used to group by every attribute, which leaves out rows where any of
+    # them is missing: keep that selection, but only fetch the columns shown here
+    ref_df = engine.aggregate(
+        ["Sottostanti", "Sottostante", "SubType", "ISIN", "Issuer"],
+        ["Adjusted Turnover", "Adjusted Turnover (underlying)"],
+        filters,
+        source="joined_underlyings",
+        not_null=attributes,
     )
 
     top_10_sottostanti = (
@@ -548,33 +479,18 @@ def underlyings_page() -> None:
         "Adjusted Turnover"
     ].transform("sum")
 
-    # Step 3: Add these columns and sort
+    # Step 3: Add these columns, the ranking sorts by them
     grouped["Sottostanti Total"] = sottostanti_total
     grouped["ISIN Total"] = isin_total
     grouped["Issuer Total"] = issuer_total
 
-    sorted_grouped = grouped.sort_values(
-        by=["Sottostanti Total", "ISIN Total", "Issuer Total"],
-        ascending=False,
-    ).drop(
-        columns=["Sottostanti Total", "ISIN Total", "Issuer Total"],
-    )  # Optional cleanup
-    sorted_grouped["Sottostanti"] = sorted_grouped["Sottostanti"].where(
-        sorted_grouped["Sottostanti"].shift() != sorted_grouped["Sottostanti"],
-        "//",
-    )
-
     st.header("Top baskets")
-    st.dataframe(
-        sorted_grouped.assign(
-            **{
-                "Adjusted Turnover": lambda df: (
-                    df["Adjusted Turnover"] / 1_000_000
-                ).apply(lambda x: f"{x:,.2f}"),
-                "n": lambda df: range(1, len(df) + 1),
-            },
-        ).set_index("n"),
-        use_container_width=True,
+    ranking.ranking_table(
+        grouped,
+        sort_by=["Sottostanti Total", "ISIN Total", "Issuer Total"],
+        key="baskets_ranking",
+        millions_columns=["Adjusted Turnover"],
+        blank_repeated=["Sottostanti"],
     )
 
     grouped = (
@@ -598,52 +514,345 @@ def underlyings_page() -> None:
         "Adjusted Turnover (underlying)"
     ].transform("sum")
 
-    # Step 3: Add these columns and sort
+    # Step 3: Add these columns, the ranking sorts by them
     grouped["Sottostante Total"] = sottostanti_total
     grouped["Basket Total"] = basket_total
     grouped["ISIN Total"] = isin_total
     grouped["Issuer Total"] = issuer_total
+    grouped = grouped.merge(
+        engine.distinct_products(
+            "Sottostante",
+            filters,
+            source="product_underlyings",
+            not_null=attributes,
+        ),
+        on="Sottostante",
+        how="left",
+    )
+
+    st.header("Top underlyings")
+    ranking.ranking_table(
+        grouped,
+        sort_by=["Sottostante Total", "Basket Total", "ISIN Total", "Issuer Total"],
+        key="underlyings_ranking",
+        millions_columns=["Adjusted Turnover (underlying)"],
+        blank_repeated=["Sottostante", "Sottostanti"],
+    )
+
+    exports.export_buttons(
+        lambda: engine.aggregate(
+            attributes,
+            measures,
+            filters,
+            source="joined_underlyings",
+        ),
+        page="underlyings",
+        file_stem="underlyings",
+        filters=(filters,),
+        data_version=engine.version,
+    )
+
+
+def metrics_page() -> None:
+    st.title("Update metrics")
+    runs = metrics.load_runs()
+    if not runs:
+        st.info("Nessuna metrica registrata: vengono scritte a ogni update.")
+        return
+
+    started_at = [pd.Timestamp(run["started_at"]) for run in runs]
+    stages = pd.DataFrame(
+        [
+            {"Run": start, "Status": run["status"], **stage}
+            for start, run in zip(started_at, runs, strict=True)
+            for stage in run["stages"]
+        ],
+    )
+    measures = {
+        "wall_s": "Wall time (s)",
+        "cpu_s": "CPU time of the stage thread (s)",
+        "peak_rss_mb": "Peak RSS (MB)",
+    }
+    measure = st.sidebar.selectbox(
+        "Measure",
+        options=list(measures),
+        format_func=measures.get,
+    )
+    st.subheader("By stage")
+    fig = px.line(stages, x="Run", y=measure, color="stage", markers=True)
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("HTTP requests by host")
+    requests_by_host = pd.DataFrame(
+        [
+            {"Run": start, "Host": host, "Requests": n}
+            for start, run in zip(started_at, runs, strict=True)
+            for host, n in run["http_requests"].items()
+        ],
+        columns=["Run", "Host", "Requests"],
+    )
+    fig = px.bar(requests_by_host, x="Run", y="Requests", color="Host")
+    st.plotly_chart(fig, use_container_width=True)
 
-    sorted_grouped = grouped.sort_values(
-        by=["Sottostante Total", "Basket Total", "ISIN Total", "Issuer Total"],
+    st.subheader("Parsing time per page")
+    parse = pd.DataFrame(
+        [
+            {"Run": start, "Page": kind, **stats}
+            for start, run in zip(started_at, runs, strict=True)
+            for kind, stats in run["parse"].items()
+        ],
+        columns=["Run", "Page", "pages", "total_s", "mean_ms", "max_ms"],
+    )
+    fig = px.line(parse, x="Run", y="mean_ms", color="Page", markers=True)
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("Counters")
+    counters = pd.DataFrame(
+        [run["counters"] for run in runs],
+        index=pd.Index(started_at, name="Run"),
+    ).fillna(0)
+    st.dataframe(counters.iloc[::-1], use_container_width=True)
+
+
+@profiling.profiled("trends_page")
+def trends_page() -> None:
+    st.title("Trends")
+    labels = {"issuer": "Issuer", "underlying": "Underlying", "isin": "ISIN"}
+    level = st.sidebar.radio("Group by", options=list(labels), format_func=labels.get)
+    key = timeseries.LEVELS[level]
+    if level == "isin":
+        isins = st.sidebar.text_input("ISIN (separati da virgola)").upper()
+        keys = [isin.strip() for isin in isins.split(",") if isin.strip()]
+        if not keys:
+            st.info("Inserisci uno o più ISIN.")
+            return
+        df = timeseries.load("isin", data_service.TIMESERIES_FOLDER, keys=keys)
+    else:
+        df = data_service.get_timeseries(level)
+    if df.empty:
+        st.info("Nessuna serie storica: viene calcolata a ogni update.")
+        return
+
+    measure = st.sidebar.selectbox("Measure", options=timeseries.MEASURES, index=2)
+    last_day = df["Day"].max()
+    latest = df.loc[df["Day"] == last_day].sort_values(
+        f"Turnover {max(timeseries.WINDOWS)}d",
         ascending=False,
-    ).drop(
-        columns=["Sottostante Total", "Basket Total", "ISIN Total", "Issuer Total"],
-    )  # Optional cleanup
-    sorted_grouped["Sottostante"] = sorted_grouped["Sottostante"].where(
-        sorted_grouped["Sottostante"].shift() != sorted_grouped["Sottostante"],
-        "//",
     )
-    sorted_grouped["Sottostanti"] = sorted_grouped["Sottostanti"].where(
-        sorted_grouped["Sottostanti"].shift() != sorted_grouped["Sottostanti"],
-        "//",
+    selected = st.sidebar.multiselect(
+        f"Select {key}",
+        options=sorted(df[key].unique()),
+        default=latest[key].head(10).tolist(),
     )
+    if not selected:
+        selected = latest[key].head(10).tolist()
 
-    st.header("Top underlyings")
+    dates_filter = st.sidebar.date_input(
+        "Select days",
+        min_value=df["Day"].min(),
+        max_value=last_day,
+        value=(max(df["Day"].min(), last_day - timedelta(days=90)), last_day),
+    )
+    chart_data = df.loc[
+        df[key].isin(selected)
+        & df["Day"].between(
+            pd.Timestamp(dates_filter[0]),
+            pd.Timestamp(dates_filter[-1]),
+        ),
+        ["Day", key, measure],
+    ]
+    is_share = measure.startswith("Share")
+    if is_share:
+        chart_data[measure] = chart_data[measure] * 100
+    else:
+        chart_data[measure] = chart_data[measure] / 1_000_000
+    y_label = f"{measure} ({'%' if is_share else 'M'})"
+    st.subheader(measure)
+    fig = px.line(
+        chart_data.rename(columns={measure: y_label}),
+        x="Day",
+        y=y_label,
+        color=key,
+        markers=True,
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader(f"Al {last_day:%d/%m/%Y}")
+    table = latest.drop(columns="Day").set_index(key)
+    for column in table.columns:
+        if column.startswith("Share"):
+            table[column] = table[column] * 100
+        else:
+            table[column] = table[column] / 1_000_000
     st.dataframe(
-        sorted_grouped.assign(
-            **{
-                "Adjusted Turnover (underlying)": lambda df: (
-                    df["Adjusted Turnover (underlying)"] / 1_000_000
-                ).apply(lambda x: f"{x:,.2f}"),
-                "n": lambda df: range(1, len(df) + 1),
-            },
-        ).set_index("n"),
+        table,
         use_container_width=True,
+        column_config={
+            column: st.column_config.NumberColumn(
+                f"{column} ({'%' if column.startswith('Share') else 'M'})",
+                format="%.2f",
+            )
+            for column in table.columns
+        },
+    )
+
+
+@profiling.profiled("intraday_page")
+def intraday_page() -> None:
+    st.title("Intraday")
+    days = intraday.days(data_service.INTRADAY_FOLDER)
+    if not days:
+        st.info("Nessun dato intraday: viene calcolato a ogni update.")
+        return
+
+    st.sidebar.header("Filters")
+    dates_filter = st.sidebar.date_input(
+        "Select days",
+        min_value=days[0],
+        max_value=days[-1],
+        value=(days[-1], days[-1]),
+    )
+    measures = {"Notional": "Turnover (M)", "Quantity": "Quantity", "Trades": "Trades"}
+    measure = st.sidebar.selectbox(
+        "Measure",
+        options=list(measures),
+        format_func=measures.get,
+    )
+    tables = data_service.get_tables()
+    issuer_by_isin = (
+        tables.isin_info[["ISIN", "Emittente"]]
+        .drop_duplicates("ISIN")
+        .merge(tables.issuers, left_on="Emittente", right_on="Original")
+        .set_index("ISIN")["Issuer"]
+    )
+    filter_issuer = st.sidebar.multiselect(
+        "Select issuer",
+        options=sorted(issuer_by_isin.unique()),
+        default=[],
+    )
+    isins = st.sidebar.text_input("ISIN (separati da virgola)").upper()
+    keys = [isin.strip() for isin in isins.split(",") if isin.strip()]
+    if filter_issuer:
+        keys += issuer_by_isin.index[issuer_by_isin.isin(filter_issuer)].tolist()
+
+    df = intraday.load(
+        dates_filter[0],
+        dates_filter[-1],
+        isins=keys or None,
+        folder=data_service.INTRADAY_FOLDER,
+    )
+    if df.empty:
+        st.info("Nessuno scambio per i filtri selezionati.")
+        return
+    if measure == "Notional":
+        df["Notional"] = df["Notional"] / 1_000_000
+    df["Issuer"] = df["ISIN"].map(issuer_by_isin)
+    # Days are overlaid on one session: each bucket sums every selected day
+    df["Time"] = df["Bucket"].dt.strftime("%H:%M")
+
+    st.subheader("By issuer")
+    top_issuers = df.groupby("Issuer")["Notional"].sum().nlargest(10).index
+    by_issuer = (
+        df.assign(Issuer=df["Issuer"].where(df["Issuer"].isin(top_issuers), "Altri"))
+        .groupby(["Time", "Issuer"], as_index=False)[measure]
+        .sum()
+        .rename(columns={measure: measures[measure]})
+    )
+    fig = px.bar(by_issuer, x="Time", y=measures[measure], color="Issuer")
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.subheader("By venue")
+    by_venue = (
+        df.groupby(["Time", "Venue"], as_index=False)[measure]
+        .sum()
+        .rename(columns={measure: measures[measure]})
+    )
+    fig = px.line(by_venue, x="Time", y=measures[measure], color="Venue", markers=True)
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def product_detail(isin: str) -> None:
+    tables = data_service.get_tables()
+    isin_info, underlyings = tables.isin_info, tables.underlyings
+    if not isin_info["ISIN"].eq(isin).any():
+        # Only the search finds archived products, and only with the toggle on
+        archived = data_service.get_archive()
+        isin_info, underlyings = archived["isin_info"], archived["underlyings"]
+    st.header(isin)
+    # ISINs listed twice in isin_info show their first row, as in the search index
+    info = isin_info.loc[isin_info["ISIN"] == isin]
+    info = info.drop_duplicates("ISIN")
+    st.dataframe(info.set_index("ISIN").T.astype("string"), use_container_width=True)
+    underlyings = underlyings.loc[underlyings["ISIN"] == isin]
+    if not underlyings.empty:
+        st.caption("Sottostanti: " + ", ".join(underlyings["Sottostante"].dropna()))
+
+    df = timeseries.load(
+        "isin",
+        data_service.TIMESERIES_FOLDER,
+        keys=[isin],
+        columns=["Day", "Turnover", "Turnover 20d"],
+    )
+    if df.empty:
+        st.info("Nessuno scambio per questo prodotto.")
+        return
+    st.subheader("Turnover (M)")
+    chart_data = df.melt(id_vars="Day", var_name="Measure", value_name="Turnover (M)")
+    chart_data["Turnover (M)"] = chart_data["Turnover (M)"] / 1_000_000
+    fig = px.line(
+        chart_data,
+        x="Day",
+        y="Turnover (M)",
+        color="Measure",
+        markers=True,
     )
+    st.plotly_chart(fig, use_container_width=True)
+
 
-    st.download_button(
-        "Download CSV",
-        data=ref_df.to_csv(index=False),
-        file_name="underlyings.csv",
-        mime="text/csv",
+@profiling.profiled("search_page")
+def search_page() -> None:
+    st.title("Search")
+    index = data_service.get_search_index()
+    if index is None:
+        st.info("Nessun indice di ricerca: viene creato a ogni update.")
+        return
+    archived = include_archived()
+    query = st.text_input("Cerca ISIN, issuer o sottostante")
+    if not query.strip():
+        return
+    results = index.search(query, archived=archived)
+    if results.empty:
+        st.info("Nessun prodotto trovato.")
+        return
+    hidden = ["Score"] if archived else ["Score", "Archived"]
+    selection = st.dataframe(
+        results.drop(columns=hidden).assign(
+            **{"Turnover 20d": results["Turnover 20d"] / 1_000_000},
+        ),
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        column_config={
+            "Turnover 20d": st.column_config.NumberColumn(
+                "Turnover 20d (M)",
+                format="%.2f",
+            ),
+        },
     )
+    # The best match until a row is picked
+    rows = selection.selection.rows
+    product_detail(results["ISIN"].iloc[rows[0] if rows else 0])
 
 
 pages = {
     "Issuers": issuers_page,
     "Products": products_page,
     "Underlyings": underlyings_page,
+    "Trends": trends_page,
+    "Intraday": intraday_page,
+    "Search": search_page,
+    "Metrics": metrics_page,
 }
 
 selected_page = st.sidebar.selectbox("Navigate to:", list(pages.keys()))
@@ -0,0 +1,174 @@
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import archive
+import isin_ids
+import search
+import snapshot
+import timeseries
+
+BASE_FOLDER = Path(__file__).parent
+INTERMEDIATE_FOLDER = BASE_FOLDER / "intermediate_csv"
+INTRADAY_FOLDER = BASE_FOLDER / "intraday"
+SEARCH_FOLDER = BASE_FOLDER / "search"
+SNAPSHOT_FOLDER = BASE_FOLDER / "snapshot"
+TIMESERIES_FOLDER = BASE_FOLDER / "timeseries"
+TABLE_FILES = {
+    "isin_info": "isin_info.csv",
+    "underlyings": "underlyings.csv",
+    "type_and_subtype": "type_and_subtype.csv",
+    "issuers": "issuers.csv",
+    "und_mapping": "und_mapping.csv",
+    "isin_ids": "isin_ids.csv",
+}
+
+# Frames handed out by the service are shared by every session: with copy-on-write
+# a page that derives (or even assigns to) a frame gets its own copy lazily,
+# so the shared instance is never mutated and never copied up front.
+pd.set_option("mode.copy_on_write", True)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class DataTables:
+    version: str
+    isin_info: pd.DataFrame
+    underlyings: pd.DataFrame
+    type_and_subtype: pd.DataFrame
+    issuers: pd.DataFrame
+    und_mapping: pd.DataFrame
+    isin_ids: pd.DataFrame
+    # Only the ISINs: the rest of the archive is loaded by `get_archive`
+    archived_isins: pd.DataFrame
+
+
+def _source_files() -> list[Path]:
+    files = [BASE_FOLDER / filename for filename in TABLE_FILES.values()]
+    files.extend(BASE_FOLDER / filename for filename in archive.ARCHIVE_FILES.values())
+    if INTERMEDIATE_FOLDER.exists():
+        files.extend(sorted(INTERMEDIATE_FOLDER.iterdir()))
+    return files
+
+
+def data_version() -> str:
+    """Identify the current data on disk by name, size and mtime of every source file."""
+    parts = []
+    for path in _source_files():
+        if path.exists():
+            stat = path.stat()
+            parts.append(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return "|".join(parts)
+
+
+def _read_csv(path: Path, **kwargs) -> pd.DataFrame:
+    if path.exists():
+        return pd.read_csv(path, encoding="utf-8-sig", **kwargs)
+    return pd.DataFrame()
+
+
+def daily_files() -> list[Path]:
+    """The intermediate_csv files, one per day. `query_engine` reads the trades."""
+    if not INTERMEDIATE_FOLDER.exists():
+        return []
+    return sorted(INTERMEDIATE_FOLDER.glob("*.csv"))
+
+
+def read_tables(version: str) -> DataTables:
+    """Read the tables from their CSV files, which are of `version`."""
+    tables = {
+        name: _read_csv(BASE_FOLDER / filename)
+        for name, filename in TABLE_FILES.items()
+        if name != "isin_ids"
+    }
+    # Typed and with its columns even before the first update writes it
+    tables["isin_ids"] = isin_ids.load(
+        BASE_FOLDER / TABLE_FILES["isin_ids"],
+    ).reset_index()
+    archive_path = BASE_FOLDER / archive.ARCHIVE_FILES["isin_info.csv"]
+    tables["archived_isins"] = pd.DataFrame(
+        {"ISIN": sorted(archive.archived_isins(archive_path))},
+        dtype=object,
+    )
+    return DataTables(version=version, **tables)
+
+
+@st.cache_resource(max_entries=1, show_spinner="Caricamento dati...")
+def _load_tables(version: str) -> DataTables:
+    logger.info("Loading dashboard tables for a new data version")
+    # The update leaves a snapshot of them, unless they changed since
+    folder = snapshot.current(version, SNAPSHOT_FOLDER)
+    if folder is not None:
+        try:
+            return DataTables(version=version, **snapshot.read_tables(folder))
+        except (OSError, pa.ArrowException, TypeError):
+            logger.warning("Can't read the snapshot in %s", folder, exc_info=True)
+    return read_tables(version)
+
+
+@st.cache_resource(max_entries=1, show_spinner="Caricamento prodotti archiviati...")
+def _load_archive(version: str) -> dict[str, pd.DataFrame]:
+    return {
+        name: _read_csv(BASE_FOLDER / archive.ARCHIVE_FILES[filename])
+        for name, filename in TABLE_FILES.items()
+        if filename in archive.ARCHIVE_FILES
+    }
+
+
+def get_archive() -> dict[str, pd.DataFrame]:
+    """Return isin_info and underlyings of the archived products, by table name.
+
+    Only read when a page asks for archived products; shared and read-only.
+    """
+    return _load_archive(data_version())
+
+
+def get_tables() -> DataTables:
+    """Return the process-wide tables for the current data version.
+
+    The same instance is returned to every session until the files on disk change,
+    so callers must treat the frames as read-only.
+    """
+    return _load_tables(data_version())
+
+
+def invalidate() -> None:
+    """Drop the cached tables, so the next `get_tables` reloads from disk."""
+    logger.info("Invalidating dashboard data cache")
+    _load_tables.clear()
+
+
+@st.cache_resource(max_entries=2, show_spinner="Caricamento serie storiche...")
+def _load_timeseries(level: str, version: str) -> pd.DataFrame:
+    return timeseries.load(level, TIMESERIES_FOLDER)
+
+
+def get_timeseries(level: str) -> pd.DataFrame:
+    """Return the precomputed rolling turnover of `level` ("issuer" or "underlying").
+
+    Cached until the update rewrites the file; the frame is shared, read-only.
+    """
+    path = TIMESERIES_FOLDER / f"{level}.parquet"
+    version = f"{path.stat().st_mtime_ns}" if path.exists() else ""
+    return _load_timeseries(level, version)
+
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def _load_search_index(version: str) -> search.SearchIndex:
+    return search.SearchIndex(SEARCH_FOLDER)
+
+
+def get_search_index() -> search.SearchIndex | None:
+    """Return the search index built by the last update, or None before the first.
+
+    Cached until the update rewrites it; the index is shared, read-only.
+    """
+    path = SEARCH_FOLDER / "documents.parquet"
+    if not path.exists():
+        return None
+    return _load_search_index(f"{path.stat().st_mtime_ns}")
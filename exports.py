@@ -0,0 +1,116 @@
+import hashlib
+import io
+import json
+from collections.abc import Callable, Iterator
+
+import pandas as pd
+import streamlit as st
+import xlsxwriter
+
+EXPORT_CHUNK_ROWS = 50_000
+XLSX_MAX_ROWS = 1_048_575  # Excel sheet limit, minus the header row
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def _iter_chunks(df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+    for start in range(0, len(df), EXPORT_CHUNK_ROWS):
+        yield df.iloc[start : start + EXPORT_CHUNK_ROWS]
+
+
+def filter_key(*filters: object) -> str:
+    """Stable key for a set of filter values (lists, arrays, dates...)."""
+    normalized = [f.tolist() if hasattr(f, "tolist") else f for f in filters]
+    return hashlib.sha1(
+        json.dumps(normalized, default=str).encode("utf-8"),
+    ).hexdigest()
+
+
+@st.cache_data(max_entries=16, show_spinner="Preparazione CSV...")
+def to_csv_bytes(_load: Callable[[], pd.DataFrame], key: str) -> bytes:
+    """Serialize the frame from `_load` chunk by chunk.
+
+    `key` identifies the data and drives the cache.
+    """
+    df = _load()
+    buffer = io.BytesIO()
+    # utf-8-sig as the other CSVs, so Excel opens them as UTF-8
+    buffer.write(df.iloc[:0].to_csv(index=False).encode("utf-8-sig"))
+    for chunk in _iter_chunks(df):
+        buffer.write(chunk.to_csv(index=False, header=False).encode("utf-8"))
+    return buffer.getvalue()
+
+
+@st.cache_data(max_entries=16, show_spinner="Preparazione Excel...")
+def to_xlsx_bytes(_load: Callable[[], pd.DataFrame], key: str) -> bytes:
+    """Write the frame from `_load` with xlsxwriter's constant-memory mode.
+
+    `key` identifies the data and drives the cache.
+    """
+    df = _load()
+    buffer = io.BytesIO()
+    workbook = xlsxwriter.Workbook(
+        buffer,
+        {
+            "constant_memory": True,
+            "default_date_format": "yyyy-mm-dd",
+            "nan_inf_to_errors": True,
+        },
+    )
+    header = [str(col) for col in df.columns]
+    worksheet = None
+    row = 0
+    for chunk in _iter_chunks(df):
+        for values in (
+            chunk.astype(object)
+            .where(chunk.notna(), None)
+            .itertuples(
+                index=False,
+                name=None,
+            )
+        ):
+            if worksheet is None or row > XLSX_MAX_ROWS:
+                worksheet = workbook.add_worksheet()
+                worksheet.write_row(0, 0, header)
+                row = 1
+            worksheet.write_row(row, 0, values)
+            row += 1
+    if worksheet is None:
+        workbook.add_worksheet().write_row(0, 0, header)
+    workbook.close()
+    return buffer.getvalue()
+
+
+def export_buttons(
+    load: Callable[[], pd.DataFrame],
+    page: str,
+    file_stem: str,
+    filters: tuple,
+    data_version: str,
+) -> None:
+    """Offer the frame from `load` as CSV/XLSX, only after the user asks for them.
+
+    Exports are cached per (page, filters, data version), so switching back to a
+    filter set already exported doesn't query or serialize it again.
+    """
+    key = filter_key(page, data_version, *filters)
+    state_key = f"export_requested_{page}"
+    if st.session_state.get(state_key) != key:
+        if not st.button("Prepara download", key=f"export_prepare_{page}"):
+            return
+        st.session_state[state_key] = key
+
+    csv_col, xlsx_col = st.columns(2)
+    csv_col.download_button(
+        "Download CSV",
+        data=to_csv_bytes(load, key),
+        file_name=f"{file_stem}.csv",
+        mime="text/csv",
+        key=f"export_csv_{page}",
+    )
+    xlsx_col.download_button(
+        "Download Excel",
+        data=to_xlsx_bytes(load, key),
+        file_name=f"{file_stem}.xlsx",
+        mime=XLSX_MIME,
+        key=f"export_xlsx_{page}",
+    )
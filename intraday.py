@@ -0,0 +1,85 @@
+import logging
+from collections.abc import Sequence
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BASE_FOLDER = Path(__file__).parent
+INTRADAY_FOLDER = BASE_FOLDER / "intraday"
+BUCKET = "15min"
+# Trade times are kept as Italian wall-clock time, as the session timetable
+TIMEZONE = "Europe/Rome"
+
+# One file per day, as intermediate_csv. ISINs and venues repeat on every bucket, so
+# they are dictionary-encoded; the bucket is stored as its start time.
+SCHEMA = pa.schema(
+    [
+        ("ISIN", pa.dictionary(pa.int32(), pa.string())),
+        ("Venue", pa.dictionary(pa.int8(), pa.string())),
+        ("Bucket", pa.timestamp("s")),
+        ("Quantity", pa.float64()),
+        ("Notional", pa.float64()),
+        ("Trades", pa.int32()),
+    ],
+)
+
+logger = logging.getLogger(__name__)
+
+
+def aggregate(trades: pd.DataFrame) -> pd.DataFrame:
+    """Quantity, notional and number of trades per ISIN, venue and `BUCKET`."""
+    traded_at = trades["TradingDateTime"]
+    if traded_at.dt.tz is not None:
+        traded_at = traded_at.dt.tz_convert(TIMEZONE).dt.tz_localize(None)
+    return (
+        trades.assign(Bucket=traded_at.dt.floor(BUCKET))
+        .groupby(
+            ["MifidInstrumentID", "VenueOfPublication", "Bucket"],
+            as_index=False,
+        )
+        .agg(
+            Quantity=("MifidQuantity", "sum"),
+            Notional=("MifidNotionalAmount", "sum"),
+            Trades=("MifidNotionalAmount", "size"),
+        )
+        .rename(columns={"MifidInstrumentID": "ISIN", "VenueOfPublication": "Venue"})
+        .round({"Quantity": 2, "Notional": 2})
+    )
+
+
+def write_day(buckets: pd.DataFrame, path: Path) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(
+        pa.Table.from_pandas(buckets, schema=SCHEMA, preserve_index=False),
+        tmp_path,
+        compression="zstd",
+    )
+    tmp_path.replace(path)
+
+
+def days(folder: Path = INTRADAY_FOLDER) -> list[date]:
+    return sorted(date.fromisoformat(path.stem) for path in folder.glob("*.parquet"))
+
+
+def load(
+    start: date,
+    end: date,
+    isins: Sequence[str] | None = None,
+    folder: Path = INTRADAY_FOLDER,
+) -> pd.DataFrame:
+    """Read the buckets of the days from `start` to `end`, optionally for some ISINs."""
+    paths = [folder / f"{day}.parquet" for day in days(folder) if start <= day <= end]
+    if not paths:
+        return SCHEMA.empty_table().to_pandas()
+    return (
+        pq.read_table(
+            paths,
+            schema=SCHEMA,
+            filters=[("ISIN", "in", list(isins))] if isins is not None else None,
+        )
+        .to_pandas()
+        .astype({"ISIN": str, "Venue": str})
+    )
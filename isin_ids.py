@@ -0,0 +1,48 @@
+import logging
+import os
+from collections.abc import Iterable
+from pathlib import Path
+
+import pandas as pd
+
+BASE_FOLDER = Path(__file__).parent
+ISIN_IDS_PATH = BASE_FOLDER / "isin_ids.csv"
+
+logger = logging.getLogger(__name__)
+
+
+def load(path: Path = ISIN_IDS_PATH) -> pd.Series:
+    """ISIN -> id. Ids are int32, assigned once and never reused."""
+    if not path.exists():
+        return pd.Series(
+            dtype="int32",
+            index=pd.Index([], dtype=object, name="ISIN"),
+            name="Id",
+        )
+    ids = pd.read_csv(path, encoding="utf-8-sig", dtype={"ISIN": str, "Id": "int32"})
+    return ids.set_index("ISIN")["Id"]
+
+
+def update(isins: Iterable[str], path: Path = ISIN_IDS_PATH) -> int:
+    """Give an id to every ISIN that doesn't have one yet; return how many were added.
+
+    New ISINs are numbered after the last id, in sorted order.
+    """
+    ids = load(path)
+    new = sorted({isin for isin in isins if isinstance(isin, str)} - set(ids.index))
+    if not new:
+        return 0
+    first_id = int(ids.max()) + 1 if len(ids) else 0
+    added = pd.DataFrame(
+        {"ISIN": new, "Id": range(first_id, first_id + len(new))},
+    )
+    # Rewrite rather than append, so a crash can't leave half a line behind
+    tmp_path = path.with_suffix(".tmp")
+    pd.concat([ids.reset_index(), added]).to_csv(
+        tmp_path,
+        index=False,
+        encoding="utf-8-sig",
+    )
+    os.replace(tmp_path, path)
+    logger.info("Assigned ids to %d new ISINs", len(new))
+    return len(new)
@@ -1,18 +1,22 @@
+import argparse
 import contextlib
 import csv
+import json
 import logging
+import os
 import random
-import shutil
-import tempfile
+import threading
 import time
-import zipfile
 from collections import Counter
-from collections.abc import Sequence
-from datetime import date, datetime
+from collections.abc import Callable, Collection, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import UTC, date, datetime
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 from typing import TypedDict
 
+import lxml.etree
+import lxml.html
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
@@ -20,6 +24,19 @@ from bs4 import BeautifulSoup
 # Import your models
 from tqdm import tqdm
 
+import archive
+import intraday
+import isin_ids
+import metrics
+import pipeline
+import profiling
+import rate_control
+import raw_store
+import schedules
+import search
+import snapshot
+import timeseries
+
 BASE_FOLDER = Path(__file__).parent
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
@@ -29,11 +46,26 @@ USER_AGENTS = [
     "Mozilla/5.0 (Linux; Android 11; SM-G960U) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.72 Mobile Safari/537.36",
 ]
 
-URLS = [
-    "https://live.euronext.com/en/ajax/getFactsheetInfoBlock/WARRT/{}-{}/fs_generalinfo_warrants_block",
-    "https://live.euronext.com/en/ajax/getFactsheetInfoBlock/WARRT/{}-{}/fs_underlying_block",
+# Base URLs can point elsewhere (e.g. `benchmarks.replay_server`) through the
+# environment, or at runtime with `set_base_urls`
+EURONEXT_BASE_URL = os.environ.get("EURONEXT_BASE_URL", "https://live.euronext.com")
+CD_BASE_URL = os.environ.get("CD_BASE_URL", "https://www.certificatiederivati.it")
+DOWNLOAD_BASE_URL = os.environ.get(
+    "DOWNLOAD_BASE_URL",
+    "https://marketdata.euronext.com",
+)
+URL_PATHS = [
+    "/en/ajax/getFactsheetInfoBlock/WARRT/{}-{}/fs_generalinfo_warrants_block",
+    "/en/ajax/getFactsheetInfoBlock/WARRT/{}-{}/fs_underlying_block",
 ]
+URLS = [EURONEXT_BASE_URL + path for path in URL_PATHS]
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "60"))
 FORCE_OFFLINE = False
+# Column of the scrape results of `shards` workers: when each product was fetched
+FETCHED_AT = "Fetched At"
+
+# Called as progress(stage, done, total) while `update_all` runs
+ProgressCallback = Callable[[str, int, int], None]
 
 Product = TypedDict(
     "Product",
@@ -75,8 +107,63 @@ class TqdmLoggingHandler(logging.Handler):
 logger = logging.getLogger(__name__)
 
 
-def default_wait_time_gen() -> float:
-    return random.random() * 2 + 1
+def set_base_urls(
+    euronext: str | None = None,
+    cd: str | None = None,
+    download: str | None = None,
+) -> None:
+    """Send the scraper and the download to other hosts, e.g. a local replay server."""
+    global EURONEXT_BASE_URL, CD_BASE_URL, DOWNLOAD_BASE_URL, URLS
+    EURONEXT_BASE_URL = euronext or EURONEXT_BASE_URL
+    CD_BASE_URL = cd or CD_BASE_URL
+    DOWNLOAD_BASE_URL = download or DOWNLOAD_BASE_URL
+    URLS = [EURONEXT_BASE_URL + path for path in URL_PATHS]
+
+
+MAX_ATTEMPTS = 3
+# Requests of a single product run concurrently: the factsheet blocks and the CD page
+FETCH_POOL = ThreadPoolExecutor(
+    max_workers=len(URL_PATHS) + 1,
+    thread_name_prefix="fetch",
+)
+# Fetch the CD page along with the factsheet when at least this share of known
+# products with the same ISIN prefix have an EUSIPA code
+SPECULATIVE_CD_MIN_SHARE = 0.5
+
+
+def fetch(url: str, rates: rate_control.RateController) -> requests.Response:
+    """GET `url` at the pace set by `rates`, retrying timeouts, 429s and 5xx.
+
+    Raises the last `requests.RequestException` once the attempts are exhausted;
+    the response of the last attempt is returned as is otherwise.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        rates.wait(url)
+        metrics.http_request(url)
+        start = time.perf_counter()
+        try:
+            r = requests.get(url, headers=get_headers(), timeout=REQUEST_TIMEOUT)
+        except (requests.Timeout, requests.ConnectionError):
+            rates.record(url, None, time.perf_counter() - start)
+            metrics.count("throttled_responses")
+            logger.info("Ci stanno tracciando! Stacca, stacca!")
+            if attempt == MAX_ATTEMPTS:
+                raise
+            continue
+        retry_after = r.headers.get("Retry-After", "")
+        rates.record(
+            url,
+            r.status_code,
+            time.perf_counter() - start,
+            retry_after=float(retry_after) if retry_after.isdigit() else None,
+        )
+        if not rate_control.is_throttled(r.status_code):
+            return r
+        metrics.count("throttled_responses")
+        if attempt == MAX_ATTEMPTS:
+            return r
 
 
 def load_from_csv_to_db(csv_path: Path) -> dict[str, dict[str, str]]:
@@ -166,16 +253,9 @@ def determine_frequency(dates: Sequence[date]) -> str:
     common_diff_days = most_common_diff[0][0]
 
     # Map common differences to frequencies with a small tolerance
-    if 4 <= common_diff_days <= 10:  # Around 7 days
-        return "Weekly"
-    if 26 <= common_diff_days <= 35:  # Around 30 days
-        return "Monthly"
-    if 80 <= common_diff_days <= 100:  # Around 90-91 days (3 months)
-        return "Quarterly"
-    if 160 <= common_diff_days <= 200:  # Around 182-183 days (6 months)
-        return "Semiannual"
-    if 350 <= common_diff_days <= 380:  # Around 365 days (12 months)
-        return "Annual"
+    for frequency, (low, high) in schedules.FREQUENCY_BANDS.items():
+        if low <= common_diff_days <= high:
+            return frequency
     return f"Irregular (most common diff: {common_diff_days} days)"
 
 
@@ -265,6 +345,7 @@ def parse_cd(soup: BeautifulSoup) -> dict[str, str | None]:
         coupon_dates = []
         coupon_amounts = []
         autocall_schedule_entries = []
+        schedule: list[schedules.ScheduleRow] = []
 
         for row in coupon_autocall_table.find("tbody").find_all("tr"):
             cells = row.find_all("td")
@@ -274,16 +355,17 @@ def parse_cd(soup: BeautifulSoup) -> dict[str, str | None]:
                 coupon_text = cells[coupon_idx].get_text(strip=True)
 
                 parsed_date = parse_date(date_str)
+                coupon = None
                 if parsed_date and coupon_text:  # Get the first non-empty coupon rate
                     coupon_dates.append(parsed_date)
                     with contextlib.suppress(ValueError):
-                        coupon_amounts.append(
-                            float(
-                                coupon_text.replace("%", "").replace(",", ".").strip(),
-                            ),
+                        coupon = float(
+                            coupon_text.replace("%", "").replace(",", ".").strip(),
                         )
+                        coupon_amounts.append(coupon)
 
                 # Extract Autocall Data
+                autocall_trigger = None
                 autocall_trigger_text = cells[trigger_autocall_idx].get_text(strip=True)
                 if autocall_trigger_text:  # Only record if autocall trigger is present
                     try:
@@ -298,31 +380,23 @@ def parse_cd(soup: BeautifulSoup) -> dict[str, str | None]:
                     except ValueError:
                         pass  # Ignore unparseable autocall triggers
 
+                if parsed_date or coupon is not None or autocall_trigger is not None:
+                    schedule.append(
+                        {
+                            "Date": parsed_date,
+                            "Coupon": coupon,
+                            "Autocall Trigger": autocall_trigger,
+                        },
+                    )
+
         coupon_frequency = determine_frequency(coupon_dates)
         coupon_amount = (
             sum(coupon_amounts) / len(coupon_amounts) if coupon_amounts else None
         )
 
-        if coupon_amount:
-            multiplier = 1
-            if "Weekly" in coupon_frequency:
-                multiplier = 52
-            elif "Monthly" in coupon_frequency:
-                multiplier = 12
-            elif "Quarterly" in coupon_frequency:
-                multiplier = 4
-            elif "Semiannual" in coupon_frequency:
-                multiplier = 2
-            elif "Annual" in coupon_frequency:
-                multiplier = 1
-            # If irregular or unknown, can't derive annual rate easily
-            elif "Irregular" in coupon_frequency or "N/A" in coupon_frequency:
-                coupon_pa = f"N/A (Irregular/Unknown Coupon Frequency), Period Rate: {coupon_amounts[0]:.2f}%"
-
-            if isinstance(coupon_pa, str):  # If it's already a descriptive string
-                pass
-            else:
-                coupon_pa = coupon_amount * multiplier
+        # If irregular or unknown, can't derive annual rate easily
+        if coupon_amount and coupon_frequency in schedules.PERIODS_PER_YEAR:
+            coupon_pa = coupon_amount * schedules.PERIODS_PER_YEAR[coupon_frequency]
 
         # Sort autocall entries by date for correct decrement calculation
         autocall_schedule_entries.sort(
@@ -366,9 +440,38 @@ def parse_cd(soup: BeautifulSoup) -> dict[str, str | None]:
         "Autocall Decrement": autocall_decrement,
         "Autocall Initial Trigger": initial_autocall_trigger,
         "Barrier": get_barriera(soup) or minimum_autocall_trigger,
+        # Every row of the table, for `schedules`: not part of the product record
+        "Schedule": schedule,
     }
 
 
+def _has_class(name: str) -> str:
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+_CD_PANEL = f"div[{_has_class('panel-info')} or {_has_class('panel-default')}]"
+# Outermost panels only: nested panels come along with their parent
+CD_PANELS_XPATH = f"//{_CD_PANEL}[not(ancestor::{_CD_PANEL})]"
+
+
+def parse_cd_page(text: str) -> dict[str, str | None]:
+    """Run `parse_cd` on the panels of a CD page only.
+
+    lxml finds every panel in one pass over its C tree, and only those subtrees
+    ("Scheda Sottostante", "Barriera", "Date rilevamento" and a few more) are
+    turned into BeautifulSoup objects, instead of the whole page.
+    """
+    try:
+        root = lxml.html.fromstring(text)
+    except lxml.etree.ParserError:  # empty page
+        return parse_cd(BeautifulSoup("", "lxml"))
+    panels = "".join(
+        lxml.html.tostring(panel, encoding="unicode")
+        for panel in root.xpath(CD_PANELS_XPATH)
+    )
+    return parse_cd(BeautifulSoup(panels, "lxml"))
+
+
 def get_sottostanti(soup: BeautifulSoup) -> str | None:
     companies = []
 
@@ -400,35 +503,49 @@ def get_sottostanti(soup: BeautifulSoup) -> str | None:
     return "/".join(companies) if companies else None
 
 
-def extract_from_cd(isin: str) -> tuple[dict[str, str | None], bool]:
+def fetch_cd_page(isin: str, rates: rate_control.RateController) -> str | None:
+    """Download the CD page of `isin` into the `cd` cache; None if the request fails."""
+    url = f"{CD_BASE_URL}/db_bs_scheda_certificato.asp?isin={isin}"
+    try:
+        r = fetch(url, rates)
+        r.raise_for_status()
+    except requests.RequestException as e:
+        logger.info(
+            "Error fetching data for ISIN %s from CD: %s",
+            repr(isin),
+            repr(e),
+        )
+        return None
     folder = BASE_FOLDER / "cd"
     folder.mkdir(parents=True, exist_ok=True)
-    file = folder / f"{isin}.txt"
-    made_request = False
-    if file.exists():
-        soup = BeautifulSoup(file.read_text(encoding="utf-8"), "lxml")
+    (folder / f"{isin}.txt").write_text(r.text, encoding="utf-8")
+    return r.text
+
+
+def extract_from_cd(
+    isin: str,
+    rates: rate_control.RateController,
+    prefetched: Future[str | None] | None = None,
+) -> dict[str, str | None]:
+    file = BASE_FOLDER / "cd" / f"{isin}.txt"
+    if prefetched is not None:
+        metrics.cache_lookup("cd", hit=False)
+        text = prefetched.result()
+    elif file.exists():
+        metrics.cache_lookup("cd", hit=True)
+        text = file.read_text(encoding="utf-8")
     elif FORCE_OFFLINE:
-        return {}, made_request
+        return {}
     else:
-        try:
-            r = requests.get(
-                f"https://www.certificatiederivati.it/db_bs_scheda_certificato.asp?isin={isin}",
-                headers=get_headers(),
-                timeout=60,
-            )
-            made_request = True
-            r.raise_for_status()
-        except requests.RequestException as e:
-            logger.info(
-                "Error fetching data for ISIN %s from CD: %s",
-                repr(isin),
-                repr(e),
-            )
-            return {}, made_request
-        file.write_text(r.text, encoding="utf-8")
-        soup = BeautifulSoup(r.text, "lxml")
+        metrics.cache_lookup("cd", hit=False)
+        text = fetch_cd_page(isin, rates)
+    if text is None:
+        return {}
 
-    return parse_cd(soup), made_request
+    with metrics.parse_timer("cd"):
+        data = parse_cd_page(text)
+    schedules.collect(isin, data.pop("Schedule", []))
+    return data
 
 
 def get_headers() -> dict[str, str]:
@@ -448,70 +565,104 @@ def get_headers() -> dict[str, str]:
     }
 
 
+def fetch_factsheet(
+    isin: str,
+    mkt: str,
+    rates: rate_control.RateController,
+) -> str | None:
+    """Download the factsheet blocks of `isin` concurrently, joined in `URLS` order."""
+    responses = [
+        FETCH_POOL.submit(fetch, url_to_fill.format(isin, mkt), rates)
+        for url_to_fill in URLS
+    ]
+    whole_data = ""
+    for response in responses:
+        try:
+            r = response.result()
+            r.raise_for_status()
+        except requests.RequestException:
+            logger.info("Error for ISIN %s %s, skipping...", repr(isin), repr(mkt))
+            return None
+        whole_data += r.text
+    return whole_data.strip()
+
+
+def eusipa_share_by_prefix(
+    already_loaded: dict[str, dict[str, str]],
+) -> dict[str, float]:
+    """Share of known products with an EUSIPA code, by ISIN country prefix."""
+    totals: Counter[str] = Counter()
+    with_code: Counter[str] = Counter()
+    for isin, row in already_loaded.items():
+        totals[isin[:2]] += 1
+        with_code[isin[:2]] += bool(row.get("EUSIPA Code"))
+    return {prefix: with_code[prefix] / total for prefix, total in totals.items()}
+
+
 def extract_data_for_isin(
     isin: str,
     mkt: str,
     already_loaded: dict[str, dict[str, str]],
+    rates: rate_control.RateController,
+    *,
+    prefetch_cd: bool = True,
 ) -> Product | None:
+    """Scrape the product info of `isin`, from the caches when possible.
+
+    On a cache miss the factsheet blocks are fetched concurrently and, if
+    `prefetch_cd`, so is the CD page, before knowing whether the EUSIPA code
+    calls for it.
+    """
     if isin.strip() in already_loaded:
         return already_loaded[isin]
 
     folder = BASE_FOLDER / "isins"
     folder.mkdir(parents=True, exist_ok=True)
     file = folder / f"{isin}.txt"
-    t = None
+    cd_page = None
     if file.exists():
-        soup = BeautifulSoup(file.read_text(encoding="utf-8"), "lxml")
+        metrics.cache_lookup("isins", hit=True)
+        whole_data = file.read_text(encoding="utf-8")
     elif FORCE_OFFLINE:
         return None
     else:
-        whole_data = ""
-        for url_to_fill in URLS:
-            url = url_to_fill.format(isin, mkt)
-            try:
-                r = requests.get(url, headers=get_headers(), timeout=60)
-                r.raise_for_status()
-            except requests.exceptions.ReadTimeout:
-                logger.info("Ci stanno tracciando! Stacca, stacca!")
-                time.sleep(30)
-                r = requests.get(url, headers=get_headers(), timeout=60)
-            except requests.exceptions.HTTPError:
-                logger.info("Error for ISIN %s %s, skipping...", repr(isin), repr(mkt))
-                return None
-            whole_data += r.text
-        whole_data = whole_data.strip()
+        metrics.cache_lookup("isins", hit=False)
+        if prefetch_cd and not (BASE_FOLDER / "cd" / f"{isin}.txt").exists():
+            cd_page = FETCH_POOL.submit(fetch_cd_page, isin, rates)
+        whole_data = fetch_factsheet(isin, mkt, rates)
+        if whole_data is None:
+            return None
         file.write_text(whole_data, encoding="utf-8")
+
+    with metrics.parse_timer("euronext"):
         soup = BeautifulSoup(whole_data, "lxml")
-        t = default_wait_time_gen()
-        time.sleep(t)
-
-    val: Product = {
-        "ISIN": isin,
-        "Nome": extract_from_title(soup, "Product"),
-        "Strategy": extract_from_title(soup, "Strategy"),
-        "EUSIPA Code": extract_from_title(soup, "EUSIPA Code"),
-        "EUSIPA Name": extract_from_title(soup, "EUSIPA Name"),
-        "Issue Price": extract_from_title(soup, "Issue Price"),
-        "Emittente": extract_from_title(
-            soup,
-            ["Nom de l'émetteur", "Issuer Name", "Nom émetteur"],
-        ),
-        "Issue Date": extract_from_title(
-            soup,
-            "Issue Date",
-            datetime_format="%d/%m/%Y",
-        ),
-        "Expiry Date": extract_from_title(
-            soup,
-            "Expiry Date",
-            datetime_format="%d/%m/%Y",
-        ),
-    }
+        val: Product = {
+            "ISIN": isin,
+            "Nome": extract_from_title(soup, "Product"),
+            "Strategy": extract_from_title(soup, "Strategy"),
+            "EUSIPA Code": extract_from_title(soup, "EUSIPA Code"),
+            "EUSIPA Name": extract_from_title(soup, "EUSIPA Name"),
+            "Issue Price": extract_from_title(soup, "Issue Price"),
+            "Emittente": extract_from_title(
+                soup,
+                ["Nom de l'émetteur", "Issuer Name", "Nom émetteur"],
+            ),
+            "Issue Date": extract_from_title(
+                soup,
+                "Issue Date",
+                datetime_format="%d/%m/%Y",
+            ),
+            "Expiry Date": extract_from_title(
+                soup,
+                "Expiry Date",
+                datetime_format="%d/%m/%Y",
+            ),
+        }
     if val["EUSIPA Code"]:  # and val["EUSIPA_Code"].startswith("1"):
-        data, made_cd_request = extract_from_cd(isin)
-        val.update(data)
-        if made_cd_request is True and t is None:
-            time.sleep(default_wait_time_gen())
+        val.update(extract_from_cd(isin, rates, prefetched=cd_page))
+    if cd_page is not None:
+        # A page fetched for nothing still stays in the cache
+        metrics.count(f"cd_prefetch_{'used' if val['EUSIPA Code'] else 'wasted'}")
 
     if not val.get("Sottostanti"):
         val["Sottostanti"] = extract_from_title(soup, "Name")
@@ -525,33 +676,78 @@ def write_csv_to_isin_info(
     isin_and_mkt: list[tuple[str, str]],
     isin_info_path: Path,
     already_loaded: dict[str, dict[str, str]],
+    progress: ProgressCallback | None = None,
+    *,
+    fetched_at: bool = False,
 ) -> None:
+    """Scrape the products of `isin_and_mkt` not in `already_loaded` and append them
+    to `isin_info_path`, with the `FETCHED_AT` time too if `fetched_at`."""
     old_isins = set(already_loaded.keys())
     isins_to_write = [
         (isin, mkt) for isin, mkt in isin_and_mkt if isin not in old_isins
     ]
     file_exists = isin_info_path.exists()
     with isin_info_path.open(mode="a+", newline="", encoding="utf-8-sig") as file:
+        fieldnames = [key.replace("_", " ") for key in Product.__annotations__]
         writer = csv.DictWriter(
             file,
-            fieldnames=[
-                key.replace("_", " ") for key in Product.__annotations__.keys()
-            ],
+            fieldnames=[*fieldnames, FETCHED_AT] if fetched_at else fieldnames,
         )
         if not file_exists:
             writer.writeheader()
-        for isin, mkt in tqdm(
-            isins_to_write,
-            bar_format="{l_bar}{bar}| {n:,}/{total:,} [{elapsed}<{remaining}, {rate_fmt}]",
-        ):
-            output = extract_data_for_isin(
-                isin=isin,
-                mkt=mkt,
-                already_loaded=already_loaded,
-            )
-            if output is None:
-                continue
-            writer.writerow(output)
+        rates = rate_control.RateController(BASE_FOLDER / "rate_state.json")
+        eusipa_shares = eusipa_share_by_prefix(already_loaded)
+        try:
+            for n, (isin, mkt) in enumerate(
+                tqdm(
+                    isins_to_write,
+                    bar_format="{l_bar}{bar}| {n:,}/{total:,} [{elapsed}<{remaining}, {rate_fmt}]",
+                ),
+            ):
+                if progress:
+                    progress("scrape", n, len(isins_to_write))
+                output = extract_data_for_isin(
+                    isin=isin,
+                    mkt=mkt,
+                    already_loaded=already_loaded,
+                    rates=rates,
+                    prefetch_cd=eusipa_shares.get(isin[:2], 1.0)
+                    >= SPECULATIVE_CD_MIN_SHARE,
+                )
+                if output is None:
+                    continue
+                if fetched_at:
+                    now = datetime.now(UTC).isoformat(timespec="seconds")
+                    output = {**output, FETCHED_AT: now}
+                writer.writerow(output)
+                metrics.count("isin_info_rows_written")
+        finally:
+            rates.save()
+            schedules.save_collected(BASE_FOLDER / "schedules.parquet")
+        if progress:
+            progress("scrape", len(isins_to_write), len(isins_to_write))
+
+
+def backfill_schedules(isin_info_path: Path, schedules_path: Path) -> None:
+    """Build the schedule table from the cached CD pages, if it doesn't exist yet.
+
+    Afterwards, schedules are added as products are scraped.
+    """
+    if schedules_path.exists() or not isin_info_path.exists():
+        return
+    known = set(
+        pd.read_csv(isin_info_path, encoding="utf-8-sig", usecols=["ISIN"])["ISIN"],
+    )
+    pages = [
+        page
+        for page in sorted((BASE_FOLDER / "cd").glob("*.txt"))
+        if page.stem in known
+    ]
+    logger.info("Parsing schedules from %d cached CD pages...", len(pages))
+    for page in tqdm(pages):
+        data = parse_cd_page(page.read_text(encoding="utf-8"))
+        schedules.collect(page.stem, data.get("Schedule", []))
+    schedules.save_collected(schedules_path)
 
 
 def update_mappings(
@@ -586,53 +782,75 @@ def update_mappings(
     )
 
 
-def summarize_csvs(input_folder: Path, output_folder: Path) -> None:
-    for input_file in input_folder.iterdir():
-        output_file = output_folder / input_file.with_suffix(".csv").name
-        if (
-            output_file.exists()
-            and input_file.stat().st_mtime < output_file.stat().st_mtime
-        ):
-            logger.info("%s already exists, skipping...", repr(output_file.name))
-            continue
-        with tempfile.TemporaryDirectory() as tmpdir:
-            with zipfile.ZipFile(input_file, "r") as z:
-                z.extractall(tmpdir)
-
-            # Construct full paths
-            src_path = Path(tmpdir) / "Trades_WarrantCertificates.csv"
-            input_df = pd.read_csv(
-                src_path,
-                header=1,
-                parse_dates=[1, 2, 3],
-                date_format="ISO8601",
-                dtype={18: str},
-            )
+def summarize_csvs(
+    raw_folder: Path,
+    output_folder: Path,
+    intraday_folder: Path | None = None,
+) -> None:
+    """Sum each day's trades by ISIN and venue into `output_folder`.
+
+    With `intraday_folder`, the same read also fills it with `intraday.BUCKET`
+    aggregates. Only the days whose trades changed in the raw store since they
+    were summarized into `output_folder`, or whose outputs are missing, are read.
+    """
+    # Manifest each day of `output_folder` was summarized from
+    state_path = raw_folder / "summarized" / f"{output_folder.name}.json"
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    summarized = (
+        json.loads(state_path.read_text(encoding="utf-8"))
+        if state_path.exists()
+        else {}
+    )
+    manifest_keys = {
+        day: raw_store.manifest_key(manifest)
+        for day, manifest in raw_store.manifests(raw_folder).items()
+    }
+    stale = {}
+    for day, key in manifest_keys.items():
+        outputs = [output_folder / f"{day}.csv"]
+        if intraday_folder is not None:
+            outputs.append(intraday_folder / f"{day}.parquet")
+        if summarized.get(day) != key:
+            stale[day] = outputs
+        elif missing := [file for file in outputs if not file.exists()]:
+            stale[day] = missing
+    logger.info(
+        "%d days to summarize, %d up to date",
+        len(stale),
+        len(manifest_keys) - len(stale),
+    )
+
+    for day, input_df in raw_store.read_days(
+        stale,
+        raw_folder,
+        parse_dates=[1, 2, 3],
+        date_format="ISO8601",
+        dtype={18: str},
+    ):
         input_df["DayEvent"] = input_df["TradingDateTime"].dt.date
-        input_df = (
-            input_df.loc[
-                (input_df["VenueOfPublication"].isin(["ETLX", "SEDX"]))
-                & (
-                    input_df["TradingDateTime"].dt.strftime("%Y-%m-%d")
-                    == input_file.stem
-                )
-            ]
-            .pivot_table(
-                index=["MifidInstrumentID", "VenueOfPublication", "DayEvent"],
-                values=["MifidQuantity", "MifidNotionalAmount"],
-                aggfunc="sum",
-            )
-            .round(2)
-        )
-        input_df.to_csv(output_file, encoding="utf-8-sig")
-        logger.info("Created %s", repr(output_file.name))
+        input_df = input_df.loc[input_df["VenueOfPublication"].isin(["ETLX", "SEDX"])]
+        for file in stale[day]:
+            if file.suffix == ".csv":
+                daily = input_df.pivot_table(
+                    index=["MifidInstrumentID", "VenueOfPublication", "DayEvent"],
+                    values=["MifidQuantity", "MifidNotionalAmount"],
+                    aggfunc="sum",
+                ).round(2)
+                daily.to_csv(file, encoding="utf-8-sig")
+                metrics.count("intermediate_rows_written", len(daily))
+            else:
+                intraday.write_day(intraday.aggregate(input_df), file)
+            logger.info("Created %s", repr(file.name))
+        summarized[day] = manifest_keys[day]
+        tmp_path = state_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(summarized), encoding="utf-8")
+        tmp_path.replace(state_path)
 
 
 def download_file(save_folder: Path) -> None:
     zip_path = BASE_FOLDER / "downloaded_file.zip"
 
-    url = "https://marketdata.euronext.com/data-reporting-service/trades-file/download"
-    original_filename = "Trades_WarrantCertificates.csv"
+    url = f"{DOWNLOAD_BASE_URL}/data-reporting-service/trades-file/download"
 
     data = {
         "userID": "753530",
@@ -641,7 +859,8 @@ def download_file(save_folder: Path) -> None:
     }
 
     logger.info("Downloading newest file...")
-    response = requests.post(url, data=data, timeout=60)
+    metrics.http_request(url)
+    response = requests.post(url, data=data, timeout=REQUEST_TIMEOUT)
 
     response.raise_for_status()
 
@@ -649,29 +868,7 @@ def download_file(save_folder: Path) -> None:
         f.write(response.content)
     logger.info("Download completed")
 
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with zipfile.ZipFile(zip_path, "r") as z:
-            z.extractall(tmpdir)
-
-        # Construct full paths
-        src_path = Path(tmpdir) / original_filename
-        all_days = (
-            pd.read_csv(
-                src_path,
-                header=1,
-                parse_dates=[1, 2, 3],
-                date_format="ISO8601",
-                dtype={18: str},
-            )["TradingDateTime"]
-            .dt.strftime("%Y-%m-%d")
-            .drop_duplicates()
-        )
-    logger.info("Found the following days in the file: %s", all_days.tolist())
-    for day in all_days:
-        dst_path = save_folder / f"{day}.zip"
-        shutil.copy(zip_path, dst_path)
-        logger.info("Copied file to %s", dst_path.relative_to(BASE_FOLDER))
-
+    raw_store.store(zip_path, save_folder)
     zip_path.unlink(missing_ok=True)
 
 
@@ -696,6 +893,7 @@ def create_underlying_table(isin_info_path: Path, output_path: Path) -> None:
     df_long["Sottostante"] = df_long["Sottostante"].str.strip()
 
     df_long.to_csv(output_path, index=False, encoding="utf-8-sig")
+    metrics.count("underlying_rows_written", len(df_long))
 
 
 def update_generic_mapping(
@@ -774,65 +972,308 @@ def update_generic_mapping(
 
     mapping_df = pd.concat([mapping_df, new_names])
     mapping_df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    metrics.count("mapping_rows_added", len(new_names))
 
 
-def update_all() -> None:
-    input_folder = BASE_FOLDER / "input_csv"
+def update_stages(progress: ProgressCallback | None = None) -> list[pipeline.Stage]:
+    """The stages of `update_all`, in order, with the files each reads and writes."""
+    raw_folder = BASE_FOLDER / "raw"
     intermediate_folder = BASE_FOLDER / "intermediate_csv"
+    intraday_folder = BASE_FOLDER / "intraday"
+    timeseries_folder = BASE_FOLDER / "timeseries"
     isin_info_path = BASE_FOLDER / "isin_info.csv"
     type_and_subtype_path = BASE_FOLDER / "type_and_subtype.csv"
     underlyings_path = BASE_FOLDER / "underlyings.csv"
     und_mapping_path = BASE_FOLDER / "und_mapping.csv"
     issuers_path = BASE_FOLDER / "issuers.csv"
+    schedules_path = BASE_FOLDER / "schedules.parquet"
+    isin_info_archive_path = BASE_FOLDER / "isin_info_archive.csv"
+    underlyings_archive_path = BASE_FOLDER / "underlyings_archive.csv"
+    mapping_paths = (type_and_subtype_path, issuers_path, und_mapping_path)
+
+    def summarize() -> None:
+        intermediate_folder.mkdir(parents=True, exist_ok=True)
+        intraday_folder.mkdir(parents=True, exist_ok=True)
+        summarize_csvs(
+            raw_folder=raw_folder,
+            output_folder=intermediate_folder,
+            intraday_folder=intraday_folder,
+        )
 
-    input_folder.mkdir(parents=True, exist_ok=True)
-    intermediate_folder.mkdir(parents=True, exist_ok=True)
+    def update_isin_ids() -> None:
+        isin_and_mkt = extract_isins_from_csvs(path=intermediate_folder)
+        isin_ids.update(
+            (isin for isin, _ in isin_and_mkt),
+            path=BASE_FOLDER / "isin_ids.csv",
+        )
 
-    # 1. download newest file, saves the .zip in 'input_csv' with name as day
-    if not FORCE_OFFLINE:
-        download_file(save_folder=input_folder)
+    def scrape() -> None:
+        # Archived products are known as well
+        isin_and_mkt = extract_isins_from_csvs(path=intermediate_folder)
+        archived = archive.archived_isins(isin_info_archive_path)
+        write_csv_to_isin_info(
+            isin_and_mkt=[
+                (isin, mkt) for isin, mkt in isin_and_mkt if isin not in archived
+            ],
+            isin_info_path=isin_info_path,
+            already_loaded=load_from_csv_to_db(csv_path=isin_info_path),
+            progress=progress,
+        )
 
-    # 2. summarize CSVs and extract market (ETLX or SEDX)
-    summarize_csvs(input_folder=input_folder, output_folder=intermediate_folder)
-    isin_and_mkt = extract_isins_from_csvs(path=intermediate_folder)
+    def archive_expired() -> None:
+        moved = archive.update(
+            isin_info_path=isin_info_path,
+            archive_path=isin_info_archive_path,
+            intermediate_folder=intermediate_folder,
+        )
+        if isin_info_archive_path.exists() and (
+            moved or not underlyings_archive_path.exists()
+        ):
+            create_underlying_table(
+                isin_info_path=isin_info_archive_path,
+                output_path=underlyings_archive_path,
+            )
 
-    # 3. load existing ISIN info
-    loaded_isins = load_from_csv_to_db(csv_path=isin_info_path)
+    stages = [
+        # 1. download newest file, stores its days in 'raw'
+        pipeline.Stage(
+            "download",
+            lambda: download_file(save_folder=raw_folder),
+            outputs=(raw_folder / "manifests",),
+            always=True,
+        ),
+        # 2. summarize CSVs and extract market (ETLX or SEDX)
+        pipeline.Stage(
+            "summarize",
+            summarize,
+            inputs=(raw_folder / "manifests",),
+            outputs=(intermediate_folder, intraday_folder),
+        ),
+        pipeline.Stage(
+            "isins",
+            update_isin_ids,
+            inputs=(intermediate_folder,),
+            outputs=(BASE_FOLDER / "isin_ids.csv",),
+        ),
+        pipeline.Stage(
+            "schedules",
+            lambda: backfill_schedules(
+                isin_info_path=isin_info_path,
+                schedules_path=schedules_path,
+            ),
+            outputs=(schedules_path,),
+        ),
+        # 3. compiles 'isin_info.csv', scraping the products it doesn't have yet
+        pipeline.Stage(
+            "scrape",
+            scrape,
+            inputs=(intermediate_folder, isin_info_path, isin_info_archive_path),
+            outputs=(isin_info_path, schedules_path),
+        ),
+        # the schedule metrics of 'isin_info.csv', from the schedules as stored
+        pipeline.Stage(
+            "schedule_metrics",
+            lambda: schedules.recompute_isin_info(
+                isin_info_path=isin_info_path,
+                schedules_path=schedules_path,
+            ),
+            inputs=(schedules_path,),
+            outputs=(isin_info_path,),
+        ),
+        # 4. move long expired products out of 'isin_info.csv', so that the
+        # following stages and the dashboard only go through the live ones
+        pipeline.Stage(
+            "archive",
+            archive_expired,
+            inputs=(isin_info_path, isin_info_archive_path, intermediate_folder),
+            outputs=(isin_info_path, isin_info_archive_path, underlyings_archive_path),
+        ),
+        # 5. create table for ISIN -> underlyings
+        pipeline.Stage(
+            "underlyings",
+            lambda: create_underlying_table(
+                isin_info_path=isin_info_path,
+                output_path=underlyings_path,
+            ),
+            inputs=(isin_info_path,),
+            outputs=(underlyings_path,),
+        ),
+        # 6. update existing CSVs with newly scraped data; the mappings are edited
+        # by hand too, so a row deleted there is added back
+        pipeline.Stage(
+            "mappings",
+            lambda: update_mappings(
+                isin_info_path=isin_info_path,
+                type_and_subtype_path=type_and_subtype_path,
+                issuers_path=issuers_path,
+                underlyings_path=underlyings_path,
+                und_mapping_path=und_mapping_path,
+            ),
+            inputs=(isin_info_path, underlyings_path, *mapping_paths),
+            outputs=mapping_paths,
+        ),
+        # 7. rolling turnover by ISIN, issuer and underlying, for the new days
+        pipeline.Stage(
+            "timeseries",
+            lambda: timeseries.update(
+                intermediate_folder=intermediate_folder,
+                tables_folder=BASE_FOLDER,
+                folder=timeseries_folder,
+            ),
+            inputs=(
+                intermediate_folder,
+                isin_info_path,
+                underlyings_path,
+                isin_info_archive_path,
+                underlyings_archive_path,
+                *mapping_paths,
+            ),
+            outputs=(timeseries_folder,),
+        ),
+        # 8. search index over the products and their issuer and underlying names
+        pipeline.Stage(
+            "search",
+            lambda: search.build(
+                tables_folder=BASE_FOLDER,
+                timeseries_folder=timeseries_folder,
+                folder=BASE_FOLDER / "search",
+            ),
+            inputs=(
+                isin_info_path,
+                underlyings_path,
+                isin_info_archive_path,
+                underlyings_archive_path,
+                timeseries_folder,
+                *mapping_paths,
+            ),
+            outputs=(BASE_FOLDER / "search",),
+        ),
+        # 9. the dashboard tables and query engine, ready to be memory-mapped. It
+        # checks itself whether the dashboard would see the same data version.
+        pipeline.Stage(
+            "snapshot",
+            lambda: snapshot.build(folder=BASE_FOLDER / "snapshot"),
+            inputs=(
+                intermediate_folder,
+                isin_info_path,
+                underlyings_path,
+                BASE_FOLDER / "isin_ids.csv",
+                isin_info_archive_path,
+                underlyings_archive_path,
+                *mapping_paths,
+            ),
+            outputs=(BASE_FOLDER / "snapshot",),
+            always=True,
+        ),
+    ]
+    if FORCE_OFFLINE:
+        return stages[1:]
+    return stages
 
-    # 4. compiles 'isin_info.csv', scraping additional data, if needed
-    write_csv_to_isin_info(
-        isin_and_mkt=isin_and_mkt,
-        isin_info_path=isin_info_path,
-        already_loaded=loaded_isins,
-    )
 
-    # 5. create table for ISIN -> underlyings
-    create_underlying_table(isin_info_path=isin_info_path, output_path=underlyings_path)
+def update_all(
+    progress: ProgressCallback | None = None,
+    stages: Collection[str] | None = None,
+    *,
+    force: bool = False,
+    jobs: int = pipeline.DEFAULT_JOBS,
+) -> None:
+    """Run the out of date stages of the update, or only those in `stages`.
 
-    # 6. update existing CSVs with newly scraped data
-    update_mappings(
-        isin_info_path=isin_info_path,
-        type_and_subtype_path=type_and_subtype_path,
-        issuers_path=issuers_path,
-        underlyings_path=underlyings_path,
-        und_mapping_path=und_mapping_path,
-    )
+    A stage runs when the content of its inputs changed since its last run, or
+    always with `force`. Stages that don't depend on each other run side by side,
+    unless profiling: each stage gets a profile of its own, one at a time.
+    """
+    if profiling.ENABLED:
+        jobs = 1
+    if progress:
+        # Called from the stages running side by side
+        lock = threading.Lock()
+        report = progress
+
+        def progress(stage: str, done: int, total: int) -> None:
+            with lock:
+                report(stage, done, total)
+
+    @contextlib.contextmanager
+    def stage(name: str) -> Iterator[None]:
+        if progress:
+            progress(name, 0, 1)
+        with metrics.stage(name), profiling.profile(name):
+            yield
+
+    with metrics.record_run(), profiling.run("update"):
+        # Once, for the .zip copies in 'input_csv' from before the raw store
+        input_folder = BASE_FOLDER / "input_csv"
+        if input_folder.exists():
+            raw_store.migrate(input_folder, BASE_FOLDER / "raw")
+
+        ran = pipeline.run(
+            update_stages(progress),
+            BASE_FOLDER / "pipeline_state.json",
+            selected=stages,
+            force=force,
+            jobs=jobs,
+            wrap=stage,
+        )
+        logger.info("Stages run: %s", ran)
 
 
-def main():
+def setup_logging(log_path: Path = BASE_FOLDER / "app.log") -> None:
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(levelname)s - %(message)s",
         handlers=[
             TqdmLoggingHandler(),
             RotatingFileHandler(
-                BASE_FOLDER / "app.log",
+                log_path,
                 maxBytes=5 * 1024 * 1024,  # 5 MB max size per file
                 backupCount=3,  # Keep up to 3 backup files
             ),
         ],
     )
-    update_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the newest trades and update the tables.",
+    )
+    parser.add_argument(
+        "stages",
+        nargs="*",
+        help="run only these stages (default: every stage that is out of date)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="run the stages even if their inputs didn't change",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=pipeline.DEFAULT_JOBS,
+        help="stages run side by side at most (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="list the stages with the ones each waits for, and exit",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile every stage to the 'profiles' folder (same as PROFILE=1)",
+    )
+    args = parser.parse_args()
+    if args.list:
+        deps = pipeline.dependencies(update_stages())
+        for name, waits_for in deps.items():
+            print(f"{name}: {', '.join(sorted(waits_for)) or '-'}")
+        return
+    if args.profile:
+        profiling.enable()
+    setup_logging()
+    update_all(stages=args.stages or None, force=args.force, jobs=args.jobs)
 
 
 if __name__ == "__main__":
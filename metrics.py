@@ -0,0 +1,150 @@
+import json
+import logging
+import statistics
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+import psutil
+
+BASE_FOLDER = Path(__file__).parent
+METRICS_PATH = BASE_FOLDER / "metrics.jsonl"
+
+logger = logging.getLogger(__name__)
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of the process resident memory, in MB."""
+    if sys.platform == "win32":
+        return psutil.Process().memory_info().peak_wset / 1024**2
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+class RunMetrics:
+    """Timings and counters for one `update_all` run."""
+
+    def __init__(self) -> None:
+        self.started_at = datetime.now()
+        self.status = "running"
+        self.stages: list[dict[str, Any]] = []
+        self.counters: Counter[str] = Counter()
+        self.http_requests: Counter[str] = Counter()
+        self.parse_seconds: defaultdict[str, list[float]] = defaultdict(list)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        wall_start = time.perf_counter()
+        # Of the stage's own thread, stages run side by side: what it hands to
+        # other threads, like the page fetches of the scrape, isn't counted
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            self.stages.append(
+                {
+                    "stage": name,
+                    "wall_s": round(time.perf_counter() - wall_start, 3),
+                    "cpu_s": round(time.thread_time() - cpu_start, 3),
+                    # The process peak so far: it can only grow from stage to stage
+                    "peak_rss_mb": round(peak_rss_mb(), 1),
+                },
+            )
+
+    def to_record(self) -> dict[str, Any]:
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "status": self.status,
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "http_requests": dict(self.http_requests),
+            "parse": {
+                kind: {
+                    "pages": len(values),
+                    "total_s": round(sum(values), 3),
+                    "mean_ms": round(statistics.fmean(values) * 1000, 2),
+                    "max_ms": round(max(values) * 1000, 2),
+                }
+                for kind, values in self.parse_seconds.items()
+            },
+        }
+
+
+# The run being recorded, if any: helpers below are no-ops outside of `record_run`
+_current: RunMetrics | None = None
+# Requests of one product are fetched from several threads
+_lock = threading.Lock()
+
+
+@contextmanager
+def record_run(path: Path | None = None) -> Iterator[RunMetrics]:
+    """Collect metrics for the enclosed run and append them to `path` as a JSON line.
+
+    `path` defaults to `METRICS_PATH`.
+    """
+    global _current
+    path = path or METRICS_PATH
+    _current = run = RunMetrics()
+    try:
+        yield run
+        run.status = "succeeded"
+    except BaseException:
+        run.status = "failed"
+        raise
+    finally:
+        _current = None
+        with path.open("a", encoding="utf-8") as file:
+            file.write(json.dumps(run.to_record()) + "\n")
+        logger.info("Run metrics appended to %s", path.name)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    if _current is None:
+        yield
+        return
+    with _current.stage(name):
+        yield
+
+
+def count(name: str, n: int = 1) -> None:
+    if _current is not None:
+        with _lock:
+            _current.counters[name] += n
+
+
+def http_request(url: str) -> None:
+    if _current is not None:
+        with _lock:
+            _current.http_requests[urlsplit(url).hostname or "unknown"] += 1
+
+
+def cache_lookup(cache: str, *, hit: bool) -> None:
+    count(f"{cache}_cache_{'hit' if hit else 'miss'}")
+
+
+@contextmanager
+def parse_timer(kind: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if _current is not None:
+            _current.parse_seconds[kind].append(time.perf_counter() - start)
+
+
+def load_runs(path: Path = METRICS_PATH) -> list[dict[str, Any]]:
+    if not path.exists():
+        return []
+    with path.open(encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
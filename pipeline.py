@@ -0,0 +1,194 @@
+import contextlib
+import hashlib
+import json
+import logging
+import threading
+from collections.abc import Callable, Collection, Sequence
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from pathlib import Path
+
+DEFAULT_JOBS = 4
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A step of the update, with the files and folders it reads and writes.
+
+    A stage runs again only when the content of its inputs changed since it last
+    ran, or its outputs changed since the update it ran in. `always` stages have
+    inputs the fingerprints can't see, like the server the trades come from.
+    """
+
+    name: str
+    run: Callable[[], object]
+    inputs: tuple[Path, ...] = ()
+    outputs: tuple[Path, ...] = ()
+    always: bool = False
+
+
+def _overlap(paths: Collection[Path], others: Collection[Path]) -> bool:
+    return any(
+        path.is_relative_to(other) or other.is_relative_to(path)
+        for path in paths
+        for other in others
+    )
+
+
+def dependencies(stages: Sequence[Stage]) -> dict[str, set[str]]:
+    """Stage -> the earlier stages it waits for.
+
+    A stage waits for every earlier one writing what it reads or writes, or
+    reading what it writes, so stages running side by side never share a file.
+    """
+    deps = {}
+    for i, stage in enumerate(stages):
+        deps[stage.name] = {
+            earlier.name
+            for earlier in stages[:i]
+            if _overlap(earlier.outputs, (*stage.inputs, *stage.outputs))
+            or _overlap(earlier.inputs, stage.outputs)
+        }
+    return deps
+
+
+class _State:
+    """Input fingerprints and outputs of the last run of each stage, saved as JSON.
+
+    File digests are kept with the size and mtime they were computed at, so only
+    files written since are read again.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        data = (
+            json.loads(path.read_text(encoding="utf-8"))
+            if path.exists()
+            else {"files": {}, "stages": {}}
+        )
+        self.files: dict[str, list[str]] = data["files"]
+        self.stages: dict[str, dict] = data["stages"]
+        self.lock = threading.Lock()
+
+    def _file_digest(self, path: Path) -> str:
+        stat = path.stat()
+        key = f"{stat.st_size}:{stat.st_mtime_ns}"
+        with self.lock:
+            cached = self.files.get(str(path))
+        if cached and cached[0] == key:
+            return cached[1]
+        with path.open("rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        with self.lock:
+            self.files[str(path)] = [key, digest]
+        return digest
+
+    def fingerprint(self, paths: Sequence[Path]) -> str:
+        h = hashlib.sha256()
+        for path in paths:
+            if path.is_dir():
+                files = sorted(
+                    file
+                    for file in path.rglob("*")
+                    if file.is_file() and file.suffix != ".tmp"
+                )
+            else:
+                files = [path] if path.exists() else []
+            h.update(f"{path}\0{len(files)}\0".encode())
+            for file in files:
+                h.update(f"{file}\0{self._file_digest(file)}\0".encode())
+        return h.hexdigest()
+
+    def save(self) -> None:
+        with self.lock:
+            files = {
+                name: value for name, value in self.files.items() if Path(name).exists()
+            }
+            data = json.dumps({"files": files, "stages": self.stages})
+            tmp_path = self.path.with_suffix(".tmp")
+            tmp_path.write_text(data, encoding="utf-8")
+            tmp_path.replace(self.path)
+
+
+def run(
+    stages: Sequence[Stage],
+    state_path: Path,
+    *,
+    selected: Collection[str] | None = None,
+    force: bool = False,
+    jobs: int = DEFAULT_JOBS,
+    wrap: Callable[[str], contextlib.AbstractContextManager] | None = None,
+) -> list[str]:
+    """Run the out of date `stages`, independent ones side by side on `jobs` threads.
+
+    With `selected`, only those stages are considered, and with `force` they run
+    even when up to date. `wrap(name)` encloses each stage that runs. Returns the
+    names of the stages that ran. The first failure stops new stages from
+    starting and is raised once the running ones finish.
+    """
+    names = [stage.name for stage in stages]
+    unknown = set(selected or ()) - set(names)
+    if unknown:
+        msg = f"Unknown stages {sorted(unknown)}, available: {names}"
+        raise ValueError(msg)
+    todo = {
+        stage.name: stage
+        for stage in stages
+        if selected is None or stage.name in selected
+    }
+    deps = {name: deps & set(todo) for name, deps in dependencies(stages).items()}
+    state = _State(state_path)
+    ran = []
+
+    def run_stage(stage: Stage) -> None:
+        last = state.stages.get(stage.name)
+        if (
+            not force
+            and not stage.always
+            and last is not None
+            and last["inputs"] == state.fingerprint(stage.inputs)
+            and last["outputs"] == state.fingerprint(stage.outputs)
+        ):
+            logger.info("Stage %r is up to date", stage.name)
+            return
+        with wrap(stage.name) if wrap else contextlib.nullcontext():
+            stage.run()
+        # After the run: a stage may write what it reads
+        inputs = state.fingerprint(stage.inputs)
+        with state.lock:
+            state.stages[stage.name] = {"inputs": inputs, "outputs": None}
+        state.save()
+        ran.append(stage.name)
+
+    done: set[str] = set()
+    succeeded: set[str] = set()
+    running: dict[Future, str] = {}
+    error = None
+    with ThreadPoolExecutor(max_workers=jobs, thread_name_prefix="stage") as pool:
+        while todo or running:
+            if error is None:
+                for name in [name for name in todo if deps[name] <= done]:
+                    running[pool.submit(run_stage, todo.pop(name))] = name
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    logger.error("Stage %r failed", name)
+                    error = error or future.exception()
+                else:
+                    succeeded.add(name)
+                done.add(name)
+
+    # Outputs as the update leaves them, later stages may write them too: only a
+    # change made outside of it makes a stage run again
+    for stage in stages:
+        if stage.name in succeeded and stage.name in state.stages:
+            state.stages[stage.name]["outputs"] = state.fingerprint(stage.outputs)
+    state.save()
+    if error is not None:
+        raise error
+    return ran
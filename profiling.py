@@ -0,0 +1,162 @@
+import cProfile
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from types import FrameType
+from typing import ParamSpec, TypeVar
+
+BASE_FOLDER = Path(__file__).parent
+PROFILES_FOLDER = BASE_FOLDER / "profiles"
+SAMPLE_INTERVAL = 0.005  # seconds between two stack samples
+
+# Set PROFILE=1 (or pass --profile to main.py) to profile; off, every hook is a no-op
+ENABLED = os.environ.get("PROFILE", "").lower() not in ("", "0", "false")
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+
+def enable() -> None:
+    global ENABLED
+    ENABLED = True
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class _StackSampler(threading.Thread):
+    """Sample the stack of one thread, counting identical stacks.
+
+    Unlike cProfile's caller/callee pairs, whole stacks can be drawn as a flame graph.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL) -> None:
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[str] = Counter()
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def write_collapsed(self, path: Path) -> None:
+        """Write the folded format read by flamegraph.pl, speedscope and inferno."""
+        with path.open("w", encoding="utf-8") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(f"{stack} {count}\n")
+
+
+# Folder of the run being profiled, if any: `profile` writes there
+_run_folder: Path | None = None
+# Held while a block is profiled: Python has one profiler per process at a time
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def run(label: str) -> Iterator[Path | None]:
+    """Group the profiles taken inside the block in one timestamped folder."""
+    global _run_folder
+    if not ENABLED:
+        yield None
+        return
+    _run_folder = PROFILES_FOLDER / f"{datetime.now():%Y%m%d-%H%M%S-%f}-{label}"
+    _run_folder.mkdir(parents=True, exist_ok=True)
+    try:
+        yield _run_folder
+    finally:
+        logger.info("Profiles written to %s", _run_folder.relative_to(BASE_FOLDER))
+        _run_folder = None
+
+
+@contextmanager
+def profile(name: str) -> Iterator[None]:
+    """Profile the block with cProfile and a stack sampler.
+
+    Writes `<name>.prof` (for pstats/snakeviz) and `<name>.collapsed` (flame graphs)
+    to the current `run` folder, or to a folder of their own outside of a run. A
+    block starting while another is profiled, e.g. by a second dashboard session,
+    runs unprofiled.
+    """
+    if not ENABLED:
+        yield
+        return
+    if not _profile_lock.acquire(blocking=False):
+        logger.info("Not profiling %s: another profile is running", name)
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler than ours, like `python -m cProfile`
+        _profile_lock.release()
+        logger.info("Not profiling %s: another profiler is active", name)
+        yield
+        return
+    folder = _run_folder or (
+        PROFILES_FOLDER / f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}"
+    )
+    sampler = _StackSampler(threading.get_ident())
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        sampler.stopped.set()
+        sampler.join()
+        try:
+            folder.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(folder / f"{name}.prof")
+            sampler.write_collapsed(folder / f"{name}.collapsed")
+        except OSError:
+            logger.exception("Could not write the profiles of %s", name)
+        else:
+            logger.info(
+                "Profiled %s in %.2f s (%d samples)",
+                name,
+                time.perf_counter() - start,
+                sampler.stacks.total(),
+            )
+
+
+def profiled(name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator form of `profile`.
+
+    Whether to profile is decided when the function is decorated: with profiling off
+    the function is returned untouched.
+    """
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            with profile(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,448 @@
+import logging
+from collections.abc import Sequence
+from dataclasses import dataclass, replace
+from datetime import date, datetime, time
+from pathlib import Path
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+import bitmaps
+import data_service
+import snapshot
+
+logger = logging.getLogger(__name__)
+
+# Trades joined with product info, issuer and type mappings, as the dashboard sees them.
+# "Adjusted Turnover" is the notional: `compute_adjusted_turnover` used to choose it
+# with `isna() & Type != "Investment"`, which evaluates as `(isna() & Type) != ...`
+# and therefore always picked `MifidNotionalAmount`.
+# Products are joined on their integer `isin_id`, which `rows` and `columns` hide.
+JOINED_VIEW = """
+CREATE VIEW joined AS
+SELECT
+    s.* EXCLUDE (isin_id),
+    p.*,
+    s.MifidNotionalAmount AS "Adjusted Turnover",
+FROM sales AS s
+LEFT JOIN products AS p ON s.isin_id = p.isin_id
+"""
+
+# Product info with issuer and type mappings, traded or not
+PRODUCTS_VIEW = """
+CREATE VIEW products AS
+SELECT
+    i.* EXCLUDE (Emittente, Nome),
+    m.* EXCLUDE (Original),
+    t.*,
+FROM isin_info AS i
+LEFT JOIN issuers AS m ON i.Emittente = m.Original
+LEFT JOIN type_and_subtype AS t ON i.Nome = t.Category
+"""
+
+# intermediate_csv columns, read straight into DuckDB: the trades are never built
+# as a pandas frame of Python strings. Quantities become integers when they all are,
+# as pandas infers them.
+SALES_COLUMNS = {
+    "MifidInstrumentID": "VARCHAR",
+    "VenueOfPublication": "VARCHAR",
+    "DayEvent": "TIMESTAMP_NS",
+    "MifidNotionalAmount": "DOUBLE",
+    "MifidQuantity": "DOUBLE",
+}
+
+# Every ISIN of the loaded tables with its id from isin_ids.csv. The ISINs the update
+# hasn't numbered yet are numbered after the last id, for this engine only.
+ISIN_DICTIONARY_TABLE = """
+CREATE TABLE isin_dictionary AS
+WITH known AS (
+    SELECT ISIN, CAST(Id AS INTEGER) AS isin_id FROM isin_ids
+),
+unknown AS (
+    SELECT MifidInstrumentID AS ISIN FROM raw_sales
+    UNION SELECT ISIN FROM isin_info
+    UNION SELECT ISIN FROM underlyings
+    EXCEPT SELECT ISIN FROM known
+)
+SELECT * FROM known
+UNION ALL
+SELECT
+    ISIN,
+    CAST(
+        (SELECT coalesce(max(isin_id), -1) FROM known)
+        + row_number() OVER (ORDER BY ISIN) AS INTEGER
+    ),
+FROM unknown
+WHERE ISIN IS NOT NULL
+"""
+
+# ISIN -> underlying, with the size of the basket. Built once per data version, so
+# the case-insensitive mapping and the basket count aren't redone by every query.
+UNDERLYING_BRIDGE_TABLE = """
+CREATE TABLE underlying_bridge AS
+SELECT u.isin_id, n.n_underlyings, m.Sottostante
+FROM underlyings AS u
+LEFT JOIN (
+    SELECT isin_id, count(Sottostante) AS n_underlyings
+    FROM underlyings
+    GROUP BY isin_id
+) AS n ON u.isin_id = n.isin_id
+LEFT JOIN und_mapping AS m ON lower(u.Sottostante) = lower(m.Original)
+"""
+
+PRODUCT_UNDERLYINGS_VIEW = """
+CREATE VIEW product_underlyings AS
+SELECT p.*, b.n_underlyings, b.Sottostante
+FROM products AS p
+LEFT JOIN underlying_bridge AS b ON p.isin_id = b.isin_id
+"""
+
+# One row per trade and underlying, with the turnover split evenly across the basket
+JOINED_UNDERLYINGS_VIEW = """
+CREATE VIEW joined_underlyings AS
+SELECT
+    j.* REPLACE (j."Adjusted Turnover" / b.n_underlyings AS "Adjusted Turnover"),
+    b.n_underlyings,
+    b.Sottostante,
+    j."Adjusted Turnover" AS "Adjusted Turnover (underlying)",
+FROM joined AS j
+LEFT JOIN underlying_bridge AS b ON j.isin_id = b.isin_id
+"""
+
+
+def quote(column: str) -> str:
+    return '"{}"'.format(column.replace('"', '""'))
+
+
+def literal(value: str) -> str:
+    return "'{}'".format(value.replace("'", "''"))
+
+
+def _in_clause(column: str, values: Sequence) -> tuple[str, list]:
+    # `Series.isin` matches missing values when the list contains NaN, SQL `IN` doesn't
+    present = [v for v in values if not pd.isna(v)]
+    clauses = []
+    if present:
+        clauses.append(f"{quote(column)} IN ({', '.join('?' * len(present))})")
+    if len(present) < len(values):
+        clauses.append(f"{quote(column)} IS NULL")
+    return f"({' OR '.join(clauses) or 'FALSE'})", present
+
+
+@dataclass(frozen=True)
+class Filters:
+    """Predicates shared by the dashboard pages. `None` means "don't filter"."""
+
+    start: date | None = None
+    end: date | None = None
+    types: tuple | None = None
+    subtypes: tuple | None = None
+    issuers: tuple | None = None
+
+    def where(self) -> tuple[str, list]:
+        clauses = []
+        params: list = []
+        if self.start is not None:
+            clauses.append('"DayEvent" >= ?')
+            params.append(datetime.combine(self.start, time.min))
+        if self.end is not None:
+            clauses.append('"DayEvent" <= ?')
+            params.append(datetime.combine(self.end, time.min))
+        for column, values in (
+            ("Type", self.types),
+            ("SubType", self.subtypes),
+            ("Issuer", self.issuers),
+        ):
+            if values is not None:
+                clause, values_params = _in_clause(column, values)
+                clauses.append(clause)
+                params.extend(values_params)
+        return " AND ".join(clauses) or "TRUE", params
+
+
+class QueryEngine:
+    """In-memory DuckDB database over one version of the dashboard tables.
+
+    The tables are copied once into DuckDB's columnar storage; pages then express
+    filters and group-bys through `aggregate` and `rows`, which DuckDB pushes below
+    the joins and runs multi-threaded. A query only reads the columns it uses from
+    the tables behind the views.
+    """
+
+    def __init__(
+        self,
+        tables: data_service.DataTables,
+        sales_files: Sequence[Path],
+        archive: dict[str, pd.DataFrame] | None = None,
+    ) -> None:
+        """Without `archive`, the archived products and their trades are left out;
+        with it, its tables are added to those of `tables`."""
+        self.version = tables.version
+        if archive is not None:
+            self.version += "|archive"
+        self.con = duckdb.connect()
+        sources = {name: getattr(tables, name) for name in data_service.TABLE_FILES}
+        for name, df in (archive or {}).items():
+            sources[name] = pd.concat([sources[name], df], ignore_index=True)
+        for name, df in sources.items():
+            self.con.register("_source", df)
+            self.con.execute(f"CREATE TABLE {name} AS SELECT * FROM _source")
+            self.con.unregister("_source")
+        # The trades of these are left out
+        self.con.execute("CREATE TABLE archived_isins (ISIN VARCHAR)")
+        if archive is None:
+            self.con.register("_source", tables.archived_isins)
+            self.con.execute("INSERT INTO archived_isins SELECT ISIN FROM _source")
+            self.con.unregister("_source")
+        self._load_sales(sales_files)
+        self.con.execute(UNDERLYING_BRIDGE_TABLE)
+        self._finish(self._traded_ids())
+
+    @classmethod
+    def from_snapshot(cls, folder: Path, version: str) -> "QueryEngine":
+        """The engine over the live products, from the tables `to_arrow` returned,
+        as written by `snapshot.write` to `folder`."""
+        engine = cls.__new__(cls)
+        engine.version = version
+        engine.con = duckdb.connect()
+        traded = None
+        for path in sorted(folder.glob("*.arrow")):
+            table = snapshot.read_arrow(path)
+            if path.stem == "traded":
+                traded = table.to_pandas()
+                continue
+            # Copied out of the mapped file: queries run on DuckDB's own storage
+            engine.con.register("_source", table)
+            engine.con.execute(f"CREATE TABLE {path.stem} AS SELECT * FROM _source")
+            engine.con.unregister("_source")
+        engine._finish(engine._traded_ids() if traded is None else traded)
+        return engine
+
+    def _n_ids(self) -> int:
+        (n_ids,) = self.con.execute(
+            "SELECT coalesce(max(isin_id), -1) + 1 FROM isin_dictionary",
+        ).fetchone()
+        return n_ids
+
+    def _traded_ids(self) -> pd.DataFrame:
+        # Aggregated straight into bits: a DISTINCT over day and ISIN would keep its
+        # hash table of a million pairs around
+        return self.query(
+            'SELECT CAST("DayEvent" AS DATE) AS "Day", '
+            f'bitstring_agg(isin_id, 0, {self._n_ids() - 1})::VARCHAR AS "Ids" '
+            'FROM sales WHERE isin_id IS NOT NULL GROUP BY "Day"',
+        )
+
+    def _finish(self, traded: pd.DataFrame) -> None:
+        self.con.execute(PRODUCTS_VIEW)
+        self.con.execute(PRODUCT_UNDERLYINGS_VIEW)
+        self.con.execute(JOINED_VIEW)
+        self.con.execute(JOINED_UNDERLYINGS_VIEW)
+        self.traded = bitmaps.TradedIndex(traded, self._n_ids())
+        n_rows, memory = self.con.execute(
+            "SELECT (SELECT count(*) FROM sales), sum(memory_usage_bytes) "
+            "FROM duckdb_memory()",
+        ).fetchone()
+        logger.info(
+            "Query engine ready for %d trade rows (%.1f MB)",
+            n_rows,
+            memory / 1024**2,
+        )
+
+    def _load_sales(self, files: Sequence[Path]) -> None:
+        """Load the trades and key them, and the product tables, by `isin_id`."""
+        columns = ", ".join(f"{quote(col)} {t}" for col, t in SALES_COLUMNS.items())
+        if files:
+            # A view can't take parameters: it's read twice, but never stored
+            paths = ", ".join(literal(str(f)) for f in files)
+            types = ", ".join(
+                f"{literal(col)}: {literal(t)}" for col, t in SALES_COLUMNS.items()
+            )
+            self.con.execute(
+                "CREATE TEMP VIEW raw_sales AS SELECT * FROM read_csv("
+                f"[{paths}], header = true, auto_detect = false, "
+                f"columns = {{{types}}})",
+            )
+        else:
+            self.con.execute(f"CREATE TEMP TABLE raw_sales ({columns})")
+        self.con.execute(ISIN_DICTIONARY_TABLE)
+        self.con.execute(
+            "CREATE TABLE sales AS "
+            "SELECT d.isin_id, s.* EXCLUDE (MifidInstrumentID) FROM raw_sales AS s "
+            "LEFT JOIN isin_dictionary AS d ON s.MifidInstrumentID = d.ISIN "
+            "WHERE s.MifidInstrumentID NOT IN (SELECT ISIN FROM archived_isins)",
+        )
+        for name in ("isin_info", "underlyings"):
+            self.con.execute(
+                f"CREATE OR REPLACE TABLE {name} AS "
+                f"SELECT t.*, d.isin_id FROM {name} AS t "
+                "LEFT JOIN isin_dictionary AS d ON t.ISIN = d.ISIN",
+            )
+        (integral,) = self.con.execute(
+            "SELECT bool_and(MifidQuantity = trunc(MifidQuantity)) FROM sales",
+        ).fetchone()
+        if integral is not False:
+            self.con.execute("ALTER TABLE sales ALTER MifidQuantity TYPE BIGINT")
+
+    def to_arrow(self) -> dict[str, pa.Table]:
+        """Every table of the engine by name, and the traded ids as `traded`."""
+        tables = {
+            name: self.con.execute(f"SELECT * FROM {name}").to_arrow_table()
+            for (name,) in self.con.execute(
+                "SELECT table_name FROM duckdb_tables() WHERE NOT temporary",
+            ).fetchall()
+        }
+        tables["traded"] = pa.Table.from_pandas(self._traded_ids())
+        return tables
+
+    def query(self, sql: str, params: Sequence = ()) -> pd.DataFrame:
+        # A cursor per query: the connection is shared by every session thread
+        with self.con.cursor() as cursor:
+            return cursor.execute(sql, list(params)).df()
+
+    def distinct(self, column: str, source: str = "joined") -> list:
+        return self.query(
+            f"SELECT DISTINCT {quote(column)} FROM {source} ORDER BY 1 NULLS LAST",
+        )[column].tolist()
+
+    def date_range(self) -> tuple[pd.Timestamp, pd.Timestamp]:
+        bounds = self.query(
+            'SELECT min("DayEvent") AS first, max("DayEvent") AS last FROM sales',
+        )
+        return bounds["first"].iloc[0], bounds["last"].iloc[0]
+
+    def aggregate(
+        self,
+        group_by: Sequence[str],
+        measures: Sequence[str],
+        filters: Filters,
+        *,
+        source: str = "joined",
+        dropna: bool = True,
+        not_null: Sequence[str] = (),
+    ) -> pd.DataFrame:
+        """Sum `measures` by `group_by` over the rows of `source` matching `filters`.
+
+        As `DataFrame.groupby`, rows with a missing `group_by` value are left out
+        unless `dropna` is False; `not_null` lists further columns that must not be
+        missing.
+        """
+        # ISINs are grouped by their id and only decoded on the aggregated rows
+        by_id = ["isin_id" if col == "ISIN" else col for col in group_by]
+        where, params = filters.where()
+        required = " ".join(
+            f"AND {quote(col)} IS NOT NULL"
+            for col in (*(by_id if dropna else ()), *not_null)
+        )
+        keys = ", ".join(quote(col) for col in by_id)
+        sums = ", ".join(f"sum({quote(m)}) AS {quote(m)}" for m in measures)
+        sql = f"SELECT {keys}, {sums} FROM {source} WHERE {where} {required}"
+        if group_by:
+            sql += f" GROUP BY {keys}"
+        if "ISIN" in group_by:
+            outputs = ", ".join(
+                "d.ISIN" if col == "ISIN" else f"a.{quote(col)}"
+                for col in (*group_by, *measures)
+            )
+            sql = (
+                f"SELECT {outputs} FROM ({sql}) AS a "
+                "LEFT JOIN isin_dictionary AS d ON a.isin_id = d.isin_id"
+            )
+        return self.query(sql, params)
+
+    def distinct_products(
+        self,
+        key: str,
+        filters: Filters,
+        *,
+        source: str = "products",
+        not_null: Sequence[str] = (),
+    ) -> pd.DataFrame:
+        """Distinct products by `key` of `source`, traded and active over the dates.
+
+        "Traded products" counts the ISINs with a trade between the filter dates;
+        "Active products" the ISINs issued by the end date and not expired before
+        the start date, traded or not. The other filters and `not_null` select the
+        products as in `aggregate`; `not_null` columns `source` lacks are ignored.
+        """
+        where, params = replace(filters, start=None, end=None).where()
+        available = set(self.columns(source))
+        required = " ".join(
+            f"AND {quote(col)} IS NOT NULL" for col in not_null if col in available
+        )
+        products = self.query(
+            f"SELECT DISTINCT isin_id, {quote(key)} FROM {source} "
+            f"WHERE {where} {required}",
+            params,
+        )
+        active_where = []
+        active_params: list = []
+        if filters.end is not None:
+            active_where.append(
+                'coalesce(TRY_CAST("Issue Date" AS DATE) <= ?, TRUE)',
+            )
+            active_params.append(filters.end)
+        if filters.start is not None:
+            active_where.append(
+                'coalesce(TRY_CAST("Expiry Date" AS DATE) >= ?, TRUE)',
+            )
+            active_params.append(filters.start)
+        active = self.query(
+            "SELECT DISTINCT isin_id FROM products "
+            f"WHERE isin_id IS NOT NULL AND {' AND '.join(active_where) or 'TRUE'}",
+            active_params,
+        )["isin_id"].to_numpy()
+        masks = {
+            "Traded products": self.traded.between(filters.start, filters.end),
+            "Active products": bitmaps.bitset(active, self.traded.n_ids),
+        }
+        return self.traded.count_by(products, key, masks)
+
+    def rows(
+        self,
+        filters: Filters,
+        columns: Sequence[str] | None = None,
+        *,
+        source: str = "joined",
+    ) -> pd.DataFrame:
+        where, params = filters.where()
+        projection = (
+            ", ".join(quote(col) for col in columns)
+            if columns
+            else "* EXCLUDE (isin_id)"
+        )
+        return self.query(f"SELECT {projection} FROM {source} WHERE {where}", params)
+
+    def columns(self, source: str = "joined") -> list[str]:
+        return self.query(
+            f"SELECT * EXCLUDE (isin_id) FROM {source} LIMIT 0",
+        ).columns.tolist()
+
+
+@st.cache_resource(max_entries=2, show_spinner="Preparazione dati...")
+def _build_engine(
+    version: str,
+    archived: bool,
+    _tables: data_service.DataTables,
+) -> QueryEngine:
+    # The update leaves a snapshot of the engine over the live products
+    folder = snapshot.current(version, data_service.SNAPSHOT_FOLDER)
+    if folder is not None and not archived:
+        try:
+            return QueryEngine.from_snapshot(folder / "engine", version)
+        except (OSError, pa.ArrowException, duckdb.Error):
+            logger.warning("Can't read the snapshot in %s", folder, exc_info=True)
+    return QueryEngine(
+        _tables,
+        data_service.daily_files(),
+        data_service.get_archive() if archived else None,
+    )
+
+
+def get_engine(*, archived: bool = False) -> QueryEngine:
+    """Return the process-wide engine for the current data version, over the live
+    products or, with `archived`, over the archived ones as well."""
+    tables = data_service.get_tables()
+    return _build_engine(tables.version, archived, tables)
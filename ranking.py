@@ -0,0 +1,94 @@
+import math
+from collections.abc import Sequence
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+PAGE_SIZES = [50, 100, 500]
+
+
+def _sort_key(series: pd.Series) -> np.ndarray:
+    # Descending order, missing values last (as `sort_values`)
+    return series.to_numpy(dtype=float, na_value=-np.inf)
+
+
+def select_page(
+    df: pd.DataFrame,
+    sort_by: Sequence[str],
+    start: int,
+    stop: int,
+    blank_repeated: Sequence[str] = (),
+) -> pd.DataFrame:
+    """Return rows `start:stop` of `df` sorted descending by `sort_by`.
+
+    Only the rows that can rank before `stop` are sorted: a partial selection
+    (`np.partition`) on the first key finds the `stop`-th largest value, and
+    everything below it is discarded before the full lexicographic sort.
+
+    Columns in `blank_repeated` are shown as "//" when equal to the row above,
+    including across the page boundary.
+    """
+    first_key = _sort_key(df[sort_by[0]])
+    if stop < len(df):
+        threshold = np.partition(first_key, len(df) - stop)[len(df) - stop]
+        df = df.loc[first_key >= threshold]
+
+    order = np.lexsort([-_sort_key(df[col]) for col in reversed(sort_by)])
+    ranked = df.iloc[order[:stop]].reset_index(drop=True)
+    for col in blank_repeated:
+        ranked[col] = ranked[col].where(ranked[col].shift() != ranked[col], "//")
+    return ranked.iloc[start:stop]
+
+
+def ranking_table(
+    df: pd.DataFrame,
+    sort_by: Sequence[str],
+    key: str,
+    millions_columns: Sequence[str] = (),
+    blank_repeated: Sequence[str] = (),
+) -> None:
+    """Show `df` ranked by `sort_by`, one page at a time.
+
+    Sorting, paging and unit conversion happen on the server and only the current
+    page is sent to the browser. `sort_by` columns that are not in `millions_columns`
+    are helpers and are not displayed.
+    """
+    page_col, size_col, info_col = st.columns([1, 1, 4])
+    page_size = size_col.selectbox(
+        "Righe per pagina",
+        options=PAGE_SIZES,
+        index=1,
+        key=f"{key}_page_size",
+    )
+    n_pages = max(1, math.ceil(len(df) / page_size))
+    if st.session_state.get(f"{key}_page", 1) > n_pages:
+        st.session_state[f"{key}_page"] = n_pages
+    page = page_col.number_input(
+        "Pagina",
+        min_value=1,
+        max_value=n_pages,
+        value=1,
+        key=f"{key}_page",
+    )
+    info_col.caption(f"{len(df):,} righe, pagina {page} di {n_pages}")
+
+    start = (page - 1) * page_size
+    stop = min(start + page_size, len(df))
+    page_df = select_page(df, sort_by, start, stop, blank_repeated=blank_repeated)
+
+    helpers = [col for col in sort_by if col not in millions_columns]
+    page_df = (
+        page_df.drop(columns=helpers)
+        .assign(**{col: page_df[col] / 1_000_000 for col in millions_columns})
+        .assign(n=range(start + 1, stop + 1))
+        .set_index("n")
+    )
+    st.dataframe(
+        page_df,
+        column_config={
+            col: st.column_config.NumberColumn(f"{col} (M)", format="accounting")
+            for col in millions_columns
+        },
+        use_container_width=True,
+    )
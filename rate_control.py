@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import urlsplit
+
+BASE_FOLDER = Path(__file__).parent
+RATE_STATE_PATH = BASE_FOLDER / "rate_state.json"
+
+# Requests per second, per host. The initial rate matches the old 1-3 s random delay.
+INITIAL_RATE = 0.5
+MIN_RATE = 0.05
+MAX_RATE = 4.0
+ADDITIVE_STEP = 0.05  # added after each healthy response
+DECREASE_FACTOR = 0.5  # applied on timeouts, 429s and 5xx
+# Slower answers than this don't raise the rate: the server is struggling
+SLOW_RESPONSE_SEC = 5.0
+# Spacing between requests varies by +/- this share, so we don't hit the server
+# on a fixed beat
+SPACING_JITTER = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+def is_throttled(status: int | None) -> bool:
+    """True for a timeout/connection error (`None`), a 429 or a 5xx."""
+    return status is None or status == 429 or status >= 500
+
+
+class _HostState:
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.next_slot = time.monotonic()
+
+
+class RateController:
+    """Additive-increase/multiplicative-decrease request rate, one per host.
+
+    Call `wait` before each request and `record` with its outcome. The rates are
+    loaded from and saved to `path`, so each run starts at the last rate that
+    worked. Thread-safe: concurrent callers get spaced-out slots.
+    """
+
+    def __init__(self, path: Path | None = RATE_STATE_PATH) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.hosts: dict[str, _HostState] = {}
+        if path is not None and path.exists():
+            try:
+                saved = json.loads(path.read_text(encoding="utf-8"))
+            except ValueError:
+                logger.warning("Ignoring unreadable %s", path.name)
+                saved = {}
+            for host, state in saved.items():
+                self.hosts[host] = _HostState(
+                    min(MAX_RATE, max(MIN_RATE, float(state["rate"]))),
+                )
+
+    def _host(self, url: str) -> _HostState:
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = _HostState(INITIAL_RATE)
+        return self.hosts[host]
+
+    def rate(self, url: str) -> float:
+        with self.lock:
+            return self._host(url).rate
+
+    def wait(self, url: str) -> float:
+        """Sleep until the host's next free slot; return the seconds slept."""
+        with self.lock:
+            state = self._host(url)
+            now = time.monotonic()
+            slot = max(now, state.next_slot)
+            jitter = random.uniform(1 - SPACING_JITTER, 1 + SPACING_JITTER)
+            spacing = jitter / state.rate
+            state.next_slot = slot + spacing
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def record(
+        self,
+        url: str,
+        status: int | None,
+        elapsed: float,
+        retry_after: float | None = None,
+    ) -> None:
+        """Update the host's rate with the outcome of a request.
+
+        `status` is None when the request timed out or the connection failed.
+        """
+        with self.lock:
+            state = self._host(url)
+            if is_throttled(status):
+                state.rate = max(MIN_RATE, state.rate * DECREASE_FACTOR)
+                pause = max(retry_after or 0, 1 / state.rate)
+                state.next_slot = max(state.next_slot, time.monotonic() + pause)
+                logger.info(
+                    "%s answered %s: rate cut to %.2f req/s",
+                    urlsplit(url).netloc,
+                    status or "with a timeout",
+                    state.rate,
+                )
+            elif elapsed < SLOW_RESPONSE_SEC:
+                state.rate = min(MAX_RATE, state.rate + ADDITIVE_STEP)
+
+    def save(self) -> None:
+        if self.path is None or not self.hosts:
+            return
+        with self.lock:
+            saved = {
+                host: {
+                    "rate": round(state.rate, 4),
+                    "saved_at": datetime.now().isoformat(timespec="seconds"),
+                }
+                for host, state in self.hosts.items()
+            }
+        # Write to a temporary file and swap it in, as the update status file
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(saved, indent=2), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+        logger.info(
+            "Saved request rates: %s",
+            ", ".join(f"{host} {s['rate']:.2f}/s" for host, s in saved.items()),
+        )
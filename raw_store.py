@@ -0,0 +1,142 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import logging
+import zipfile
+from collections import defaultdict
+from collections.abc import Collection, Iterator
+from pathlib import Path
+
+import pandas as pd
+
+BASE_FOLDER = Path(__file__).parent
+RAW_FOLDER = BASE_FOLDER / "raw"
+TRADES_FILENAME = "Trades_WarrantCertificates.csv"
+
+logger = logging.getLogger(__name__)
+
+# Downloads overlap: each holds the last few days, so the same trades come again and
+# again. A download is cut by day, and each day's lines, under the title and header
+# lines, are kept once as `blobs/<sha256 of the text>.csv.gz`. `manifests/<day>.json`
+# points at the blob of the newest download with the day, as when every download
+# was copied over `input_csv/<day>.zip`, and at the rows of that download it was
+# cut from. Blobs no day points at anymore are deleted.
+
+
+def _blob_path(folder: Path, digest: str) -> Path:
+    return folder / "blobs" / f"{digest}.csv.gz"
+
+
+def _manifest_path(folder: Path, day: str) -> Path:
+    return folder / "manifests" / f"{day}.json"
+
+
+def _write_json(path: Path, data: dict) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(data, sort_keys=True), encoding="utf-8")
+    tmp_path.replace(path)
+
+
+def _split_days(text: str) -> tuple[str, dict[str, list[str]], dict[str, list]]:
+    """Title and header lines, then each day's lines and their row ranges."""
+    lines = [line for line in text.splitlines(keepends=True) if line.strip()]
+    head, rows = lines[:2], lines[2:]
+    day_column = next(csv.reader(head[1:])).index("TradingDateTime")
+    days_lines: dict[str, list[str]] = defaultdict(list)
+    ranges: dict[str, list[list[int]]] = defaultdict(list)
+    for n, line in enumerate(rows):
+        # One trade per line: no field of the download spans lines
+        day = next(csv.reader([line]))[day_column][:10]
+        days_lines[day].append(line)
+        if ranges[day] and ranges[day][-1][1] == n:
+            ranges[day][-1][1] = n + 1
+        else:
+            ranges[day].append([n, n + 1])
+    return "".join(head), dict(days_lines), dict(ranges)
+
+
+def manifests(folder: Path = RAW_FOLDER) -> dict[str, dict]:
+    """Day -> its manifest, for every day stored."""
+    return {
+        path.stem: json.loads(path.read_text(encoding="utf-8"))
+        for path in sorted((folder / "manifests").glob("*.json"))
+    }
+
+
+def manifest_key(manifest: dict) -> str:
+    """Identifies the trades of a day: the same key means the same lines."""
+    return manifest["blob"]
+
+
+def _collect_garbage(folder: Path) -> None:
+    used = {manifest["blob"] for manifest in manifests(folder).values()}
+    for path in (folder / "blobs").glob("*.csv.gz"):
+        if path.name.removesuffix(".csv.gz") not in used:
+            path.unlink()
+            logger.info("Deleted %s, no day uses it anymore", path.name)
+
+
+def store(
+    zip_path: Path,
+    folder: Path = RAW_FOLDER,
+    days: Collection[str] | None = None,
+) -> list[str]:
+    """Store the trades of the download at `zip_path`, of all its days or `days`.
+
+    Returns the days whose trades changed.
+    """
+    (folder / "blobs").mkdir(parents=True, exist_ok=True)
+    (folder / "manifests").mkdir(parents=True, exist_ok=True)
+    with zip_path.open("rb") as file:
+        download = hashlib.file_digest(file, "sha256").hexdigest()
+    with zipfile.ZipFile(zip_path) as z:
+        text = z.read(TRADES_FILENAME).decode("utf-8")
+    head, days_lines, ranges = _split_days(text)
+    logger.info("Found the following days in the file: %s", list(days_lines))
+
+    changed = []
+    for day, lines in days_lines.items():
+        if days is not None and day not in days:
+            continue
+        content = (head + "".join(lines)).encode("utf-8")
+        digest = hashlib.sha256(content).hexdigest()
+        blob_path = _blob_path(folder, digest)
+        if not blob_path.exists():
+            tmp_path = blob_path.with_suffix(".tmp")
+            tmp_path.write_bytes(gzip.compress(content, mtime=0))
+            tmp_path.replace(blob_path)
+        manifest = {"blob": digest, "download": download, "rows": ranges[day]}
+        path = _manifest_path(folder, day)
+        previous = json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+        _write_json(path, manifest)
+        if previous.get("blob") != digest:
+            changed.append(day)
+    _collect_garbage(folder)
+    logger.info("Days with new trades: %s", changed)
+    return changed
+
+
+def migrate(input_folder: Path, folder: Path = RAW_FOLDER) -> None:
+    """Move the `<day>.zip` copies `download_file` used to write into the store."""
+    for path in sorted(input_folder.glob("*.zip")):
+        store(path, folder, days={path.stem})
+        path.unlink()
+        logger.info("Moved %s to the raw store", path.name)
+
+
+def read_days(
+    days: Collection[str],
+    folder: Path = RAW_FOLDER,
+    **kwargs,
+) -> Iterator[tuple[str, pd.DataFrame]]:
+    """Yield the trades of each of `days` that is stored.
+
+    `kwargs` go to `pd.read_csv`, which reads the lines after the title line.
+    """
+    for day, manifest in manifests(folder).items():
+        if day not in days:
+            continue
+        content = gzip.decompress(_blob_path(folder, manifest["blob"]).read_bytes())
+        yield day, pd.read_csv(io.BytesIO(content), header=1, **kwargs)
@@ -0,0 +1,286 @@
+import argparse
+import logging
+from collections.abc import Iterable
+from datetime import date
+from pathlib import Path
+from typing import TypedDict
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+BASE_FOLDER = Path(__file__).parent
+SCHEDULES_PATH = BASE_FOLDER / "schedules.parquet"
+# Rows are sorted by ISIN, so the min/max statistics of each row group act as an
+# index: reading a few ISINs only touches the row groups that can contain them
+ROW_GROUP_SIZE = 64_000
+
+SCHEMA = pa.schema(
+    [
+        ("ISIN", pa.string()),
+        ("Date", pa.date32()),
+        ("Coupon", pa.float64()),
+        ("Autocall Trigger", pa.float64()),
+    ],
+)
+
+# Most common gap between observation dates, in days (inclusive), for each frequency
+FREQUENCY_BANDS = {
+    "Weekly": (4, 10),
+    "Monthly": (26, 35),
+    "Quarterly": (80, 100),
+    "Semiannual": (160, 200),
+    "Annual": (350, 380),
+}
+NO_FREQUENCY = "N/A (less than 2 dates)"
+PERIODS_PER_YEAR = {
+    "Weekly": 52,
+    "Monthly": 12,
+    "Quarterly": 4,
+    "Semiannual": 2,
+    "Annual": 1,
+}
+# Columns of isin_info.csv derived from the schedule, as `derive_metrics` returns them
+DERIVED_COLUMNS = [
+    "Coupon PA",
+    "Coupon Frequency",
+    "Autocall Frequency",
+    "Autocall First Date",
+    "Autocall Decrement",
+    "Autocall Initial Trigger",
+]
+
+logger = logging.getLogger(__name__)
+
+
+# One row of the "Date rilevamento" table of a CD page, values in percent
+ScheduleRow = TypedDict(
+    "ScheduleRow",
+    {
+        "Date": date | None,
+        "Coupon": float | None,
+        "Autocall Trigger": float | None,
+    },
+)
+
+# Schedules parsed during the current scrape, saved by `save_collected`
+_collected: dict[str, list[ScheduleRow]] = {}
+
+
+def collect(isin: str, rows: Iterable[ScheduleRow]) -> None:
+    _collected[isin] = list(rows)
+
+
+def to_frame(schedules: dict[str, list[ScheduleRow]]) -> pd.DataFrame:
+    """Long-format table: one row per ISIN and observation date."""
+    records = [
+        {"ISIN": isin, **row} for isin, rows in schedules.items() for row in rows
+    ]
+    return _to_pandas(pa.Table.from_pylist(records, schema=SCHEMA))
+
+
+def _to_pandas(table: pa.Table) -> pd.DataFrame:
+    # Dates as datetime64 rather than `date` objects, so they can be compared in bulk
+    return table.to_pandas(
+        types_mapper={pa.string(): pd.StringDtype()}.get,
+        date_as_object=False,
+    )
+
+
+def load(path: Path = SCHEDULES_PATH, isins: list[str] | None = None) -> pd.DataFrame:
+    """Read the schedules of `isins` (all of them if None), sorted by ISIN and date."""
+    if not path.exists():
+        return to_frame({})
+    return _to_pandas(
+        pq.read_table(
+            path,
+            filters=[("ISIN", "in", isins)] if isins is not None else None,
+        ),
+    )
+
+
+def update(
+    schedules: dict[str, list[ScheduleRow]],
+    path: Path = SCHEDULES_PATH,
+) -> None:
+    """Replace the stored schedules of the given ISINs, keeping the file sorted."""
+    if not schedules:
+        return
+    update_frame(to_frame(schedules), list(schedules), path)
+
+
+def update_frame(
+    new: pd.DataFrame,
+    isins: list[str],
+    path: Path = SCHEDULES_PATH,
+) -> None:
+    """Replace the stored schedules of `isins` with the rows of `new`, as `load`
+    gives them."""
+    old = load(path)
+    df = (
+        pd.concat([old.loc[~old["ISIN"].isin(isins)], new])
+        .sort_values(["ISIN", "Date"], kind="stable")
+        .reset_index(drop=True)
+    )
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(
+        pa.Table.from_pandas(df, schema=SCHEMA, preserve_index=False),
+        tmp_path,
+        row_group_size=ROW_GROUP_SIZE,
+        compression="zstd",
+    )
+    tmp_path.replace(path)
+    logger.info(
+        "Saved %d schedule rows for %d products to %s (%d rows in total)",
+        len(new),
+        len(isins),
+        path.name,
+        len(df),
+    )
+
+
+def save_collected(path: Path = SCHEDULES_PATH) -> None:
+    update(_collected, path)
+    _collected.clear()
+
+
+def frequency(dates: pd.DataFrame) -> pd.Series:
+    """`main.determine_frequency` over the `Date` column of each ISIN, in one pass.
+
+    Ties between equally common gaps go to the one that comes first in date order.
+    """
+    dates = dates.loc[dates["Date"].notna(), ["ISIN", "Date"]].sort_values(
+        ["ISIN", "Date"],
+        kind="stable",
+    )
+    isins = dates["ISIN"].to_numpy()
+    days = dates["Date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    same_isin = isins[1:] == isins[:-1]
+    gaps = pd.DataFrame(
+        {"ISIN": isins[1:][same_isin], "gap": np.diff(days)[same_isin]},
+    )
+    gaps["position"] = np.arange(len(gaps))
+    modes = (
+        gaps.groupby(["ISIN", "gap"], sort=False)["position"]
+        .agg(["size", "min"])
+        .reset_index()
+        .sort_values(["ISIN", "size", "min"], ascending=[True, False, True])
+        .drop_duplicates("ISIN")
+        .set_index("ISIN")["gap"]
+    )
+    labels = np.select(
+        [modes.between(low, high) for low, high in FREQUENCY_BANDS.values()],
+        list(FREQUENCY_BANDS),
+        default="",
+    )
+    labels = np.where(
+        labels == "",
+        "Irregular (most common diff: " + modes.astype(str) + " days)",
+        labels,
+    )
+    result = pd.Series(
+        NO_FREQUENCY,
+        index=pd.Index(dates["ISIN"].unique(), name="ISIN"),
+        dtype=object,
+    )
+    result[modes.index] = labels
+    return result
+
+
+def derive_metrics(df: pd.DataFrame) -> pd.DataFrame:
+    """Recompute the schedule-derived fields of `parse_cd` for every ISIN in `df`.
+
+    Returns one row per ISIN with `DERIVED_COLUMNS` plus "Minimum Autocall Trigger",
+    the barrier fallback.
+    """
+    isins = pd.Index(df["ISIN"].unique(), name="ISIN")
+    result = pd.DataFrame(index=isins)
+
+    coupons = df.loc[df["Coupon"].notna()]
+    result["Coupon Frequency"] = frequency(coupons).reindex(isins).fillna(NO_FREQUENCY)
+    mean_coupon = coupons.groupby("ISIN")["Coupon"].mean().reindex(isins)
+    periods = result["Coupon Frequency"].map(PERIODS_PER_YEAR)
+    result["Coupon PA"] = (mean_coupon * periods).where(mean_coupon != 0).round(2)
+
+    # As in `parse_cd`: triggers in date order, undated ones first
+    triggers = df.loc[df["Autocall Trigger"].notna()].sort_values(
+        ["ISIN", "Date"],
+        kind="stable",
+        na_position="first",
+    )
+    position = triggers.groupby("ISIN").cumcount()
+    first = triggers.loc[position == 0].set_index("ISIN")["Autocall Trigger"]
+    second = triggers.loc[position == 1].set_index("ISIN")["Autocall Trigger"]
+    result["Autocall Frequency"] = (
+        frequency(triggers).reindex(isins).fillna(NO_FREQUENCY)
+    )
+    result["Autocall First Date"] = triggers.groupby("ISIN")["Date"].min()
+    result["Autocall Decrement"] = first - second
+    result["Autocall Initial Trigger"] = first
+    result["Minimum Autocall Trigger"] = triggers.groupby("ISIN")[
+        "Autocall Trigger"
+    ].min()
+    return result
+
+
+def _to_csv_strings(series: pd.Series) -> pd.Series:
+    # As `csv.DictWriter` writes the values `parse_cd` returns: repr of floats,
+    # ISO dates, empty for missing
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%Y-%m-%d").fillna("")
+    return (
+        series.astype(object)
+        .where(series.notna(), None)
+        .map(
+            lambda value: "" if value is None else str(value),
+        )
+    )
+
+
+def recompute_isin_info(
+    isin_info_path: Path,
+    schedules_path: Path = SCHEDULES_PATH,
+) -> None:
+    """Rewrite the schedule-derived columns of `isin_info_path` from the schedule table.
+
+    Missing barriers fall back to the minimum autocall trigger, as in `parse_cd`.
+    Products without schedule rows are left untouched.
+    """
+    if not isin_info_path.exists():
+        return
+    isin_info = pd.read_csv(
+        isin_info_path,
+        encoding="utf-8-sig",
+        dtype=str,
+        keep_default_na=False,
+    )
+    metrics = derive_metrics(load(schedules_path))
+    rows = isin_info["ISIN"].isin(metrics.index)
+    for column in DERIVED_COLUMNS:
+        isin_info.loc[rows, column] = _to_csv_strings(
+            isin_info.loc[rows, "ISIN"].map(metrics[column]),
+        )
+    fallback = isin_info["ISIN"].map(metrics["Minimum Autocall Trigger"])
+    no_barrier = (isin_info["Barrier"] == "") & fallback.notna()
+    isin_info.loc[no_barrier, "Barrier"] = _to_csv_strings(fallback[no_barrier])
+    # With the line ends of `csv.writer`, so unchanged rows stay byte for byte
+    tmp_path = isin_info_path.with_suffix(".tmp")
+    isin_info.to_csv(
+        tmp_path,
+        index=False,
+        encoding="utf-8-sig",
+        lineterminator="\r\n",
+    )
+    tmp_path.replace(isin_info_path)
+    logger.info("Recomputed schedule metrics of %d products", rows.sum())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the schedule-derived columns of isin_info.csv.",
+    )
+    parser.add_argument("--isin-info", type=Path, default=BASE_FOLDER / "isin_info.csv")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    recompute_isin_info(args.isin_info)
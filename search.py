@@ -0,0 +1,252 @@
+import argparse
+import logging
+import re
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import archive
+import timeseries
+
+BASE_FOLDER = Path(__file__).parent
+SEARCH_FOLDER = BASE_FOLDER / "search"
+MAX_RESULTS = 50
+
+# Shown in the results and the detail view; the rest of the row is searched
+DOCUMENT_COLUMNS = [
+    "ISIN",
+    "Nome",
+    "Issuer",
+    "Sottostanti",
+    "Underlyings",
+    "Expiry Date",
+    "Turnover 20d",
+    "Archived",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    """Lowercase words without accents or punctuation, as they are indexed."""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _trigrams(word: str) -> set[str]:
+    return {word[i : i + 3] for i in range(len(word) - 2)}
+
+
+def _documents(tables_folder: Path, timeseries_folder: Path) -> pd.DataFrame:
+    """One row per ISIN of isin_info.csv and its archive, with the names it can be
+    found by."""
+
+    def read(name: str) -> pd.DataFrame:
+        df = pd.read_csv(tables_folder / name, encoding="utf-8-sig", dtype=str)
+        if name not in archive.ARCHIVE_FILES:
+            return df
+        frames = [df.assign(Archived=False)]
+        archive_path = tables_folder / archive.ARCHIVE_FILES[name]
+        if archive_path.exists():
+            archived = pd.read_csv(archive_path, encoding="utf-8-sig", dtype=str)
+            frames.append(archived.assign(Archived=True))
+        return pd.concat(frames, ignore_index=True)
+
+    # Same mappings as the dashboard: issuers through `Emittente`, underlyings
+    # matched case-insensitively. ISINs listed twice keep their first row, the
+    # live one before the archived one.
+    documents = (
+        read("isin_info.csv")
+        .drop_duplicates("ISIN")
+        .merge(
+            read("issuers.csv"),
+            left_on="Emittente",
+            right_on="Original",
+            how="left",
+        )
+    )
+    und_mapping = read("und_mapping.csv")
+    und_mapping["lower"] = und_mapping["Original"].str.lower()
+    underlyings = read("underlyings.csv").dropna(subset=["Sottostante"])
+    names = (
+        underlyings.assign(lower=underlyings["Sottostante"].str.lower())[
+            ["ISIN", "lower"]
+        ]
+        .merge(und_mapping[["lower", "Sottostante"]], on="lower")
+        .drop_duplicates(["ISIN", "Sottostante"])
+        .groupby("ISIN")["Sottostante"]
+        .agg("/".join)
+        .rename("Underlyings")
+    )
+    documents = documents.merge(names, on="ISIN", how="left")
+
+    # Most traded products first among equally good matches
+    turnover = timeseries.load(
+        "isin",
+        timeseries_folder,
+        columns=["Day", "ISIN", "Turnover 20d"],
+    )
+    last_day = turnover["Day"].max()
+    documents = documents.merge(
+        turnover.loc[turnover["Day"] == last_day, ["ISIN", "Turnover 20d"]],
+        on="ISIN",
+        how="left",
+    )
+    documents["Turnover 20d"] = documents["Turnover 20d"].fillna(0.0)
+
+    searched = ["ISIN", "Emittente", "Issuer", "Sottostanti", "Underlyings"]
+    documents["Text"] = (
+        documents[searched].fillna("").agg(" ".join, axis=1).map(normalize)
+    )
+    return documents[[*DOCUMENT_COLUMNS, "Text"]].reset_index(drop=True)
+
+
+def _postings(keys: pd.Series) -> pa.Table:
+    """Key -> sorted document ids, from `keys` holding the key sets of each document."""
+    pairs = keys.explode().dropna().rename("Key").rename_axis("Id").reset_index()
+    pairs = pairs.drop_duplicates().sort_values(["Key", "Id"])
+    unique, counts = np.unique(pairs["Key"].to_numpy(dtype=str), return_counts=True)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    return pa.table(
+        {
+            "Key": pa.array(unique, type=pa.string()),
+            "Ids": pa.ListArray.from_arrays(
+                pa.array(offsets),
+                pa.array(pairs["Id"].to_numpy(dtype=np.int32)),
+            ),
+        },
+    )
+
+
+def _write(table: pa.Table, path: Path) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(path)
+
+
+def build(
+    tables_folder: Path = BASE_FOLDER,
+    timeseries_folder: Path = timeseries.TIMESERIES_FOLDER,
+    folder: Path = SEARCH_FOLDER,
+) -> None:
+    """Rebuild the search index over isin_info.csv, its archive and the issuer and
+    underlying mappings: the words of every product, and the trigrams of those
+    words."""
+    folder.mkdir(parents=True, exist_ok=True)
+    documents = _documents(tables_folder, timeseries_folder)
+    words = documents["Text"].str.split()
+    tokens = _postings(words)
+    trigrams = _postings(words.map(lambda ws: set().union(*map(_trigrams, ws))))
+    # Documents last: a reader seeing them new finds postings at least as new
+    _write(tokens, folder / "tokens.parquet")
+    _write(trigrams, folder / "trigrams.parquet")
+    _write(
+        pa.Table.from_pandas(documents, preserve_index=False),
+        folder / "documents.parquet",
+    )
+    logger.info(
+        "Search index: %d products, %d words, %d trigrams",
+        len(documents),
+        tokens.num_rows,
+        trigrams.num_rows,
+    )
+
+
+class _Postings:
+    # Sorted keys with their ids packed one after the other, so the keys sharing
+    # a prefix have their ids in one slice
+    def __init__(self, table: pa.Table) -> None:
+        self.keys = np.array(table["Key"].to_pylist(), dtype=str)
+        ids = table["Ids"].combine_chunks()
+        self.offsets = ids.offsets.to_numpy()
+        self.ids = ids.values.to_numpy()
+
+    def get(self, key: str) -> np.ndarray:
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.ids[:0]
+        return self.ids[self.offsets[i] : self.offsets[i + 1]]
+
+    def prefixed(self, prefix: str) -> np.ndarray:
+        start, stop = np.searchsorted(self.keys, [prefix, prefix + "\uffff"])
+        return np.unique(self.ids[self.offsets[start] : self.offsets[stop]])
+
+
+class SearchIndex:
+    """The index written by `build`, searched word by word as the user types."""
+
+    def __init__(self, folder: Path = SEARCH_FOLDER) -> None:
+        self.documents = pq.read_table(folder / "documents.parquet").to_pandas()
+        if "Archived" not in self.documents:
+            # Built before the archive was indexed, until the next update
+            self.documents["Archived"] = False
+        self.tokens = _Postings(pq.read_table(folder / "tokens.parquet"))
+        self.trigrams = _Postings(pq.read_table(folder / "trigrams.parquet"))
+        self.texts = self.documents["Text"].to_numpy(dtype=str)
+        self.isins = self.documents["ISIN"].str.lower().to_numpy(dtype=str)
+
+    def _matches(self, word: str) -> tuple[np.ndarray, np.ndarray]:
+        """Ids of the documents containing `word`, and how well each matches."""
+        prefixed = self.tokens.prefixed(word)
+        if len(word) < 3:
+            ids = prefixed
+        else:
+            candidates = None
+            for trigram in _trigrams(word):
+                found = self.trigrams.get(trigram)
+                candidates = (
+                    found if candidates is None else np.intersect1d(candidates, found)
+                )
+            # A word has all the trigrams of the text it contains, not vice versa
+            ids = candidates[np.char.find(self.texts[candidates], word) >= 0]
+        score = np.where(np.isin(ids, prefixed), 2, 1)
+        score[np.char.startswith(self.isins[ids], word)] = 3
+        return ids, score
+
+    def search(
+        self,
+        query: str,
+        limit: int = MAX_RESULTS,
+        *,
+        archived: bool = False,
+    ) -> pd.DataFrame:
+        """Products matching every word of `query`, best matches first, the
+        archived ones too with `archived`.
+
+        Words of three letters or more are found anywhere, shorter ones only at the
+        start of a word. A word scores 3 when the ISIN starts with it, 2 when another
+        word does and 1 otherwise; ties go to the highest 20-day turnover.
+        """
+        words = normalize(query).split()
+        if not words:
+            return self.documents.iloc[:0][DOCUMENT_COLUMNS].assign(Score=0)
+        scores = None
+        for word in words:
+            ids, score = self._matches(word)
+            matched = pd.Series(score, index=ids)
+            scores = matched if scores is None else scores.add(matched).dropna()
+        results = self.documents.iloc[scores.index][DOCUMENT_COLUMNS].assign(
+            Score=scores.to_numpy(dtype=int),
+        )
+        if not archived:
+            results = results.loc[~results["Archived"]]
+        return results.sort_values(
+            ["Score", "Turnover 20d", "ISIN"],
+            ascending=[False, False, True],
+        ).head(limit)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild or query the search index.")
+    parser.add_argument("query", nargs="?", help="search instead of rebuilding")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if args.query is None:
+        build()
+    else:
+        print(SearchIndex().search(args.query).to_string(index=False))
@@ -0,0 +1,259 @@
+"""Scrape a long work list on several workers, each with its own hash shard.
+
+    python -m shards plan worklist.csv [--all]                   # main host
+    python -m shards work worklist.csv --shard 3/8 --store s3    # each worker host
+    python -m shards merge s0 s1 ... s7                          # main host again
+
+    python -m shards local --workers 4 [--all]                   # all of it, one host
+
+A worker scrapes the products of its shard into its store folder: `results.csv`, as
+isin_info.csv plus the time each product was fetched, and its own page caches and
+rate state and schedules. A worker stopped halfway picks up where it was. The merge
+brings the results into isin_info.csv, the newest fetch of a product among the stores
+winning over the others and over its row already there, and the pages into the
+caches. Workers reach the sites through the same `*_BASE_URL` variables as
+`main`, so the local replay server stands in for them on one host.
+"""
+
+import argparse
+import csv
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+import archive
+import main
+import schedules
+
+BASE_FOLDER = Path(__file__).parent
+RESULTS_FILENAME = "results.csv"
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(isin: str, n_shards: int) -> int:
+    """The shard of `isin`, the same on every host and every run."""
+    digest = hashlib.sha256(isin.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % n_shards
+
+
+def plan(path: Path, folder: Path = BASE_FOLDER, *, rescrape: bool = False) -> int:
+    """Write the work list of the scrape stage to `path`: the traded products
+    isin_info.csv of `folder` doesn't have, or with `rescrape` all of them but the
+    archived ones."""
+    skipped = archive.archived_isins(folder / archive.ARCHIVE_FILES["isin_info.csv"])
+    if not rescrape:
+        skipped |= set(main.load_from_csv_to_db(folder / "isin_info.csv"))
+    work = [
+        (isin, mkt)
+        for isin, mkt in main.extract_isins_from_csvs(folder / "intermediate_csv")
+        if isin not in skipped
+    ]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", newline="", encoding="utf-8-sig") as file:
+        writer = csv.writer(file)
+        writer.writerow(["ISIN", "Market"])
+        writer.writerows(work)
+    logger.info("Work list of %d products written to %s", len(work), path.name)
+    return len(work)
+
+
+def work(worklist_path: Path, shard: int, n_shards: int, store: Path) -> None:
+    """Scrape the products of the work list in `shard` of `n_shards` into `store`."""
+    with worklist_path.open(newline="", encoding="utf-8-sig") as file:
+        isin_and_mkt = [
+            (row["ISIN"], row["Market"])
+            for row in csv.DictReader(file)
+            if shard_of(row["ISIN"], n_shards) == shard
+        ]
+    store.mkdir(parents=True, exist_ok=True)
+    results_path = store / RESULTS_FILENAME
+    logger.info(
+        "Shard %d/%d: %d products, to %s",
+        shard,
+        n_shards,
+        len(isin_and_mkt),
+        store,
+    )
+    # Caches, rate state and schedules of the store, not of the project folder
+    base_folder, main.BASE_FOLDER = main.BASE_FOLDER, store
+    try:
+        main.write_csv_to_isin_info(
+            isin_and_mkt=isin_and_mkt,
+            isin_info_path=results_path,
+            already_loaded=main.load_from_csv_to_db(csv_path=results_path),
+            fetched_at=True,
+        )
+    finally:
+        main.BASE_FOLDER = base_folder
+
+
+def _newest_results(stores: list[Path]) -> dict[str, tuple[dict[str, str], Path]]:
+    """ISIN -> the result fetched last among `stores`, with the store it's in."""
+    newest: dict[str, tuple[dict[str, str], Path]] = {}
+    for store in sorted(stores):
+        for isin, row in main.load_from_csv_to_db(store / RESULTS_FILENAME).items():
+            fetched_at = datetime.fromisoformat(row[main.FETCHED_AT])
+            if isin not in newest or fetched_at >= datetime.fromisoformat(
+                newest[isin][0][main.FETCHED_AT],
+            ):
+                newest[isin] = (row, store)
+    return newest
+
+
+def merge(stores: list[Path], folder: Path = BASE_FOLDER) -> int:
+    """Bring the results of `stores` into isin_info.csv of `folder`.
+
+    A product scraped by several workers keeps its newest fetch. isin_info.csv
+    doesn't say when its rows were fetched: the fetch replaces the product's row
+    there, or in the archive if it's archived there, as a product is only on the
+    work list to be scraped again. The other products are added to isin_info.csv.
+    Their pages go to the caches of `folder` and their schedules, as the workers
+    saved them, to its schedules.parquet. Returns how many products were merged.
+    """
+    newest = _newest_results(stores)
+    if not newest:
+        return 0
+    header = [key.replace("_", " ") for key in main.Product.__annotations__]
+
+    for isin, (_, store) in newest.items():
+        for cache in ("isins", "cd"):
+            page = store / cache / f"{isin}.txt"
+            if page.exists():
+                (folder / cache).mkdir(parents=True, exist_ok=True)
+                shutil.copy2(page, folder / cache / page.name)
+
+    isin_info_path = folder / "isin_info.csv"
+    archive_path = folder / archive.ARCHIVE_FILES["isin_info.csv"]
+    merged = set()
+    for path in (archive_path, isin_info_path):
+        file_header, rows = archive.read_rows(path)
+        if not rows and path == archive_path:
+            continue
+        if file_header and file_header != header:
+            msg = f"{path.name} columns differ from the scraped ones"
+            raise ValueError(msg)
+        isin_col = header.index("ISIN")
+        for i, row in enumerate(rows):
+            if row[isin_col] in newest:
+                rows[i] = [newest[row[isin_col]][0][col] for col in header]
+                merged.add(row[isin_col])
+        if path == isin_info_path:
+            rows.extend(
+                [row[col] for col in header]
+                for isin, (row, _) in newest.items()
+                if isin not in merged
+            )
+        archive.write_rows(path, header, rows)
+
+    winners = [
+        schedules.load(
+            store / "schedules.parquet",
+            [isin for isin, (_, winner) in newest.items() if winner == store],
+        )
+        for store in stores
+    ]
+    collected = pd.concat(winners, ignore_index=True)
+    schedules.update_frame(
+        collected,
+        collected["ISIN"].unique().tolist(),
+        folder / "schedules.parquet",
+    )
+    logger.info(
+        "Merged %d products from %d stores, %d of them already known",
+        len(newest),
+        len(stores),
+        len(merged),
+    )
+    return len(newest)
+
+
+def local(
+    n_workers: int,
+    folder: Path = BASE_FOLDER,
+    *,
+    rescrape: bool = False,
+) -> None:
+    """Plan, scrape with `n_workers` worker processes on this host and merge, in
+    `folder`. The work list and the stores are kept in its `shards` folder."""
+    worklist_path = folder / "shards" / "worklist.csv"
+    plan(worklist_path, folder, rescrape=rescrape)
+    stores = [folder / "shards" / f"shard-{shard}" for shard in range(n_workers)]
+    workers = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "shards",
+                "work",
+                str(worklist_path),
+                "--shard",
+                f"{shard}/{n_workers}",
+                "--store",
+                str(store),
+            ],
+            cwd=BASE_FOLDER,
+            env=os.environ,
+        )
+        for shard, store in enumerate(stores)
+    ]
+    failed = [shard for shard, worker in enumerate(workers) if worker.wait() != 0]
+    # What the failed workers did is kept too: run `local` again to finish
+    merge(stores, folder)
+    if failed:
+        msg = f"Shards {failed} of {n_workers} failed"
+        raise RuntimeError(msg)
+    # Or the next `local` would pick up from these results rather than scrape again
+    shutil.rmtree(folder / "shards")
+
+
+def _shard(value: str) -> tuple[int, int]:
+    shard, n_shards = map(int, value.split("/"))
+    if not 0 <= shard < n_shards:
+        msg = f"{value!r} is not a shard like 3/8"
+        raise argparse.ArgumentTypeError(msg)
+    return shard, n_shards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    plan_parser = commands.add_parser("plan", help="write the work list")
+    plan_parser.add_argument("worklist", type=Path)
+    plan_parser.add_argument(
+        "--all",
+        action="store_true",
+        help="every product, e.g. after a change of the CD layout",
+    )
+    work_parser = commands.add_parser("work", help="scrape one shard")
+    work_parser.add_argument("worklist", type=Path)
+    work_parser.add_argument("--shard", type=_shard, required=True)
+    work_parser.add_argument("--store", type=Path, required=True)
+    merge_parser = commands.add_parser("merge", help="merge the stores")
+    merge_parser.add_argument("stores", type=Path, nargs="+")
+    local_parser = commands.add_parser("local", help="plan, work and merge here")
+    local_parser.add_argument("--workers", type=int, default=4)
+    local_parser.add_argument("--all", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "work":
+        # Each worker logs to its store, several of them may share a host
+        args.store.mkdir(parents=True, exist_ok=True)
+        main.setup_logging(args.store / "app.log")
+    else:
+        main.setup_logging()
+    if args.command == "plan":
+        plan(args.worklist, rescrape=args.all)
+    elif args.command == "work":
+        work(args.worklist, *args.shard, args.store)
+    elif args.command == "merge":
+        merge(args.stores)
+    else:
+        local(args.workers, rescrape=args.all)
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import logging
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pyarrow import ipc
+
+BASE_FOLDER = Path(__file__).parent
+SNAPSHOT_FOLDER = BASE_FOLDER / "snapshot"
+
+logger = logging.getLogger(__name__)
+
+# The dashboard tables and the query engine's, as the update leaves them, so the
+# dashboard starts without parsing a CSV. Each snapshot has a folder of its own,
+# named after the data version it was built from: `current.json` points at the
+# newest. The one it pointed at before is kept too, for a dashboard still reading
+# it; older ones are deleted.
+#
+#   snapshot/current.json         {"version": ..., "folder": ...}
+#   snapshot/<folder>/tables/     the `data_service.DataTables` frames
+#   snapshot/<folder>/engine/     the DuckDB tables of the engine, and its
+#                                 traded products by day
+#
+# Arrow IPC files, uncompressed: they are memory-mapped, with nothing to parse. The
+# engine tables go to DuckDB as they are; the dashboard frames still become pandas
+# frames, their strings Python objects.
+
+
+def _write_arrow(table: pa.Table, path: Path) -> None:
+    with pa.OSFile(str(path), "wb") as sink, ipc.new_file(sink, table.schema) as w:
+        w.write_table(table)
+
+
+def read_arrow(path: Path) -> pa.Table:
+    """The table at `path`, its buffers memory-mapped rather than read."""
+    with pa.memory_map(str(path)) as source:
+        return ipc.open_file(source).read_all()
+
+
+def current(version: str, folder: Path = SNAPSHOT_FOLDER) -> Path | None:
+    """The folder of the snapshot of `version`, or None if there is none."""
+    try:
+        pointer = json.loads((folder / "current.json").read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    snapshot_folder = folder / pointer["folder"]
+    if pointer["version"] != version or not snapshot_folder.exists():
+        return None
+    return snapshot_folder
+
+
+def write(
+    version: str,
+    tables: dict[str, pd.DataFrame],
+    engine_tables: dict[str, pa.Table],
+    folder: Path = SNAPSHOT_FOLDER,
+) -> Path:
+    """Write a snapshot of `version` and make it the current one."""
+    name = hashlib.sha256(version.encode()).hexdigest()[:16]
+    pointer_path = folder / "current.json"
+    try:
+        previous = json.loads(pointer_path.read_text(encoding="utf-8"))["folder"]
+    except (FileNotFoundError, json.JSONDecodeError):
+        previous = None
+    tmp_folder = folder / f"{name}.tmp"
+    shutil.rmtree(tmp_folder, ignore_errors=True)
+    for sub, sub_tables in (
+        ("tables", {n: pa.Table.from_pandas(df) for n, df in tables.items()}),
+        ("engine", engine_tables),
+    ):
+        (tmp_folder / sub).mkdir(parents=True)
+        for table_name, table in sub_tables.items():
+            _write_arrow(table, tmp_folder / sub / f"{table_name}.arrow")
+    shutil.rmtree(folder / name, ignore_errors=True)
+    tmp_folder.rename(folder / name)
+
+    tmp_path = pointer_path.with_suffix(".tmp")
+    pointer = {"version": version, "folder": name}
+    tmp_path.write_text(json.dumps(pointer), encoding="utf-8")
+    tmp_path.replace(pointer_path)
+    # Windows won't delete a file a dashboard still has mapped: a snapshot older
+    # than the previous one still in use goes with a later one
+    for path in folder.iterdir():
+        if path.is_dir() and path.name not in (name, previous):
+            shutil.rmtree(path, ignore_errors=True)
+            if path.exists():
+                logger.info("Snapshot %s is still in use, kept for now", path.name)
+    logger.info("Dashboard snapshot written to %s", (folder / name).name)
+    return folder / name
+
+
+def read_tables(snapshot_folder: Path) -> dict[str, pd.DataFrame]:
+    """The dashboard frames of the snapshot, as `pd.read_csv` gave them."""
+    tables = {}
+    for path in sorted((snapshot_folder / "tables").glob("*.arrow")):
+        df = read_arrow(path).to_pandas()
+        # Arrow gives back the missing strings as None rather than NaN
+        for column in df.select_dtypes(include="object").columns:
+            df[column] = df[column].fillna(np.nan)
+        tables[path.stem] = df
+    return tables
+
+
+def build(folder: Path = SNAPSHOT_FOLDER) -> None:
+    """Snapshot the dashboard data on disk, unless the current snapshot is of it."""
+    # The dashboard modules import streamlit: not worth it for the rest of the update
+    import data_service
+    import query_engine
+
+    version = data_service.data_version()
+    if current(version, folder) is not None:
+        logger.info("Dashboard snapshot is up to date")
+        return
+    tables = data_service.read_tables(version)
+    engine = query_engine.QueryEngine(tables, data_service.daily_files())
+    frames = {name: df for name, df in vars(tables).items() if name != "version"}
+    write(version, frames, engine.to_arrow(), folder)
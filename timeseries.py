@@ -0,0 +1,366 @@
+import argparse
+import json
+import logging
+from collections.abc import Sequence
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import archive
+
+BASE_FOLDER = Path(__file__).parent
+INTERMEDIATE_FOLDER = BASE_FOLDER / "intermediate_csv"
+TIMESERIES_FOLDER = BASE_FOLDER / "timeseries"
+
+# Level -> key column. Issuers and underlyings are derived from the ISIN table.
+LEVELS = {"isin": "ISIN", "issuer": "Issuer", "underlying": "Sottostante"}
+# Rolling windows, in trading days (the days with a file in intermediate_csv)
+WINDOWS = (5, 20)
+# Keys per block when computing the measures: bounds the day x key arrays in memory
+COLUMN_BLOCK = 2_000
+METADATA_KEY = b"timeseries"
+
+MEASURES = [
+    "Turnover",
+    *(f"Turnover {w}d" for w in WINDOWS),
+    "Share",
+    *(f"Share {w}d" for w in WINDOWS),
+    "Turnover DoD",
+    "Share DoD",
+]
+
+logger = logging.getLogger(__name__)
+
+
+def schema(level: str) -> pa.Schema:
+    return pa.schema(
+        [
+            ("Day", pa.date32()),
+            (LEVELS[level], pa.string()),
+            *((measure, pa.float64()) for measure in MEASURES),
+        ],
+    )
+
+
+def _path(folder: Path, level: str) -> Path:
+    return folder / f"{level}.parquet"
+
+
+def _day_signatures(intermediate_folder: Path) -> dict[str, str]:
+    # A day is recomputed when summarize_csvs rewrites its file
+    signatures = {}
+    for path in sorted(intermediate_folder.glob("*.csv")):
+        stat = path.stat()
+        signatures[path.stem] = f"{stat.st_size}:{stat.st_mtime_ns}"
+    return signatures
+
+
+def _stored_state(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    metadata = pq.read_schema(path).metadata or {}
+    return json.loads(metadata.get(METADATA_KEY, b"{}"))
+
+
+def _first_stale(days: list[str], sources: dict[str, str], stored: dict) -> int:
+    """Index in `days` of the first day whose stored rows are missing or outdated."""
+    stored_sources = stored.get("sources", {})
+    if set(stored_sources) - set(sources):
+        return 0
+    for i, day in enumerate(days):
+        if stored_sources.get(day) != sources[day]:
+            return i
+    return len(days)
+
+
+def _read_days(intermediate_folder: Path, days: Sequence[str]) -> pd.DataFrame:
+    """Turnover per day and ISIN, summed over the venues."""
+    frames = [
+        pd.read_csv(
+            intermediate_folder / f"{day}.csv",
+            encoding="utf-8-sig",
+            usecols=["MifidInstrumentID", "MifidNotionalAmount"],
+        ).assign(Day=pd.Timestamp(day))
+        for day in days
+    ]
+    if not frames:
+        return pd.DataFrame(columns=["Day", "ISIN", "Turnover"])
+    return (
+        pd.concat(frames, ignore_index=True)
+        .rename(columns={"MifidInstrumentID": "ISIN"})
+        .groupby(["Day", "ISIN"], as_index=False)["MifidNotionalAmount"]
+        .sum()
+        .rename(columns={"MifidNotionalAmount": "Turnover"})
+    )
+
+
+def _rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """Sum of the last `window` rows (fewer at the start), along the first axis."""
+    sums = np.cumsum(values, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    return sums
+
+
+def _diff(values: np.ndarray) -> np.ndarray:
+    diff = np.full(values.shape, np.nan)
+    diff[1:] = values[1:] - values[:-1]
+    return diff
+
+
+def _rolling(
+    daily: pd.DataFrame,
+    totals: pd.Series,
+    key: str,
+    first_day: pd.Timestamp,
+) -> pd.DataFrame:
+    """Rolling measures from `first_day` on, for the keys traded in the last window.
+
+    `daily` holds Day, `key` and Turnover; `totals` is the market turnover indexed by
+    every trading day, starting `max(WINDOWS)` days before `first_day` when possible.
+    """
+    # Rolling sums over whole cents, so they come out the same whichever day an
+    # update starts from
+    wide = (
+        daily.pivot_table(index="Day", columns=key, values="Turnover", aggfunc="sum")
+        .reindex(totals.index)
+        .fillna(0.0)
+        .mul(100)
+        .round()
+        .astype(np.int64)
+    )
+    total_cents = (totals.to_numpy() * 100).round().astype(np.int64)
+    total_sums = {w: _rolling_sum(total_cents, w) / 100 for w in WINDOWS}
+    output_days = totals.index >= first_day
+    frames = []
+    for start in range(0, wide.shape[1], COLUMN_BLOCK):
+        cents = wide.iloc[:, start : start + COLUMN_BLOCK].to_numpy()
+        turnover = cents / 100
+        share = turnover / (total_cents / 100)[:, None]
+        measures = {"Turnover": turnover, "Share": share}
+        for w in WINDOWS:
+            window_turnover = _rolling_sum(cents, w) / 100
+            measures[f"Turnover {w}d"] = window_turnover
+            measures[f"Share {w}d"] = window_turnover / total_sums[w][:, None]
+        measures["Turnover DoD"] = _diff(cents) / 100
+        measures["Share DoD"] = _diff(share)
+
+        # Keep the keys with some turnover in the longest window
+        active = measures[f"Turnover {max(WINDOWS)}d"][output_days] > 0
+        rows, cols = np.nonzero(active)
+        frames.append(
+            pd.DataFrame(
+                {
+                    "Day": totals.index[output_days][rows],
+                    key: wide.columns[start + cols],
+                    **{
+                        name: measures[name][output_days][rows, cols]
+                        for name in MEASURES
+                    },
+                },
+            ),
+        )
+    if not frames:
+        return pd.DataFrame(columns=["Day", key, *MEASURES])
+    return pd.concat(frames, ignore_index=True)
+
+
+def _write(
+    path: Path,
+    level: str,
+    old: pd.DataFrame,
+    new: pd.DataFrame,
+    state: dict,
+) -> None:
+    key = LEVELS[level]
+    df = (
+        pd.concat([old, new], ignore_index=True)
+        .sort_values([key, "Day"], kind="stable")
+        .reset_index(drop=True)
+    )
+    table = pa.Table.from_pandas(df, schema=schema(level), preserve_index=False)
+    table = table.replace_schema_metadata({METADATA_KEY: json.dumps(state)})
+    tmp_path = path.with_suffix(".tmp")
+    pq.write_table(table, tmp_path, compression="zstd")
+    tmp_path.replace(path)
+
+
+def load(
+    level: str,
+    folder: Path = TIMESERIES_FOLDER,
+    keys: Sequence[str] | None = None,
+    start: pd.Timestamp | None = None,
+    columns: Sequence[str] | None = None,
+) -> pd.DataFrame:
+    """Read the rows of `level`, optionally only for some keys or from a day on."""
+    path = _path(folder, level)
+    if not path.exists():
+        return schema(level).empty_table().to_pandas(date_as_object=False)
+    filters = []
+    if keys is not None:
+        filters.append((LEVELS[level], "in", list(keys)))
+    if start is not None:
+        filters.append(("Day", ">=", start.date()))
+    return pq.read_table(
+        path,
+        columns=list(columns) if columns is not None else None,
+        filters=filters or None,
+    ).to_pandas(date_as_object=False)
+
+
+def _mapping(level: str, tables_folder: Path) -> pd.DataFrame:
+    """ISIN -> key, with the weight of the ISIN turnover that goes to the key.
+
+    Same mappings as the dashboard: issuers through `Emittente`, underlyings matched
+    case-insensitively, a basket's turnover split evenly across its underlyings.
+    Unlike the dashboard, whose join counts the trades of an ISIN listed more than
+    once in isin_info.csv once per row, such an ISIN counts once, with its first
+    issuer: the issuer totals of Trends can be lower than those of Issuers.
+    Archived products keep their history, so their archive files are read too.
+    """
+
+    def read(name: str) -> pd.DataFrame:
+        paths = [tables_folder / name]
+        if name in archive.ARCHIVE_FILES:
+            paths.append(tables_folder / archive.ARCHIVE_FILES[name])
+        return pd.concat(
+            pd.read_csv(path, encoding="utf-8-sig", dtype=str)
+            for path in paths
+            if path.exists()
+        )
+
+    if level == "issuer":
+        isin_info = read("isin_info.csv").drop_duplicates("ISIN")
+        mapping = isin_info[["ISIN", "Emittente"]].merge(
+            read("issuers.csv"),
+            left_on="Emittente",
+            right_on="Original",
+        )[["ISIN", "Issuer"]]
+        mapping["Weight"] = 1.0
+    else:
+        underlyings = read("underlyings.csv").dropna(subset=["Sottostante"])
+        n_underlyings = underlyings.groupby("ISIN")["Sottostante"].transform("size")
+        und_mapping = read("und_mapping.csv")
+        und_mapping["lower"] = und_mapping["Original"].str.lower()
+        mapping = (
+            underlyings.assign(
+                lower=underlyings["Sottostante"].str.lower(),
+                Weight=1.0 / n_underlyings,
+            )
+            .drop(columns="Sottostante")
+            .merge(und_mapping, on="lower")[["ISIN", "Sottostante", "Weight"]]
+        )
+    return mapping.dropna().sort_values(list(mapping.columns)).reset_index(drop=True)
+
+
+def _mapping_hash(mapping: pd.DataFrame) -> str:
+    return str(pd.util.hash_pandas_object(mapping, index=False).sum())
+
+
+def update(
+    intermediate_folder: Path = INTERMEDIATE_FOLDER,
+    tables_folder: Path = BASE_FOLDER,
+    folder: Path = TIMESERIES_FOLDER,
+    *,
+    rebuild: bool = False,
+) -> None:
+    """Bring the time series up to date with intermediate_csv and the mappings.
+
+    Only the days from the first new or re-summarized one are recomputed, reading
+    `max(WINDOWS)` earlier days for context. The issuer and underlying levels are
+    rebuilt from the ISIN level when their mapping changes.
+    """
+    folder.mkdir(parents=True, exist_ok=True)
+    sources = _day_signatures(intermediate_folder)
+    days = list(sources)
+    if not days:
+        return
+    context = max(WINDOWS)
+
+    isin_path = _path(folder, "isin")
+    start = 0 if rebuild else _first_stale(days, sources, _stored_state(isin_path))
+    if start < len(days):
+        read_days = days[max(0, start - context) :]
+        daily = _read_days(intermediate_folder, read_days)
+        totals = (
+            daily.groupby("Day")["Turnover"]
+            .sum()
+            .reindex(
+                pd.to_datetime(read_days),
+                fill_value=0.0,
+            )
+        )
+        first_day = pd.Timestamp(days[start])
+        new = _rolling(daily, totals, "ISIN", first_day)
+        old = load("isin", folder)
+        _write(
+            isin_path,
+            "isin",
+            old.loc[old["Day"] < first_day],
+            new,
+            {"sources": sources},
+        )
+        logger.info(
+            "Time series by ISIN: recomputed %d days from %s (%d rows)",
+            len(days) - start,
+            days[start],
+            len(new),
+        )
+
+    for level in ("issuer", "underlying"):
+        path = _path(folder, level)
+        mapping = _mapping(level, tables_folder)
+        state = {"sources": sources, "mapping": _mapping_hash(mapping)}
+        stored = _stored_state(path)
+        level_start = (
+            0
+            if rebuild or stored.get("mapping") != state["mapping"]
+            else _first_stale(days, sources, stored)
+        )
+        if level_start == len(days):
+            continue
+        read_from = pd.Timestamp(days[max(0, level_start - context)])
+        isin_daily = load(
+            "isin",
+            folder,
+            start=read_from,
+            columns=["Day", "ISIN", "Turnover"],
+        )
+        isin_daily = isin_daily.loc[isin_daily["Turnover"] != 0]
+        totals = (
+            isin_daily.groupby("Day")["Turnover"]
+            .sum()
+            .reindex(
+                pd.to_datetime(days[max(0, level_start - context) :]),
+                fill_value=0.0,
+            )
+        )
+        daily = isin_daily.merge(mapping, on="ISIN")
+        daily["Turnover"] *= daily.pop("Weight")
+        first_day = pd.Timestamp(days[level_start])
+        new = _rolling(daily, totals, LEVELS[level], first_day)
+        old = load(level, folder)
+        _write(path, level, old.loc[old["Day"] < first_day], new, state)
+        logger.info(
+            "Time series by %s: recomputed %d days from %s (%d rows)",
+            level,
+            len(days) - level_start,
+            days[level_start],
+            len(new),
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Update the rolling turnover time series.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="recompute every day instead of the new ones only",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    update(rebuild=args.rebuild)
@@ -0,0 +1,156 @@
+import contextlib
+import json
+import logging
+import multiprocessing as mp
+import os
+import queue
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+BASE_FOLDER = Path(__file__).parent
+STATUS_PATH = BASE_FOLDER / "update_status.json"
+LOG_PATH = BASE_FOLDER / "update_worker.log"
+PROGRESS_MIN_INTERVAL_SEC = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+def read_status(status_path: Path = STATUS_PATH) -> dict[str, Any]:
+    """Return the last status published by the worker, or an idle status."""
+    try:
+        return json.loads(status_path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"state": "idle"}
+
+
+def _write_status(status_path: Path, status: dict[str, Any]) -> None:
+    # Write to a temporary file and swap it in, so readers never see half a file
+    tmp_path = status_path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(status, default=str), encoding="utf-8")
+    os.replace(tmp_path, status_path)
+
+
+class ProgressPublisher:
+    """`main.ProgressCallback` that publishes stage progress to the status file.
+
+    Updates within the same stage are throttled to one write every
+    `PROGRESS_MIN_INTERVAL_SEC`; a stage change is always written.
+    """
+
+    def __init__(self, status_path: Path, run_id: str, reasons: list[str]) -> None:
+        self.status_path = status_path
+        self.last_write = 0.0
+        self.status: dict[str, Any] = {
+            "state": "running",
+            "run_id": run_id,
+            "reasons": reasons,
+            "stage": None,
+            "done": 0,
+            "total": 0,
+            "started_at": datetime.now(),
+            "finished_at": None,
+            "error": None,
+        }
+        self.publish()
+
+    def __call__(self, stage: str, done: int, total: int) -> None:
+        now = time.monotonic()
+        if (
+            stage == self.status["stage"]
+            and done < total
+            and now - self.last_write < PROGRESS_MIN_INTERVAL_SEC
+        ):
+            return
+        self.status.update(stage=stage, done=done, total=total)
+        self.publish()
+
+    def finish(self, error: str | None = None) -> None:
+        self.status.update(
+            state="failed" if error else "succeeded",
+            finished_at=datetime.now(),
+            error=error,
+        )
+        self.publish()
+
+    def publish(self) -> None:
+        self.status["updated_at"] = datetime.now()
+        _write_status(self.status_path, self.status)
+        self.last_write = time.monotonic()
+
+
+def _worker_loop(jobs: mp.Queue, pending: Any, status_path: Path) -> None:
+    import main
+
+    main.setup_logging(LOG_PATH)
+    logger.info("Update worker started (pid %d)", os.getpid())
+    while True:
+        reasons = [jobs.get()]
+        with pending.get_lock():
+            pending.value = 0
+        # Every trigger queued so far is served by the same run
+        with contextlib.suppress(queue.Empty):
+            while True:
+                reasons.append(jobs.get_nowait())
+        if None in reasons:
+            logger.info("Update worker stopping")
+            return
+
+        run_id = uuid.uuid4().hex
+        logger.info("Starting update %s, triggered by %s", run_id, reasons)
+        publisher = ProgressPublisher(status_path, run_id, reasons)
+        try:
+            main.update_all(progress=publisher)
+        except Exception as e:
+            logger.exception("Update %s failed", run_id)
+            publisher.finish(error=repr(e))
+        else:
+            logger.info("Update %s completed", run_id)
+            publisher.finish()
+
+
+class UpdateWorker:
+    """Owns the update process and its job queue.
+
+    `submit` never blocks: triggers that arrive while a run is queued or in progress
+    are coalesced into the next single run.
+    """
+
+    def __init__(self, status_path: Path = STATUS_PATH) -> None:
+        ctx = mp.get_context("spawn")
+        self.status_path = status_path
+        self._jobs = ctx.Queue()
+        self._pending = ctx.Value("i", 0)
+        self._process = ctx.Process(
+            target=_worker_loop,
+            args=(self._jobs, self._pending, status_path),
+            name="update-worker",
+            daemon=True,
+        )
+
+    def start(self) -> None:
+        self._process.start()
+        logger.info("Update worker process started (pid %d)", self._process.pid)
+
+    def submit(self, reason: str) -> bool:
+        """Queue an update. Return False if it was merged into an already queued run."""
+        with self._pending.get_lock():
+            if self._pending.value:
+                logger.info("Update requested (%s), already queued", reason)
+                return False
+            self._pending.value = 1
+        self._jobs.put(reason)
+        logger.info("Update requested (%s), queued", reason)
+        return True
+
+    def status(self) -> dict[str, Any]:
+        status = read_status(self.status_path)
+        status["pending"] = bool(self._pending.value)
+        status["alive"] = self._process.is_alive()
+        return status
+
+    def stop(self, timeout: float | None = None) -> None:
+        self._jobs.put(None)
+        self._process.join(timeout)